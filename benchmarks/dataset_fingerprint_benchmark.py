@@ -0,0 +1,72 @@
+"""
+Benchmark of the dataset data hash: `dataset_fingerprint` versus the previous
+`hashlib.sha256(df.to_string().encode())`.
+
+    python -m benchmarks.dataset_fingerprint_benchmark --copies 1 10 50
+"""
+import argparse
+import hashlib
+import time
+import tracemalloc
+
+import pandas as pd
+from rich.console import Console
+from rich.table import Table
+
+from email_discriminator.core.data_versioning import dataset_fingerprint
+
+
+def to_string_hash(df: pd.DataFrame) -> str:
+    return hashlib.sha256(df.to_string().encode()).hexdigest()[:10]
+
+
+def measure(function, df: pd.DataFrame, repeat: int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function(df)
+    elapsed = (time.perf_counter() - start) / repeat
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1e6
+
+
+def main(args):
+    df = pd.read_csv(args.data_path)
+    table = Table(title="Data hash")
+    table.add_column("Rows", justify="right")
+    for name in ["to_string", "fingerprint"]:
+        table.add_column(f"{name} (s)", justify="right")
+        table.add_column(f"{name} peak (MB)", justify="right")
+    table.add_column("Speedup", justify="right")
+
+    for copies in args.copies:
+        data = pd.concat([df] * copies, ignore_index=True)
+        to_string_time, to_string_peak = measure(to_string_hash, data, args.repeat)
+        fingerprint_time, fingerprint_peak = measure(
+            dataset_fingerprint, data, args.repeat
+        )
+        table.add_row(
+            str(len(data)),
+            f"{to_string_time:.4f}",
+            f"{to_string_peak:.1f}",
+            f"{fingerprint_time:.4f}",
+            f"{fingerprint_peak:.1f}",
+            f"{to_string_time / fingerprint_time:.1f}x",
+        )
+
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--data-path", default="data/tldr_articles.csv")
+    parser.add_argument(
+        "--copies",
+        type=int,
+        nargs="+",
+        default=[1, 10],
+        help="Times the dataset is replicated.",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,80 @@
+"""
+Offline benchmark of the DataProcessor output dtype.
+
+Runs the training grid search of the train flow on the TLDR articles CSV with the
+features as float64 (the previous output) and as float32 CSR, and reports the size
+of the feature matrix, the peak memory traced during the grid search and its time.
+
+    python -m benchmarks.feature_dtype_benchmark --copies 2
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from imblearn.over_sampling import RandomOverSampler
+from imblearn.pipeline import Pipeline as imblearnPipeline
+from rich.console import Console
+from rich.table import Table
+from sklearn.metrics import make_scorer, recall_score
+from sklearn.model_selection import GridSearchCV
+
+from email_discriminator.core.model import DataProcessor, Model
+from email_discriminator.core.profiling import track_peak_memory
+
+
+def matrix_mb(X) -> float:
+    return (X.data.nbytes + X.indices.nbytes + X.indptr.nbytes) / 2**20
+
+
+def run(dtype, X, y, n_estimators):
+    features = DataProcessor(dtype=dtype).fit_transform(X)
+    grid_search = GridSearchCV(
+        imblearnPipeline(
+            [
+                ("features", DataProcessor(dtype=dtype)),
+                ("model", Model(sampler=RandomOverSampler(random_state=42))),
+            ]
+        ),
+        {"model__n_estimators": n_estimators},
+        cv=3,
+        scoring=make_scorer(recall_score),
+    )
+    start = time.perf_counter()
+    with track_peak_memory() as memory_usage:
+        grid_search.fit(X, y)
+    return {
+        "features dtype": str(features.dtype),
+        "features (MB)": f"{matrix_mb(features):.2f}",
+        "grid search peak (MB)": f"{memory_usage.peak_mb:.1f}",
+        "grid search (s)": f"{time.perf_counter() - start:.1f}",
+    }
+
+
+def main(args):
+    df = pd.concat([pd.read_csv(args.data_path)] * args.copies, ignore_index=True)
+    X = df.drop(columns=["is_relevant"])
+    y = df["is_relevant"]
+
+    results = {
+        "float64": run(np.float64, X, y, args.n_estimators),
+        "float32": run(np.float32, X, y, args.n_estimators),
+    }
+
+    table = Table(title=f"{len(df)} rows")
+    table.add_column("DataProcessor dtype")
+    for column in results["float32"]:
+        table.add_column(column, justify="right")
+    for name, result in results.items():
+        table.add_row(name, *result.values())
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--data-path", default="data/tldr_articles.csv")
+    parser.add_argument(
+        "--copies", type=int, default=1, help="Times the dataset is replicated."
+    )
+    parser.add_argument("--n-estimators", type=int, nargs="+", default=[100])
+    main(parser.parse_args())
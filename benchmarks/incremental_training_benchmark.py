@@ -0,0 +1,95 @@
+"""
+Offline benchmark of warm starting the training pipeline on new reviewed rows.
+
+Fits the pipeline on the shuffled TLDR articles CSV minus the last batches, then
+adds the batches one at a time, either boosting a few trees on each new batch
+on top of the previous model or refitting on all the rows seen so far, and
+compares the fit times and the test scores.
+
+    python -m benchmarks.incremental_training_benchmark --batches 4 --batch-size 100
+"""
+import argparse
+import time
+
+import pandas as pd
+from imblearn.over_sampling import RandomOverSampler
+from imblearn.pipeline import Pipeline
+from rich.console import Console
+from rich.table import Table
+from sklearn.metrics import accuracy_score, recall_score
+from sklearn.model_selection import train_test_split
+
+from email_discriminator.core.model import DataProcessor, Model, warm_start_pipeline
+
+
+def make_pipeline(early_stopping_rounds: int) -> Pipeline:
+    pipeline = Pipeline(
+        [
+            ("features", DataProcessor()),
+            (
+                "model",
+                Model(
+                    early_stopping_rounds=early_stopping_rounds,
+                    sampler=RandomOverSampler(random_state=42),
+                ),
+            ),
+        ]
+    )
+    return pipeline.set_params(model__n_estimators=300)
+
+
+def main(args):
+    df = pd.read_csv(args.data_path).sample(frac=1, random_state=42)
+    X = df[["article", "section"]]
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, df["is_relevant"], test_size=0.2, random_state=42
+    )
+    n_base = len(X_train) - args.batches * args.batch_size
+    pipeline = make_pipeline(args.early_stopping_rounds)
+    pipeline.fit(X_train[:n_base], y_train[:n_base])
+
+    table = Table(
+        title=f"{n_base} initial articles, {args.batches} batches of "
+        f"{args.batch_size}, {len(X_test)} test articles"
+    )
+    for column in ["rows", "training", "fit (s)", "accuracy", "recall"]:
+        table.add_column(column, justify="right")
+    warm = pipeline
+    for batch in range(1, args.batches + 1):
+        end = n_base + batch * args.batch_size
+        start = end - args.batch_size
+        started = time.perf_counter()
+        warm = warm_start_pipeline(
+            warm, X_train[start:end], y_train[start:end], args.n_estimators
+        )
+        warm_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        full = make_pipeline(args.early_stopping_rounds)
+        full.fit(X_train[:end], y_train[:end])
+        full_seconds = time.perf_counter() - started
+
+        for training, fitted, seconds in [
+            ("warm start", warm, warm_seconds),
+            ("full", full, full_seconds),
+        ]:
+            y_pred = fitted.predict(X_test)
+            table.add_row(
+                str(end),
+                training,
+                f"{seconds:.2f}",
+                f"{accuracy_score(y_test, y_pred):.3f}",
+                f"{recall_score(y_test, y_pred):.3f}",
+            )
+
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--data-path", default="data/tldr_articles.csv")
+    parser.add_argument("--batches", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--n-estimators", type=int, default=20)
+    parser.add_argument("--early-stopping-rounds", type=int, default=20)
+    main(parser.parse_args())
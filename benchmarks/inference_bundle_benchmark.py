@@ -0,0 +1,103 @@
+"""
+Offline benchmark of loading the inference bundle against the MLflow pyfunc model.
+
+Fits the training pipeline on the TLDR articles CSV, saves it as an MLflow sklearn
+model and as an inference bundle, and compares their load time, the peak memory
+of loading them, their size on disk and the latency of scoring the test articles.
+
+    python -m benchmarks.inference_bundle_benchmark --repeat 5
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import mlflow
+import numpy as np
+import pandas as pd
+from imblearn.over_sampling import RandomOverSampler
+from imblearn.pipeline import Pipeline
+from rich.console import Console
+from rich.table import Table
+from sklearn.model_selection import train_test_split
+
+from email_discriminator.core.model import DataProcessor, InferenceBundle, Model
+from email_discriminator.core.profiling import track_peak_memory
+
+
+def directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def main(args):
+    df = pd.read_csv(args.data_path)
+    X_train, X_test, y_train, _ = train_test_split(
+        df[["article", "section"]], df["is_relevant"], test_size=0.2, random_state=42
+    )
+    pipeline = Pipeline(
+        [
+            ("features", DataProcessor()),
+            (
+                "model",
+                Model(
+                    early_stopping_rounds=20,
+                    sampler=RandomOverSampler(random_state=42),
+                ),
+            ),
+        ]
+    )
+    pipeline.set_params(model__n_estimators=300).fit(X_train, y_train)
+    expected = pipeline.predict(X_test)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pyfunc_path = os.path.join(tmp_dir, "model")
+        bundle_path = os.path.join(tmp_dir, "inference_bundle")
+        mlflow.sklearn.save_model(pipeline, pyfunc_path)
+        InferenceBundle.from_pipeline(pipeline).save(bundle_path)
+        loaders = {
+            "pyfunc": (pyfunc_path, mlflow.pyfunc.load_model),
+            "bundle": (bundle_path, InferenceBundle.load),
+        }
+
+        table = Table(title=f"{len(X_test)} test articles, best of {args.repeat}")
+        for column in [
+            "model",
+            "size (MB)",
+            "load (ms)",
+            "load peak (MB)",
+            "predict (ms)",
+            "identical",
+        ]:
+            table.add_column(column, justify="right")
+        for name, (path, load) in loaders.items():
+            load_times, predict_times = [], []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                model = load(path)
+                load_times.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                predictions = model.predict(X_test)
+                predict_times.append(time.perf_counter() - start)
+            with track_peak_memory(name) as memory_usage:
+                load(path)
+            table.add_row(
+                name,
+                f"{directory_size(path) / 2**20:.2f}",
+                f"{min(load_times) * 1000:.1f}",
+                f"{memory_usage.peak_mb:.1f}",
+                f"{min(predict_times) * 1000:.1f}",
+                "yes" if np.array_equal(predictions, expected) else "NO",
+            )
+
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--data-path", default="data/tldr_articles.csv")
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
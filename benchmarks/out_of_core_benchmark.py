@@ -0,0 +1,121 @@
+"""
+Offline benchmark of out-of-core training against in-memory training.
+
+Writes the TLDR articles CSV repeated `--copies` times, then trains the hashing
+pipeline on it either in memory, loading the whole CSV and oversampling it, or
+out of core, streaming it in chunks into XGBoost external memory. Each run is a
+separate process, so their peak resident set sizes can be compared.
+
+    python -m benchmarks.out_of_core_benchmark --copies 1 4 --chunk-size 1000
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import pandas as pd
+from imblearn.over_sampling import RandomOverSampler
+from imblearn.pipeline import Pipeline
+from rich.console import Console
+from rich.table import Table
+from sklearn.metrics import accuracy_score, recall_score
+
+from email_discriminator.core.model import DataProcessor, Model, fit_out_of_core
+from email_discriminator.core.model.out_of_core import in_test_split, predict_chunks
+from email_discriminator.core.profiling import track_peak_memory
+
+COLUMNS = ["article", "section", "is_relevant"]
+
+
+def read_split(path: str, test: bool, chunk_size: int):
+    for chunk in pd.read_csv(path, usecols=COLUMNS, chunksize=chunk_size):
+        chunk = chunk[in_test_split(chunk) == test]
+        if len(chunk):
+            yield chunk
+
+
+def train_in_memory(path: str, n_estimators: int, chunk_size: int):
+    with track_peak_memory("in-memory training") as usage:
+        df = pd.read_csv(path, usecols=COLUMNS)
+        train = df[~in_test_split(df)]
+        pipeline = Pipeline(
+            [
+                ("features", DataProcessor(vectorizer="hashing")),
+                (
+                    "model",
+                    Model(
+                        tree_method="hist", sampler=RandomOverSampler(random_state=42)
+                    ),
+                ),
+            ]
+        ).set_params(model__n_estimators=n_estimators)
+        pipeline.fit(train[["article", "section"]], train["is_relevant"])
+        del df, train
+    return pipeline, usage
+
+
+def train_out_of_core(path: str, n_estimators: int, chunk_size: int):
+    model = Model()
+    model.set_params(n_estimators=n_estimators)
+    with track_peak_memory("out-of-core training") as usage:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            pipeline, _ = fit_out_of_core(
+                DataProcessor(vectorizer="hashing"),
+                model,
+                lambda: read_split(path, False, chunk_size),
+                cache_dir,
+            )
+    return pipeline, usage
+
+
+def run(mode: str, path: str, n_estimators: int, chunk_size: int):
+    train = train_in_memory if mode == "in memory" else train_out_of_core
+    start = time.perf_counter()
+    pipeline, usage = train(path, n_estimators, chunk_size)
+    elapsed = time.perf_counter() - start
+    y, y_pred = predict_chunks(pipeline, read_split(path, True, chunk_size))
+    return (
+        elapsed,
+        usage.peak_rss_mb,
+        accuracy_score(y, y_pred),
+        recall_score(y, y_pred),
+    )
+
+
+def main(args):
+    df = pd.read_csv(args.data_path, usecols=COLUMNS)
+    table = Table(title=f"{len(df)} articles per copy, chunks of {args.chunk_size}")
+    for column in ["copies", "training", "fit (s)", "peak RSS (MB)", "accuracy"]:
+        table.add_column(column, justify="right")
+    table.add_column("recall", justify="right")
+    # A fresh process per run, so the peak RSS of a run doesn't include another's
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as data_dir:
+        for copies in args.copies:
+            path = os.path.join(data_dir, f"articles_{copies}.csv")
+            pd.concat([df] * copies).to_csv(path, index=False)
+            for mode in ["in memory", "out of core"]:
+                with context.Pool(1) as pool:
+                    elapsed, peak_rss_mb, accuracy, recall = pool.apply(
+                        run, (mode, path, args.n_estimators, args.chunk_size)
+                    )
+                table.add_row(
+                    str(copies),
+                    mode,
+                    f"{elapsed:.1f}",
+                    "n/a" if peak_rss_mb is None else f"{peak_rss_mb:.0f}",
+                    f"{accuracy:.3f}",
+                    f"{recall:.3f}",
+                )
+
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--data-path", default="data/tldr_articles.csv")
+    parser.add_argument("--copies", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--n-estimators", type=int, default=100)
+    main(parser.parse_args())
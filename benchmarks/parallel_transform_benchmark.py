@@ -0,0 +1,78 @@
+"""
+Offline scaling benchmark of the DataProcessor parallel transform.
+
+Fits a DataProcessor on the TLDR articles CSV, replicates the articles into a large
+backlog and times the transform with an increasing number of worker processes,
+checking that every output matches the serial one. Worker counts above the CPUs
+of the host are flagged, as they only measure the overhead of the processes, so
+run it on a multi-core host before enabling `n_jobs`.
+
+    python -m benchmarks.parallel_transform_benchmark --copies 50 --n-jobs 1 2 4 8
+"""
+import argparse
+import os
+import time
+
+import pandas as pd
+from rich.console import Console
+from rich.table import Table
+
+from email_discriminator.core.model import DataProcessor
+
+
+def main(args):
+    df = pd.read_csv(args.data_path)
+    backlog = pd.concat([df] * args.copies, ignore_index=True)
+
+    serial = DataProcessor(vectorizer=args.vectorizer).fit(df)
+    start = time.perf_counter()
+    expected = serial.transform(backlog)
+    serial_time = time.perf_counter() - start
+
+    table = Table(
+        title=f"{len(backlog)} rows, {args.chunk_size} rows per chunk, "
+        f"{os.cpu_count()} CPUs"
+    )
+    for column in ["n_jobs", "time (s)", "rows/s", "speedup", "identical", "note"]:
+        table.add_column(column, justify="right")
+    table.add_row(
+        "serial",
+        f"{serial_time:.2f}",
+        f"{len(backlog) / serial_time:.0f}",
+        "1.00",
+        "yes",
+        "",
+    )
+
+    for n_jobs in args.n_jobs:
+        parallel = DataProcessor(
+            vectorizer=args.vectorizer, n_jobs=n_jobs, chunk_size=args.chunk_size
+        ).fit(df)
+        # Warm up the worker processes so only the transform is timed.
+        parallel.transform(backlog.iloc[: args.chunk_size + 1])
+        start = time.perf_counter()
+        transformed = parallel.transform(backlog)
+        elapsed = time.perf_counter() - start
+        identical = (transformed != expected).nnz == 0
+        table.add_row(
+            str(n_jobs),
+            f"{elapsed:.2f}",
+            f"{len(backlog) / elapsed:.0f}",
+            f"{serial_time / elapsed:.2f}",
+            "yes" if identical else "NO",
+            "more jobs than CPUs" if n_jobs > (os.cpu_count() or 1) else "",
+        )
+
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--data-path", default="data/tldr_articles.csv")
+    parser.add_argument(
+        "--copies", type=int, default=20, help="Times the dataset is replicated."
+    )
+    parser.add_argument("--vectorizer", choices=["tfidf", "hashing"], default="tfidf")
+    parser.add_argument("--chunk-size", type=int, default=5_000)
+    parser.add_argument("--n-jobs", type=int, nargs="+", default=[1, 2, 4])
+    main(parser.parse_args())
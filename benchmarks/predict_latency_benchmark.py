@@ -0,0 +1,83 @@
+"""
+Offline latency benchmark of Model.predict on small batches.
+
+Fits the training pipeline on the TLDR articles CSV, transforms the articles once
+and times scoring batches of features of increasing size through
+`predict_proba` and a threshold, as `Model.predict` used to, against the in place
+booster path, with and without a reused output buffer.
+
+    python -m benchmarks.predict_latency_benchmark --batch-sizes 1 8 64 512
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from imblearn.over_sampling import RandomOverSampler
+from imblearn.pipeline import Pipeline
+from rich.console import Console
+from rich.table import Table
+
+from email_discriminator.core.model import DataProcessor, Model
+
+
+def median_time_us(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1e6
+
+
+def main(args):
+    df = pd.read_csv(args.data_path)
+    X, y = df[["article", "section"]], df["is_relevant"]
+    pipeline = Pipeline(
+        [
+            ("features", DataProcessor()),
+            ("model", Model(sampler=RandomOverSampler(random_state=42))),
+        ]
+    ).fit(X, y)
+    model = pipeline.named_steps["model"]
+    features = pipeline.named_steps["features"].transform(X)
+
+    table = Table(title=f"Median latency per batch over {args.repeat} calls")
+    for column in [
+        "batch size",
+        "predict_proba (us)",
+        "inplace (us)",
+        "inplace + out (us)",
+        "speedup",
+    ]:
+        table.add_column(column, justify="right")
+    for batch_size in args.batch_sizes:
+        batch = features[:batch_size]
+        out = np.empty(batch.shape[0], dtype=int)
+        expected = (model.predict_proba(batch)[:, 1] >= model.threshold).astype(int)
+        assert np.array_equal(model.predict(batch), expected)
+        proba_time = median_time_us(
+            lambda: (model.predict_proba(batch)[:, 1] >= model.threshold).astype(int),
+            args.repeat,
+        )
+        inplace_time = median_time_us(lambda: model.predict(batch), args.repeat)
+        out_time = median_time_us(lambda: model.predict(batch, out=out), args.repeat)
+        table.add_row(
+            str(batch_size),
+            f"{proba_time:.0f}",
+            f"{inplace_time:.0f}",
+            f"{out_time:.0f}",
+            f"{proba_time / out_time:.2f}",
+        )
+
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--data-path", default="data/tldr_articles.csv")
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[1, 8, 64, 512, 2048]
+    )
+    parser.add_argument("--repeat", type=int, default=200)
+    main(parser.parse_args())
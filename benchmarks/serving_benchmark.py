@@ -0,0 +1,136 @@
+"""
+Offline load benchmark of the scoring service with and without micro batching.
+
+Fits the training pipeline on the TLDR articles CSV and saves its inference
+bundle, then, for each batching setting, serves the bundle from a separate
+process and sends it concurrent single-article requests with the built-in load
+generator. A maximum batch size of 1 scores every request on its own.
+
+    python -m benchmarks.serving_benchmark --max-batch-sizes 1 64 --concurrency 32
+"""
+import argparse
+import json
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import pandas as pd
+from imblearn.over_sampling import RandomOverSampler
+from imblearn.pipeline import Pipeline
+from rich.console import Console
+from rich.table import Table
+
+from email_discriminator.core.model import DataProcessor, InferenceBundle, Model
+from email_discriminator.core.model.data_processor import FEATURE_COLUMNS
+from email_discriminator.core.serving import generate_load
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def health(url: str) -> dict:
+    with urllib.request.urlopen(f"{url}/health") as response:
+        return json.load(response)
+
+
+def wait_until_ready(url: str, timeout: float = 120) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            health(url)
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise TimeoutError(f"The scoring service at {url} didn't start")
+
+
+def main(args):
+    df = pd.read_csv(args.data_path)
+    X, y = df[FEATURE_COLUMNS], df["is_relevant"]
+    pipeline = Pipeline(
+        [
+            ("features", DataProcessor()),
+            ("model", Model(sampler=RandomOverSampler(random_state=42))),
+        ]
+    ).fit(X, y)
+    articles = X.fillna("").to_dict("records")
+
+    table = Table(
+        title=f"{args.requests} single-article requests from "
+        f"{args.concurrency} concurrent clients"
+    )
+    for column in [
+        "max batch size",
+        "latency budget (ms)",
+        "requests/s",
+        "p50 (ms)",
+        "p99 (ms)",
+        "mean batch size",
+    ]:
+        table.add_column(column, justify="right")
+    with tempfile.TemporaryDirectory() as bundle_path:
+        InferenceBundle.from_pipeline(pipeline).save(bundle_path)
+        for max_batch_size in args.max_batch_sizes:
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            server = subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "email_discriminator.core.serving",
+                    "serve",
+                    "--bundle-path",
+                    bundle_path,
+                    "--port",
+                    str(port),
+                    "--max-batch-size",
+                    str(max_batch_size),
+                    "--max-latency-ms",
+                    str(args.max_latency_ms),
+                ],
+                stdout=subprocess.DEVNULL,
+            )
+            try:
+                wait_until_ready(url)
+                # Warm up the connections and the model
+                generate_load(url, articles, n_requests=100, concurrency=4)
+                before = health(url)
+                report = generate_load(
+                    url,
+                    articles,
+                    n_requests=args.requests,
+                    concurrency=args.concurrency,
+                )
+                after = health(url)
+            finally:
+                server.terminate()
+                server.wait()
+            assert report.errors == 0, f"{report.errors} requests failed"
+            batches = after["batches"] - before["batches"]
+            table.add_row(
+                str(max_batch_size),
+                f"{args.max_latency_ms:g}",
+                f"{report.throughput:.0f}",
+                f"{report.p50_ms:.1f}",
+                f"{report.p99_ms:.1f}",
+                f"{(after['rows'] - before['rows']) / batches:.1f}",
+            )
+
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--data-path", default="data/tldr_articles.csv")
+    parser.add_argument("--max-batch-sizes", type=int, nargs="+", default=[1, 64, 256])
+    parser.add_argument("--max-latency-ms", type=float, default=5.0)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    main(parser.parse_args())
@@ -0,0 +1,99 @@
+"""
+Offline throughput benchmark of the versioned data path.
+
+Splits the TLDR articles CSV into shards and, for each storage backend, times the
+operations the flows perform: uploading training shards (with manifest updates),
+downloading them all as text and streaming them as DataFrame chunks.
+
+    python -m benchmarks.storage_backends_benchmark --shards 20 --copies 10
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from rich.console import Console
+from rich.table import Table
+
+from email_discriminator.core.data_versioning import (
+    GCSVersionedDataHandler,
+    InMemoryStorageBackend,
+)
+
+
+def make_shards(data_path: str, n_shards: int, copies: int):
+    df = pd.concat([pd.read_csv(data_path)] * copies, ignore_index=True)
+    return [shard.to_csv(index=False) for shard in np.array_split(df, n_shards)]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def run(handler: GCSVersionedDataHandler, shards):
+    def upload():
+        for i, csv_string in enumerate(shards):
+            handler.upload_training_data(csv_string, f"shard{i:04d}")
+
+    def download():
+        return handler.download_all_training_data()
+
+    def stream():
+        return sum(
+            len(chunk) for _, chunk in handler.download_all_training_data_chunks()
+        )
+
+    _, upload_time = timed(upload)
+    _, download_time = timed(download)
+    rows, stream_time = timed(stream)
+    return rows, {
+        "upload": upload_time,
+        "download": download_time,
+        "stream": stream_time,
+    }
+
+
+def main(args):
+    shards = make_shards(args.data_path, args.shards, args.copies)
+    total_mb = sum(len(csv_string.encode()) for csv_string in shards) / 1e6
+
+    table = Table(title=f"{args.shards} shards, {total_mb:.1f} MB")
+    table.add_column("Backend")
+    for operation in ["upload", "download", "stream"]:
+        table.add_column(f"{operation} (s)", justify="right")
+        table.add_column(f"{operation} (MB/s)", justify="right")
+    table.add_column("rows/s streamed", justify="right")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        uris = {"local": f"file://{tmp_dir}/bucket", "memory": "memory://benchmark"}
+        for name in args.backends:
+            rows, timings = run(GCSVersionedDataHandler(uris[name]), shards)
+            cells = []
+            for operation in ["upload", "download", "stream"]:
+                cells += [
+                    f"{timings[operation]:.3f}",
+                    f"{total_mb / timings[operation]:.1f}",
+                ]
+            table.add_row(name, *cells, f"{rows / timings['stream']:.0f}")
+    InMemoryStorageBackend.clear()
+
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--data-path", default="data/tldr_articles.csv")
+    parser.add_argument("--shards", type=int, default=20)
+    parser.add_argument(
+        "--copies", type=int, default=5, help="Times the dataset is replicated."
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=["local", "memory"],
+        default=["local", "memory"],
+    )
+    main(parser.parse_args())
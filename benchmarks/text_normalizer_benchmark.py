@@ -0,0 +1,77 @@
+"""
+Offline benchmark of the TextNormalizer stage of the DataProcessor.
+
+Fits the features and the model on a split of the TLDR articles CSV with and
+without normalization, and reports the TF-IDF vocabulary size, the fit times of the
+normalizer and of the processor, and the test accuracy.
+
+    python -m benchmarks.text_normalizer_benchmark --copies 5
+"""
+import argparse
+import time
+
+import pandas as pd
+from rich.console import Console
+from rich.table import Table
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+
+from email_discriminator.core.model import DataProcessor, Model, TextNormalizer
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(args):
+    df = pd.concat([pd.read_csv(args.data_path)] * args.copies, ignore_index=True)
+    X_train, X_test, y_train, y_test = train_test_split(
+        df.drop(columns=["is_relevant"]),
+        df["is_relevant"],
+        test_size=0.2,
+        random_state=42,
+        stratify=df["is_relevant"],
+    )
+    _, normalize_time = timed(TextNormalizer().transform, X_train)
+
+    table = Table(
+        title=f"{len(X_train)} training rows, normalization takes "
+        f"{normalize_time:.3f} s"
+    )
+    for column in [
+        "normalize",
+        "vocabulary",
+        "features",
+        "processor fit (s)",
+        "model fit (s)",
+        "accuracy",
+    ]:
+        table.add_column(column, justify="right")
+
+    for normalize in [False, True]:
+        data_processor = DataProcessor(normalize=normalize)
+        features, fit_time = timed(data_processor.fit_transform, X_train)
+        model = Model()
+        _, model_fit_time = timed(model.fit, features, y_train)
+        y_pred = model.predict(data_processor.transform(X_test))
+        table.add_row(
+            str(normalize),
+            str(len(data_processor.text.named_steps["tfidf"].vocabulary_)),
+            str(features.shape[1]),
+            f"{fit_time:.3f}",
+            f"{model_fit_time:.2f}",
+            f"{accuracy_score(y_test, y_pred):.3f}",
+        )
+
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--data-path", default="data/tldr_articles.csv")
+    parser.add_argument(
+        "--copies", type=int, default=1, help="Times the dataset is replicated."
+    )
+    main(parser.parse_args())
@@ -0,0 +1,93 @@
+"""
+Offline benchmark of the DataProcessor vectorizers.
+
+Fits the features and the model of the training pipeline on a split of the TLDR
+articles CSV with each vectorizer, and reports the test accuracy, the fit times and
+the pickled size of the fitted processor and of the whole pipeline.
+
+    python -m benchmarks.vectorizers_benchmark --copies 5 --n-features 16 18
+"""
+import argparse
+import pickle
+import time
+
+import pandas as pd
+from rich.console import Console
+from rich.table import Table
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+
+from email_discriminator.core.model import DataProcessor, Model
+
+
+def load_data(data_path: str, copies: int):
+    df = pd.read_csv(data_path)
+    # Replicated articles get a distinct suffix so the vocabulary keeps growing.
+    df = pd.concat(
+        [df.assign(article=df["article"] + f" copy{i}") for i in range(copies)],
+        ignore_index=True,
+    )
+    X = df.drop(columns=["is_relevant"])
+    y = df["is_relevant"]
+    return train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+
+
+def run(data_processor: DataProcessor, X_train, X_test, y_train, y_test):
+    start = time.perf_counter()
+    features = data_processor.fit_transform(X_train)
+    processor_fit_time = time.perf_counter() - start
+
+    model = Model()
+    start = time.perf_counter()
+    model.fit(features, y_train)
+    model_fit_time = time.perf_counter() - start
+
+    accuracy = accuracy_score(y_test, model.predict(data_processor.transform(X_test)))
+    return {
+        "accuracy": accuracy,
+        "processor fit (s)": processor_fit_time,
+        "model fit (s)": model_fit_time,
+        "processor (KB)": len(pickle.dumps(data_processor)) / 1e3,
+        "pipeline (KB)": len(pickle.dumps((data_processor, model))) / 1e3,
+    }
+
+
+def main(args):
+    X_train, X_test, y_train, y_test = load_data(args.data_path, args.copies)
+
+    configurations = {"tfidf": DataProcessor()}
+    for exponent in args.n_features:
+        for use_idf in [True, False]:
+            name = f"hashing 2^{exponent}" + (" + idf" if use_idf else "")
+            configurations[name] = DataProcessor(
+                vectorizer="hashing", n_features=2**exponent, use_idf=use_idf
+            )
+
+    table = Table(title=f"{len(X_train)} training rows, {len(X_test)} test rows")
+    table.add_column("Vectorizer")
+    results = {
+        name: run(data_processor, X_train, X_test, y_train, y_test)
+        for name, data_processor in configurations.items()
+    }
+    for column in next(iter(results.values())):
+        table.add_column(column, justify="right")
+    for name, result in results.items():
+        table.add_row(name, *(f"{value:.3f}" for value in result.values()))
+
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--data-path", default="data/tldr_articles.csv")
+    parser.add_argument(
+        "--copies", type=int, default=1, help="Times the dataset is replicated."
+    )
+    parser.add_argument(
+        "--n-features",
+        type=int,
+        nargs="+",
+        default=[16, 18],
+        help="Exponents of the hashing vectorizer sizes.",
+    )
+    main(parser.parse_args())
@@ -0,0 +1,80 @@
+"""
+Offline benchmark of the vocabulary budget and pruning of the training pipeline.
+
+Fits the training pipeline on the TLDR articles CSV with the full vocabulary, with
+document frequency and size budgets, and refitted on the vocabulary terms its
+model uses, and compares the size and load time of the pickled pipelines with
+their test scores.
+
+    python -m benchmarks.vocabulary_pruning_benchmark --min-df 2 --max-features 2000
+"""
+import argparse
+
+import pandas as pd
+from imblearn.over_sampling import RandomOverSampler
+from imblearn.pipeline import Pipeline
+from rich.console import Console
+from rich.table import Table
+from sklearn.base import clone
+from sklearn.metrics import accuracy_score, recall_score
+from sklearn.model_selection import train_test_split
+
+from email_discriminator.core.model import DataProcessor, Model
+from email_discriminator.core.profiling import measure_artifact
+
+
+def make_pipeline(**params) -> Pipeline:
+    return Pipeline(
+        [
+            ("features", DataProcessor(**params)),
+            ("model", Model(sampler=RandomOverSampler(random_state=42))),
+        ]
+    )
+
+
+def main(args):
+    df = pd.read_csv(args.data_path)
+    X_train, X_test, y_train, y_test = train_test_split(
+        df[["article", "section"]], df["is_relevant"], test_size=0.2, random_state=42
+    )
+
+    full = make_pipeline().fit(X_train, y_train)
+    used_features = full.named_steps["model"].used_features()
+    terms = full.named_steps["features"].used_vocabulary(used_features)
+    pipelines = {
+        "full": full,
+        f"min_df={args.min_df}": make_pipeline(min_df=args.min_df),
+        f"max_features={args.max_features}": make_pipeline(
+            max_features=args.max_features
+        ),
+        "pruned": clone(full).set_params(features__vocabulary=terms),
+    }
+
+    table = Table(title=f"{len(X_train)} training and {len(X_test)} test articles")
+    for column in ["pipeline", "terms", "size (MB)", "load (ms)", "accuracy", "recall"]:
+        table.add_column(column, justify="right")
+    for name, pipeline in pipelines.items():
+        if pipeline is not full:
+            pipeline.fit(X_train, y_train)
+        stats = measure_artifact(pipeline, name, repeat=args.repeat)
+        y_pred = pipeline.predict(X_test)
+        tfidf = pipeline.named_steps["features"].text.named_steps["tfidf"]
+        table.add_row(
+            name,
+            str(len(tfidf.vocabulary_)),
+            f"{stats.size_mb:.2f}",
+            f"{stats.load_seconds * 1000:.1f}",
+            f"{accuracy_score(y_test, y_pred):.3f}",
+            f"{recall_score(y_test, y_pred):.3f}",
+        )
+
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--data-path", default="data/tldr_articles.csv")
+    parser.add_argument("--min-df", type=int, default=2)
+    parser.add_argument("--max-features", type=int, default=2_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,93 @@
+"""
+Offline benchmark of the XGBoost engine configuration of the training grid search.
+
+Runs the training grid search on the TLDR articles CSV with the exact and the
+histogram tree methods, with and without early stopping, and compares their fit
+times with the test scores of the best pipelines.
+
+    python -m benchmarks.xgboost_engine_benchmark --cv-n-jobs 1 --early-stopping-rounds 20
+"""
+import argparse
+import os
+import time
+
+import pandas as pd
+from imblearn.over_sampling import RandomOverSampler
+from imblearn.pipeline import Pipeline
+from rich.console import Console
+from rich.table import Table
+from sklearn.metrics import accuracy_score, make_scorer, recall_score
+from sklearn.model_selection import GridSearchCV, train_test_split
+
+from email_discriminator.core.model import DataProcessor, Model
+
+
+def make_grid_search(
+    tree_method: str, early_stopping_rounds, cv_n_jobs: int
+) -> GridSearchCV:
+    pipeline = Pipeline(
+        [
+            ("features", DataProcessor()),
+            (
+                "model",
+                Model(
+                    tree_method=tree_method,
+                    n_jobs=max(1, (os.cpu_count() or 1) // cv_n_jobs),
+                    early_stopping_rounds=early_stopping_rounds,
+                    sampler=RandomOverSampler(random_state=42),
+                ),
+            ),
+        ]
+    )
+    n_estimators = [300] if early_stopping_rounds else [100, 200, 300]
+    params = {
+        "model__n_estimators": n_estimators,
+        "model__learning_rate": [0.01, 0.1, 0.2],
+    }
+    return GridSearchCV(
+        pipeline,
+        params,
+        cv=3,
+        scoring=make_scorer(recall_score),
+        n_jobs=cv_n_jobs,
+    )
+
+
+def main(args):
+    df = pd.read_csv(args.data_path)
+    X_train, X_test, y_train, y_test = train_test_split(
+        df[["article", "section"]], df["is_relevant"], test_size=0.2, random_state=42
+    )
+
+    table = Table(
+        title=f"{len(X_train)} training articles, {args.cv_n_jobs} CV jobs, "
+        f"{os.cpu_count()} CPUs"
+    )
+    for column in ["tree method", "early stopping", "fit (s)", "accuracy", "recall"]:
+        table.add_column(column, justify="right")
+    for tree_method in ["exact", "hist"]:
+        for early_stopping_rounds in [None, args.early_stopping_rounds]:
+            grid_search = make_grid_search(
+                tree_method, early_stopping_rounds, args.cv_n_jobs
+            )
+            start = time.perf_counter()
+            grid_search.fit(X_train, y_train)
+            elapsed = time.perf_counter() - start
+            y_pred = grid_search.predict(X_test)
+            table.add_row(
+                tree_method,
+                str(early_stopping_rounds or "no"),
+                f"{elapsed:.1f}",
+                f"{accuracy_score(y_test, y_pred):.3f}",
+                f"{recall_score(y_test, y_pred):.3f}",
+            )
+
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--data-path", default="data/tldr_articles.csv")
+    parser.add_argument("--cv-n-jobs", type=int, default=1)
+    parser.add_argument("--early-stopping-rounds", type=int, default=20)
+    main(parser.parse_args())
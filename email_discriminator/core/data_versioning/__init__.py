@@ -1,3 +1,23 @@
+from email_discriminator.core.data_versioning.async_versioned_data_handler import (
+    AsyncVersionedDataHandler,
+)
+from email_discriminator.core.data_versioning.dataset_fingerprint import (
+    dataset_fingerprint,
+    hash_rows,
+)
+from email_discriminator.core.data_versioning.dataset_manifest import (
+    MANIFEST_PATH,
+    DatasetManifest,
+)
 from email_discriminator.core.data_versioning.gcs_versioned_data_handler import (
     GCSVersionedDataHandler,
 )
+from email_discriminator.core.data_versioning.storage_backend import (
+    GCSStorageBackend,
+    InMemoryStorageBackend,
+    LocalStorageBackend,
+    ObjectNotFoundError,
+    PreconditionFailedError,
+    StorageBackend,
+    storage_backend_from_uri,
+)
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import os
+import weakref
+from typing import Any, Callable, Dict, List, Optional, TypeVar, Union
+
+import pandas as pd
+from rich.logging import RichHandler
+
+from email_discriminator.core.data_versioning.gcs_versioned_data_handler import (
+    CSV_CHUNK_ROWS,
+    GCSVersionedDataHandler,
+)
+
+# Setting up logging
+LOGGER_LEVEL = os.getenv("LOGGER_LEVEL", "WARNING")
+logging.basicConfig(level=LOGGER_LEVEL, format="%(message)s", handlers=[RichHandler()])
+logger = logging.getLogger("AsyncVersionedDataHandler")
+# Maximum number of storage operations in flight at once.
+STORAGE_MAX_CONCURRENCY = int(os.getenv("STORAGE_MAX_CONCURRENCY", 16))
+
+T = TypeVar("T")
+
+
+class AsyncVersionedDataHandler:
+    """
+    Awaitable counterpart of GCSVersionedDataHandler.
+
+    Every operation runs the synchronous handler in a worker thread, so storage I/O
+    can overlap with other work in the event loop. All the operations of a handler
+    share a single concurrency limit, and the storage clients release the GIL while
+    they wait on the network or the disk. Manifest updates are serialized by the
+    wrapped handler, so concurrent uploads, moves and deletes don't compete for the
+    manifest; only writers outside this handler go through its conflict retries.
+
+    >>> async def main():
+    ...     handler = AsyncVersionedDataHandler("memory://doctest")
+    ...     await handler.upload_string("test", "path/to/test.txt")
+    ...     return await handler.download_string("path/to/test.txt")
+    >>> asyncio.run(main())
+    'test'
+    """
+
+    def __init__(
+        self,
+        handler: Union[str, GCSVersionedDataHandler],
+        max_concurrency: int = STORAGE_MAX_CONCURRENCY,
+    ):
+        self.handler = (
+            handler
+            if isinstance(handler, GCSVersionedDataHandler)
+            else GCSVersionedDataHandler(handler)
+        )
+        self.max_concurrency = max_concurrency
+        # Semaphores are bound to the event loop they are used in.
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphores[loop]
+
+    async def run(self, function: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Runs a blocking function in a worker thread, within the concurrency limit.
+        """
+        async with self.semaphore:
+            return await asyncio.to_thread(function, *args, **kwargs)
+
+    async def upload_string(self, string_data: str, gcs_file_path: str):
+        await self.run(self.handler.upload_string, string_data, gcs_file_path)
+
+    async def download_string(
+        self, gcs_file_path: str, version: Optional[int] = None
+    ) -> str:
+        return await self.run(self.handler.download_string, gcs_file_path, version)
+
+    async def download_dataframe(
+        self,
+        gcs_file_path: str,
+        chunksize: int = CSV_CHUNK_ROWS,
+        version: Optional[int] = None,
+    ) -> pd.DataFrame:
+        return await self.run(
+            self.handler.download_dataframe, gcs_file_path, chunksize, version
+        )
+
+    async def move_file_string(self, gcs_file_path: str, new_gcs_file_path: str):
+        await self.run(self.handler.move_file_string, gcs_file_path, new_gcs_file_path)
+
+    async def copy_file_string(self, gcs_file_path: str, new_gcs_file_path: str):
+        await self.run(self.handler.copy_file_string, gcs_file_path, new_gcs_file_path)
+
+    async def delete_file(self, gcs_file_path: str):
+        await self.run(self.handler.delete_file, gcs_file_path)
+
+    async def list_shards(self, prefix: str = "data/") -> List[Dict]:
+        """
+        Lists the manifest entries of the dataset shards under `prefix`.
+        """
+        manifest = await self.run(self.handler.load_manifest)
+        return manifest.get_shards(prefix)
+
+    async def download_shards(self, shards: List[Dict]) -> Dict[str, str]:
+        """
+        Downloads the given manifest shards concurrently, keyed by data hash.
+        """
+        data = await asyncio.gather(
+            *(self.download_string(shard["path"]) for shard in shards)
+        )
+        return {shard["data_hash"]: csv for shard, csv in zip(shards, data)}
+
+    async def download_shards_dataframes(
+        self, shards: List[Dict], chunksize: int = CSV_CHUNK_ROWS
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        Downloads and parses the given manifest shards concurrently, keyed by data
+        hash.
+        """
+        dfs = await asyncio.gather(
+            *(self.download_dataframe(shard["path"], chunksize) for shard in shards)
+        )
+        return {shard["data_hash"]: df for shard, df in zip(shards, dfs)}
+
+    async def download_original_dataframe(
+        self, chunksize: int = CSV_CHUNK_ROWS
+    ) -> pd.DataFrame:
+        return await self.download_dataframe(
+            "data/original_data/tldr_articles.csv", chunksize
+        )
+
+    async def upload_unlabelled_data(self, csv_string: str, data_hash: str):
+        await self.run(self.handler.upload_unlabelled_data, csv_string, data_hash)
+
+    async def upload_predicted_data(self, csv_string: str, data_hash: str, folder: str):
+        await self.run(
+            self.handler.upload_predicted_data, csv_string, data_hash, folder
+        )
+
+    async def upload_training_data(self, csv_string: str, data_hash: str):
+        await self.run(self.handler.upload_training_data, csv_string, data_hash)
+
+    async def move_predicted_data_to_old(self, data_hash: str):
+        await self.run(self.handler.move_predicted_data_to_old, data_hash)
+
+    async def delete_predicted_file(self, data_hash: str):
+        await self.run(self.handler.delete_predicted_file, data_hash)
+
+    async def download_all_training_data(self) -> Dict[str, str]:
+        logger.info("Downloading all training data...")
+        training_data_files = await self.download_shards(
+            await self.list_shards("data/training_data/")
+        )
+        logger.info("All training data downloaded.")
+        return training_data_files
+
+    async def download_all_training_dataframes(
+        self, chunksize: int = CSV_CHUNK_ROWS
+    ) -> Dict[str, pd.DataFrame]:
+        return await self.download_shards_dataframes(
+            await self.list_shards("data/training_data/"), chunksize
+        )
+
+    async def download_new_predicted_data(self) -> Dict[str, str]:
+        logger.info("Downloading new predicted data...")
+        predicted_data_files = await self.download_shards(
+            await self.list_shards("data/predicted_data/new/")
+        )
+        logger.info("New predicted data downloaded.")
+        return predicted_data_files
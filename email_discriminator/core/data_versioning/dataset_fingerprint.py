@@ -0,0 +1,59 @@
+import hashlib
+import json
+from typing import Optional, Sequence
+
+import numpy as np
+from pandas import DataFrame
+from pandas.util import hash_pandas_object
+
+# Length of the hex digest used in shard names.
+DATA_HASH_LENGTH = 10
+
+
+def hash_rows(df: DataFrame, columns: Optional[Sequence[str]] = None) -> np.ndarray:
+    """
+    Computes a stable 64-bit hash per row over the given columns.
+
+    The hashes are vectorized and independent of the column order and of the index,
+    so the same rows hash the same wherever they come from.
+
+    Args:
+        df: The DataFrame to hash.
+        columns: Columns that identify a row. Defaults to all of them.
+
+    Returns:
+        A uint64 array with one hash per row.
+    """
+    columns = sorted(df.columns if columns is None else columns)
+    return hash_pandas_object(df[columns], index=False).to_numpy()
+
+
+def dataset_fingerprint(
+    df: DataFrame,
+    columns: Optional[Sequence[str]] = None,
+    length: int = DATA_HASH_LENGTH,
+) -> str:
+    """
+    Computes a content fingerprint of a DataFrame, used as its data hash.
+
+    Unlike hashing `df.to_string()`, this does not render the table and does not
+    depend on pandas display options: the per-row hashes and the schema are
+    combined into a single SHA-256 digest.
+
+    Args:
+        df: The DataFrame to fingerprint.
+        columns: Canonical columns to fingerprint. Defaults to all of them.
+        length: Number of hex characters of the digest to return.
+
+    Returns:
+        The hex digest truncated to `length` characters.
+
+    >>> import pandas as pd
+    >>> df = pd.DataFrame({"article": ["a", "b"], "section": ["x", "y"]})
+    >>> dataset_fingerprint(df) == dataset_fingerprint(df[["section", "article"]])
+    True
+    """
+    columns = sorted(df.columns if columns is None else columns)
+    digest = hashlib.sha256(json.dumps(columns).encode())
+    digest.update(hash_rows(df, columns).tobytes())
+    return digest.hexdigest()[:length]
@@ -0,0 +1,177 @@
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+from rich.logging import RichHandler
+
+LOGGER_LEVEL = os.getenv("LOGGER_LEVEL", "WARNING")
+logging.basicConfig(level=LOGGER_LEVEL, format="%(message)s", handlers=[RichHandler()])
+logger = logging.getLogger("DatasetManifest")
+
+MANIFEST_PATH = "data/manifest.json"
+MANIFEST_VERSION = 1
+DATA_HASH_PATTERN = re.compile(r"tldr_articles_(?P<data_hash>[^/]+)\.csv$")
+
+
+def is_dataset_path(gcs_file_path: str) -> bool:
+    """
+    Returns True if the path points to a dataset shard tracked by the manifest.
+    """
+    return gcs_file_path.startswith("data/") and gcs_file_path.endswith(".csv")
+
+
+def data_hash_from_path(gcs_file_path: str) -> Optional[str]:
+    """
+    Extracts the data hash from a shard path, or None if the path has no hash.
+
+    >>> data_hash_from_path("data/training_data/tldr_articles_abc123.csv")
+    'abc123'
+    >>> data_hash_from_path("data/original_data/tldr_articles.csv") is None
+    True
+    """
+    match = DATA_HASH_PATTERN.search(gcs_file_path)
+    return match.group("data_hash") if match else None
+
+
+def describe_csv(csv_string: str) -> Dict:
+    """
+    Computes the row count, byte size and schema of a CSV string.
+
+    Args:
+        csv_string: The CSV content, with a header row.
+
+    Returns:
+        A dictionary with the `rows`, `bytes` and `schema` of the CSV.
+    """
+    reader = csv.reader(io.StringIO(csv_string))
+    schema = next(reader, [])
+    rows = sum(1 for _ in reader)
+    return {
+        "rows": rows,
+        "bytes": len(csv_string.encode()),
+        "schema": schema,
+    }
+
+
+class DatasetManifest:
+    """
+    Index of the dataset shards stored in the bucket.
+
+    The manifest is a single JSON object that lists every shard with its data hash,
+    row count, byte size, schema and creation time, so readers can plan their work
+    without listing the bucket. `generation` is the object generation the manifest
+    was read at, used as a precondition when writing it back.
+    """
+
+    def __init__(
+        self, shards: Optional[Dict[str, Dict]] = None, generation: int = 0
+    ) -> None:
+        self.shards = shards if shards is not None else {}
+        self.generation = generation
+
+    @classmethod
+    def from_json(cls, json_string: str, generation: int = 0) -> "DatasetManifest":
+        manifest = json.loads(json_string)
+        return cls(manifest.get("shards", {}), generation=generation)
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {"version": MANIFEST_VERSION, "shards": self.shards},
+            indent=2,
+            sort_keys=True,
+        )
+
+    def add_shard(
+        self,
+        gcs_file_path: str,
+        csv_string: str,
+        created: Optional[str] = None,
+        stored_bytes: Optional[int] = None,
+    ) -> Dict:
+        """
+        Adds or replaces the entry of a shard.
+
+        Args:
+            gcs_file_path: Path of the shard in the bucket.
+            csv_string: Content of the shard.
+            created: ISO timestamp of the shard creation. Defaults to now.
+            stored_bytes: Size of the shard as stored, if compressed.
+
+        Returns:
+            The manifest entry of the shard.
+        """
+        description = describe_csv(csv_string)
+        entry = {
+            "path": gcs_file_path,
+            "data_hash": data_hash_from_path(gcs_file_path),
+            "created": created or datetime.now(timezone.utc).isoformat(),
+            "stored_bytes": (
+                stored_bytes if stored_bytes is not None else description["bytes"]
+            ),
+            **description,
+        }
+        self.shards[gcs_file_path] = entry
+        logger.debug(f"Manifest entry added for {gcs_file_path}: {entry}")
+        return entry
+
+    def remove_shard(self, gcs_file_path: str) -> None:
+        if self.shards.pop(gcs_file_path, None) is None:
+            logger.warning(f"{gcs_file_path} is not in the manifest.")
+
+    def move_shard(self, gcs_file_path: str, new_gcs_file_path: str) -> None:
+        entry = self.shards.pop(gcs_file_path, None)
+        if entry is None:
+            logger.warning(f"{gcs_file_path} is not in the manifest.")
+            return
+        entry["path"] = new_gcs_file_path
+        entry["data_hash"] = data_hash_from_path(new_gcs_file_path)
+        self.shards[new_gcs_file_path] = entry
+
+    def copy_shard(self, gcs_file_path: str, new_gcs_file_path: str) -> None:
+        entry = self.shards.get(gcs_file_path)
+        if entry is None:
+            logger.warning(f"{gcs_file_path} is not in the manifest.")
+            return
+        self.shards[new_gcs_file_path] = {
+            **entry,
+            "path": new_gcs_file_path,
+            "data_hash": data_hash_from_path(new_gcs_file_path),
+            "created": datetime.now(timezone.utc).isoformat(),
+        }
+
+    def get_shards(self, prefix: str = "") -> List[Dict]:
+        """
+        Returns the entries of the shards under `prefix`, sorted by path.
+        """
+        return [
+            self.shards[path] for path in sorted(self.shards) if path.startswith(prefix)
+        ]
+
+    def fingerprint(
+        self, prefix: str = "", data_hashes: Optional[Sequence[str]] = None
+    ) -> str:
+        """
+        Digest of the entries of the shards under `prefix`, or of the given data
+        hashes among them.
+
+        An entry is replaced whenever its shard is written, so the digest changes
+        with the content of the shards without downloading them.
+        """
+        shards = [
+            shard
+            for shard in self.get_shards(prefix)
+            if data_hashes is None or shard["data_hash"] in data_hashes
+        ]
+        return hashlib.sha256(json.dumps(shards, sort_keys=True).encode()).hexdigest()
+
+    def __contains__(self, gcs_file_path: str) -> bool:
+        return gcs_file_path in self.shards
+
+    def __len__(self) -> int:
+        return len(self.shards)
@@ -1,58 +1,344 @@
+import gzip
 import json
 import logging
 import os
 import pickle
-from typing import Optional
+import threading
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
 
-from google.cloud import storage
+import pandas as pd
 from rich.logging import RichHandler
 
+from email_discriminator.core.data_versioning.dataset_manifest import (
+    MANIFEST_PATH,
+    DatasetManifest,
+    is_dataset_path,
+)
+from email_discriminator.core.data_versioning.storage_backend import (
+    ObjectNotFoundError,
+    PreconditionFailedError,
+    StorageBackend,
+    storage_backend_from_uri,
+)
+
 # Setting up logging
 LOGGER_LEVEL = os.getenv("LOGGER_LEVEL", "WARNING")
 logging.basicConfig(level=LOGGER_LEVEL, format="%(message)s", handlers=[RichHandler()])
 logger = logging.getLogger("GCSVersionedDataHandler")
+MANIFEST_MAX_RETRIES = int(os.getenv("MANIFEST_MAX_RETRIES", 5))
+# Rows per DataFrame chunk when streaming CSV objects.
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", 10_000))
+GZIP_COMPRESSLEVEL = int(os.getenv("GZIP_COMPRESSLEVEL", 6))
+GZIP_MAGIC = b"\x1f\x8b"
+# Maximum number of operations per batched request.
+BATCH_MAX_SIZE = 100
+
+
+def decompress(data: bytes) -> bytes:
+    """
+    Decompresses gzip data. Data stored before compression was enabled is returned
+    as is: CSV text never starts with the gzip magic number.
+    """
+    return gzip.decompress(data) if data[:2] == GZIP_MAGIC else data
+
+
+def open_decompressed(stream: BinaryIO) -> BinaryIO:
+    """
+    Wraps a seekable stream so gzip data is decompressed while it is read.
+    """
+    magic = stream.read(2)
+    stream.seek(0)
+    return gzip.GzipFile(fileobj=stream, mode="rb") if magic == GZIP_MAGIC else stream
+
+
+class PendingBatch:
+    """
+    Storage operations and manifest updates deferred until the end of a batch.
+    """
+
+    def __init__(self):
+        self.copies: List[Tuple[str, str]] = []
+        self.deletes: List[str] = []
+        self.manifest_updates: List[Callable[[DatasetManifest], None]] = []
 
 
 class GCSVersionedDataHandler:
-    def __init__(self, bucket_name, credentials=None):
+    """
+    Versioned dataset storage on top of a pluggable storage backend.
+
+    `bucket_name` is a GCS bucket name by default; `file://<dir>` and
+    `memory://<name>` select the local-filesystem and in-memory backends, so the
+    flows can run without a real bucket. A backend can also be passed directly.
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        credentials=None,
+        backend: Optional[StorageBackend] = None,
+    ):
         self.bucket_name = bucket_name
-        self.storage_client = storage.Client(credentials=credentials)
+        self.backend = (
+            backend
+            if backend is not None
+            else storage_backend_from_uri(bucket_name, credentials=credentials)
+        )
+        self.pending_batch: Optional[PendingBatch] = None
+        # Serializes the manifest updates of the threads sharing this handler.
+        self.manifest_lock = threading.Lock()
 
     def enable_versioning(self):
         logger.info("Enabling versioning...")
-        bucket = self.storage_client.get_bucket(self.bucket_name)
-        bucket.versioning_enabled = True
-        bucket.patch()
+        self.backend.set_versioning(True)
         logger.info("Versioning enabled.")
 
     def disable_versioning(self):
         logger.info("Disabling versioning...")
-        bucket = self.storage_client.get_bucket(self.bucket_name)
-        bucket.versioning_enabled = False
-        bucket.patch()
+        self.backend.set_versioning(False)
         logger.info("Versioning disabled.")
 
     def upload_string(self, string_data: str, gcs_file_path: str):
         logger.info(f"Uploading data to {gcs_file_path}...")
-        bucket = self.storage_client.get_bucket(self.bucket_name)
-        blob = bucket.blob(gcs_file_path)
-        blob.upload_from_string(string_data)
+        if not is_dataset_path(gcs_file_path):
+            self.backend.upload(gcs_file_path, string_data.encode())
+            logger.info(f"Data uploaded to {gcs_file_path}.")
+            return
+        # Datasets are stored gzip-compressed, which also compresses the transfer.
+        data = gzip.compress(string_data.encode(), compresslevel=GZIP_COMPRESSLEVEL)
+        self.backend.upload(
+            gcs_file_path, data, content_type="text/csv", content_encoding="gzip"
+        )
         logger.info(f"Data uploaded to {gcs_file_path}.")
+        self.update_manifest_later(
+            lambda manifest: manifest.add_shard(
+                gcs_file_path, string_data, stored_bytes=len(data)
+            )
+        )
 
     def download_string(self, gcs_file_path: str, version: Optional[int] = None) -> str:
         logger.info(f"Downloading data from {gcs_file_path}...")
-        bucket = self.storage_client.get_bucket(self.bucket_name)
-        blob = bucket.blob(gcs_file_path, generation=version)
-        data = blob.download_as_text()
+        data, _ = self.backend.download(gcs_file_path, generation=version)
         logger.info(f"Data downloaded from {gcs_file_path}.")
-        return data
+        return decompress(data).decode()
+
+    def download_dataframe_chunks(
+        self,
+        gcs_file_path: str,
+        chunksize: int = CSV_CHUNK_ROWS,
+        version: Optional[int] = None,
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Streams a CSV object from the bucket as DataFrame chunks.
+
+        The object is read as a byte stream and parsed incrementally, so at most one
+        read buffer and one chunk of `chunksize` rows are held in memory at a time,
+        regardless of the object size.
+
+        Args:
+            gcs_file_path: Path of the CSV object in the bucket.
+            chunksize: Number of rows per yielded DataFrame.
+            version: Generation of the object to read. Defaults to the live one.
+
+        Yields:
+            DataFrames of at most `chunksize` rows.
+        """
+        logger.info(f"Streaming data from {gcs_file_path}...")
+        with self.backend.open(gcs_file_path, generation=version) as stream:
+            with pd.read_csv(open_decompressed(stream), chunksize=chunksize) as reader:
+                yield from reader
+        logger.info(f"Data streamed from {gcs_file_path}.")
+
+    def download_dataframe(
+        self,
+        gcs_file_path: str,
+        chunksize: int = CSV_CHUNK_ROWS,
+        version: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """
+        Downloads a CSV object as a DataFrame without materialising its text.
+        """
+        return pd.concat(
+            self.download_dataframe_chunks(gcs_file_path, chunksize, version),
+            ignore_index=True,
+        )
 
     def move_file_string(self, gcs_file_path: str, new_gcs_file_path: str):
         logger.info(f"Moving file from {gcs_file_path} to {new_gcs_file_path}...")
-        bucket = self.storage_client.get_bucket(self.bucket_name)
-        blob = bucket.blob(gcs_file_path)
-        blob.move_to(bucket.blob(new_gcs_file_path))
+        if self.pending_batch is not None:
+            self.pending_batch.copies.append((gcs_file_path, new_gcs_file_path))
+            self.pending_batch.deletes.append(gcs_file_path)
+        else:
+            self.backend.move(gcs_file_path, new_gcs_file_path)
         logger.info(f"File moved from {gcs_file_path} to {new_gcs_file_path}.")
+        if is_dataset_path(gcs_file_path):
+            self.update_manifest_later(
+                lambda manifest: manifest.move_shard(gcs_file_path, new_gcs_file_path)
+            )
+
+    def copy_file_string(self, gcs_file_path: str, new_gcs_file_path: str):
+        logger.info(f"Copying file from {gcs_file_path} to {new_gcs_file_path}...")
+        if self.pending_batch is not None:
+            self.pending_batch.copies.append((gcs_file_path, new_gcs_file_path))
+        else:
+            self.backend.copy(gcs_file_path, new_gcs_file_path)
+        logger.info(f"File copied from {gcs_file_path} to {new_gcs_file_path}.")
+        if is_dataset_path(gcs_file_path):
+            self.update_manifest_later(
+                lambda manifest: manifest.copy_shard(gcs_file_path, new_gcs_file_path)
+            )
+
+    def delete_file(self, gcs_file_path: str):
+        logger.info(f"Deleting file {gcs_file_path}...")
+        if self.pending_batch is not None:
+            self.pending_batch.deletes.append(gcs_file_path)
+        else:
+            self.backend.delete(gcs_file_path)
+        logger.info(f"File {gcs_file_path} deleted.")
+        if is_dataset_path(gcs_file_path):
+            self.update_manifest_later(
+                lambda manifest: manifest.remove_shard(gcs_file_path)
+            )
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups the copies, moves and deletes issued inside the context.
+
+        Server-side copies and deletes are sent as batched requests when the context
+        exits, and all the manifest changes are applied in a single update. Uploads
+        still run immediately. A delete of an object that is also copied (as in a
+        move) goes in a second batch, since batched operations run in any order.
+        """
+        if self.pending_batch is not None:
+            yield
+            return
+        self.pending_batch = PendingBatch()
+        try:
+            yield
+            pending_batch = self.pending_batch
+        finally:
+            self.pending_batch = None
+        self._run_batch(pending_batch)
+
+    def _run_batch(self, pending_batch: PendingBatch):
+        copied_paths = {gcs_file_path for gcs_file_path, _ in pending_batch.copies}
+        first_round = [
+            (self.backend.copy, gcs_file_path, new_gcs_file_path)
+            for gcs_file_path, new_gcs_file_path in pending_batch.copies
+        ] + [
+            (self.backend.delete, gcs_file_path)
+            for gcs_file_path in pending_batch.deletes
+            if gcs_file_path not in copied_paths
+        ]
+        second_round = [
+            (self.backend.delete, gcs_file_path)
+            for gcs_file_path in pending_batch.deletes
+            if gcs_file_path in copied_paths
+        ]
+        for operations in [first_round, second_round]:
+            for start in range(0, len(operations), BATCH_MAX_SIZE):
+                with self.backend.batch():
+                    for operation, *paths in operations[start : start + BATCH_MAX_SIZE]:
+                        operation(*paths)
+        logger.info(
+            f"Batch of {len(pending_batch.copies)} copies and "
+            f"{len(pending_batch.deletes)} deletes done."
+        )
+
+        if pending_batch.manifest_updates:
+
+            def update(manifest: DatasetManifest):
+                for manifest_update in pending_batch.manifest_updates:
+                    manifest_update(manifest)
+
+            self.update_manifest(update)
+
+    def update_manifest_later(self, update: Callable[[DatasetManifest], None]):
+        """
+        Updates the manifest now, or at the end of the current batch.
+        """
+        if self.pending_batch is not None:
+            self.pending_batch.manifest_updates.append(update)
+        else:
+            self.update_manifest(update)
+
+    def load_manifest(self) -> DatasetManifest:
+        """
+        Loads the dataset manifest with a single GET.
+
+        If the bucket has no manifest yet, it is rebuilt from a one-off listing.
+        """
+        try:
+            manifest_json, generation = self.backend.download(MANIFEST_PATH)
+        except ObjectNotFoundError:
+            logger.warning("No dataset manifest found, rebuilding it.")
+            return self.rebuild_manifest()
+        return DatasetManifest.from_json(manifest_json, generation=generation)
+
+    def write_manifest(self, manifest: DatasetManifest) -> DatasetManifest:
+        """
+        Writes the manifest if it has not changed since it was read.
+
+        Raises:
+            PreconditionFailedError: If another writer updated the manifest.
+        """
+        manifest.generation = self.backend.upload(
+            MANIFEST_PATH,
+            manifest.to_json().encode(),
+            content_type="application/json",
+            if_generation_match=manifest.generation,
+        )
+        return manifest
+
+    def update_manifest(
+        self, update: Callable[[DatasetManifest], None]
+    ) -> DatasetManifest:
+        """
+        Applies `update` to the manifest and writes it back atomically.
+
+        Updates from threads sharing this handler run one at a time. The write is
+        conditioned on the generation the manifest was read at, so other writers
+        (other handlers or processes) never overwrite it either: on conflict the
+        manifest is re-read and the update retried.
+        """
+        with self.manifest_lock:
+            for attempt in range(1, MANIFEST_MAX_RETRIES + 1):
+                manifest = self.load_manifest()
+                update(manifest)
+                try:
+                    return self.write_manifest(manifest)
+                except PreconditionFailedError:
+                    logger.warning(
+                        f"Manifest changed while updating it (attempt {attempt}), "
+                        "retrying..."
+                    )
+        raise RuntimeError(
+            f"Could not update the manifest after {MANIFEST_MAX_RETRIES} attempts."
+        )
+
+    def rebuild_manifest(self) -> DatasetManifest:
+        """
+        Rebuilds the manifest by listing and describing every dataset shard.
+        """
+        logger.info("Rebuilding dataset manifest...")
+        manifest = DatasetManifest(generation=self.backend.generation(MANIFEST_PATH))
+        for stored_object in self.backend.list_objects(prefix="data/"):
+            if not is_dataset_path(stored_object.name):
+                continue
+            manifest.add_shard(
+                stored_object.name,
+                self.download_string(stored_object.name),
+                created=stored_object.time_created,
+                stored_bytes=stored_object.size,
+            )
+        try:
+            self.write_manifest(manifest)
+        except PreconditionFailedError:
+            # Another writer created the manifest first, theirs is as good as ours.
+            return self.load_manifest()
+        logger.info(f"Dataset manifest rebuilt with {len(manifest)} shards.")
+        return manifest
 
     def upload_original_data(self, local_file_path: str):
         logger.info("Uploading original data...")
@@ -65,6 +351,13 @@ class GCSVersionedDataHandler:
         logger.info("Original data downloaded.")
         return data
 
+    def download_original_data_chunks(
+        self, chunksize: int = CSV_CHUNK_ROWS
+    ) -> Iterator[pd.DataFrame]:
+        return self.download_dataframe_chunks(
+            "data/original_data/tldr_articles.csv", chunksize
+        )
+
     def upload_unlabelled_data(self, csv_string: str, data_hash: str):
         logger.info("Uploading unlabelled data...")
         self.upload_string(
@@ -95,6 +388,14 @@ class GCSVersionedDataHandler:
         logger.info("Predicted data downloaded.")
         return data
 
+    def copy_training_data_to_predicted(self, data_hash: str, folder: str):
+        logger.info("Copying training data to predicted data...")
+        self.copy_file_string(
+            f"data/training_data/tldr_articles_{data_hash}.csv",
+            f"data/predicted_data/{folder}tldr_articles_{data_hash}.csv",
+        )
+        logger.info("Training data copied to predicted data.")
+
     def move_predicted_data_to_old(self, data_hash: str):
         logger.info("Moving predicted data to old data...")
         self.move_file_string(
@@ -116,73 +417,71 @@ class GCSVersionedDataHandler:
         logger.info("Training data downloaded.")
         return data
 
+    def download_shards(self, shards: List[Dict]) -> Dict[str, str]:
+        """
+        Downloads the given manifest shards, keyed by data hash.
+        """
+        data_files = {}
+        for shard in shards:
+            logger.debug(f"Downloading file {shard['path']}")
+            data_files[shard["data_hash"]] = self.download_string(shard["path"])
+        return data_files
+
+    def get_training_data_shards(self) -> List[Dict]:
+        return self.load_manifest().get_shards("data/training_data/")
+
+    def get_new_predicted_data_shards(self) -> List[Dict]:
+        return self.load_manifest().get_shards("data/predicted_data/new/")
+
+    def download_shards_chunks(
+        self, shards: List[Dict], chunksize: int = CSV_CHUNK_ROWS
+    ) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """
+        Streams the given manifest shards as (data hash, DataFrame chunk) pairs.
+        """
+        for shard in shards:
+            for chunk in self.download_dataframe_chunks(shard["path"], chunksize):
+                yield shard["data_hash"], chunk
+
+    def download_all_training_data_chunks(
+        self, chunksize: int = CSV_CHUNK_ROWS
+    ) -> Iterator[Tuple[str, pd.DataFrame]]:
+        return self.download_shards_chunks(self.get_training_data_shards(), chunksize)
+
     def download_all_training_data(self):
         logger.info("Downloading all training data...")
-        bucket = self.storage_client.get_bucket(self.bucket_name)
-        blobs = bucket.list_blobs(prefix="data/training_data/")
-
-        training_data_files = {}
-
-        for blob in blobs:
-            # Extract the data hash from the file name
-            file_name = blob.name
-            logging.debug(f"Downloading file {file_name}")
-            data_hash = file_name.split("_")[-1].replace(".csv", "")
-
-            # If the blob is not a file, skip it
-            if not file_name.endswith(".csv"):
-                continue
-
-            # Download the file as a string and add to the dictionary
-            training_data_files[data_hash] = blob.download_as_text()
-
+        training_data_files = self.download_shards(self.get_training_data_shards())
         logger.info("All training data downloaded.")
         return training_data_files
 
     def download_new_predicted_data(self):
         logger.info("Downloading new predicted data...")
-        bucket = self.storage_client.get_bucket(self.bucket_name)
-        blobs = bucket.list_blobs(prefix="data/predicted_data/new/")
-
-        predicted_data_files = {}
-
-        for blob in blobs:
-            # Extract the data hash from the file name
-            file_name = blob.name
-            logging.debug(f"Downloading file {file_name}")
-            data_hash = file_name.split("_")[-1].replace(".csv", "")
-
-            # If the blob is not a file, skip it
-            if not file_name.endswith(".csv"):
-                continue
-
-            # Download the file as a string and add to the dictionary
-            predicted_data_files[data_hash] = blob.download_as_text()
-
+        predicted_data_files = self.download_shards(
+            self.get_new_predicted_data_shards()
+        )
         logger.info("New predicted data downloaded.")
         return predicted_data_files
 
     def delete_predicted_file(self, data_hash: str):
         logger.info(f"Deleting file {data_hash}...")
-        bucket = self.storage_client.get_bucket(self.bucket_name)
-        blob = bucket.blob(f"data/predicted_data/new/tldr_articles_{data_hash}.csv")
-        blob.delete()
+        self.delete_file(f"data/predicted_data/new/tldr_articles_{data_hash}.csv")
         logger.info(f"File {data_hash} deleted.")
 
+    def _backend_for(self, bucket_name: str) -> StorageBackend:
+        if bucket_name == self.bucket_name:
+            return self.backend
+        return self.backend.for_bucket(bucket_name)
+
     def read_token_from_gcs(self, bucket_name: str, blob_name: str):
         """Reads token from a GCS bucket."""
-        bucket = self.storage_client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-        return pickle.loads(blob.download_as_bytes())
+        data, _ = self._backend_for(bucket_name).download(blob_name)
+        return pickle.loads(data)
 
     def write_token_to_gcs(self, creds, bucket_name: str, blob_name: str):
         """Writes token to a GCS bucket."""
-        bucket = self.storage_client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-        blob.upload_from_string(pickle.dumps(creds))
+        self._backend_for(bucket_name).upload(blob_name, pickle.dumps(creds))
 
     def read_client_secrets_from_gcs(self, bucket_name: str, blob_name: str):
         """Reads client secrets from a GCS bucket."""
-        bucket = self.storage_client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-        return json.loads(blob.download_as_text())
+        data, _ = self._backend_for(bucket_name).download(blob_name)
+        return json.loads(data)
@@ -0,0 +1,545 @@
+import io
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from typing import BinaryIO, ContextManager, Dict, List, NamedTuple, Optional, Tuple
+
+from google.api_core import exceptions as gcs_exceptions
+from google.cloud import storage
+from rich.logging import RichHandler
+
+LOGGER_LEVEL = os.getenv("LOGGER_LEVEL", "WARNING")
+logging.basicConfig(level=LOGGER_LEVEL, format="%(message)s", handlers=[RichHandler()])
+logger = logging.getLogger("StorageBackend")
+
+# Bytes per ranged GET when streaming objects.
+STREAM_CHUNK_BYTES = int(os.getenv("STREAM_CHUNK_BYTES", 8 * 1024 * 1024))
+
+
+class ObjectNotFoundError(FileNotFoundError):
+    """
+    Raised when an object (or the requested generation of it) does not exist.
+    """
+
+
+class PreconditionFailedError(Exception):
+    """
+    Raised when a write is rejected because `if_generation_match` did not hold.
+    """
+
+
+class StoredObject(NamedTuple):
+    name: str
+    generation: int
+    size: int
+    time_created: Optional[str]
+
+
+class StorageBackend(ABC):
+    """
+    Abstract base class for the object stores behind GCSVersionedDataHandler.
+
+    Every object has a generation that changes on each write, as in GCS. Writes can
+    be conditioned on it with `if_generation_match`, where 0 means "only if the
+    object does not exist yet".
+    """
+
+    @abstractmethod
+    def upload(
+        self,
+        path: str,
+        data: bytes,
+        content_type: Optional[str] = None,
+        if_generation_match: Optional[int] = None,
+        content_encoding: Optional[str] = None,
+    ) -> int:
+        """
+        Writes an object and returns its new generation.
+
+        `data` is stored as is; `content_encoding` only describes it (e.g. "gzip").
+        """
+
+    @abstractmethod
+    def download(
+        self, path: str, generation: Optional[int] = None
+    ) -> Tuple[bytes, int]:
+        """
+        Reads an object as stored and returns its content and generation.
+        """
+
+    @abstractmethod
+    def open(self, path: str, generation: Optional[int] = None) -> BinaryIO:
+        """
+        Opens an object as stored as a readable, seekable binary stream.
+        """
+
+    @abstractmethod
+    def copy(self, path: str, new_path: str) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, path: str) -> None:
+        pass
+
+    @abstractmethod
+    def list_objects(self, prefix: str = "") -> List[StoredObject]:
+        pass
+
+    @abstractmethod
+    def generation(self, path: str) -> int:
+        """
+        Returns the live generation of an object, or 0 if it does not exist.
+        """
+
+    @abstractmethod
+    def set_versioning(self, enabled: bool) -> None:
+        pass
+
+    @abstractmethod
+    def for_bucket(self, bucket_name: str) -> "StorageBackend":
+        """
+        Returns a backend of the same kind pointing to another bucket.
+        """
+
+    def move(self, path: str, new_path: str) -> None:
+        self.copy(path, new_path)
+        self.delete(path)
+
+    def batch(self) -> ContextManager:
+        """
+        Groups the copies and deletes issued inside the context into one request.
+
+        Batched operations may run in any order and their errors are raised when the
+        context exits. Backends without batching run them immediately.
+        """
+        return nullcontext()
+
+
+@contextmanager
+def _translate_batch_errors(batch: ContextManager):
+    """
+    Raises the errors of batched GCS operations, raised when the batch is sent on
+    exit, as the errors of the unbatched operations.
+    """
+    try:
+        with batch:
+            yield
+    except gcs_exceptions.NotFound as e:
+        raise ObjectNotFoundError(str(e)) from e
+    except gcs_exceptions.PreconditionFailed as e:
+        raise PreconditionFailedError(str(e)) from e
+
+
+class GCSStorageBackend(StorageBackend):
+    """
+    Storage backend for a Google Cloud Storage bucket.
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        credentials=None,
+        storage_client: Optional[storage.Client] = None,
+    ):
+        self.bucket_name = bucket_name
+        self.storage_client = storage_client or storage.Client(credentials=credentials)
+        # `bucket` does not issue a request, unlike `get_bucket`.
+        self.bucket = self.storage_client.bucket(bucket_name)
+
+    def upload(
+        self,
+        path: str,
+        data: bytes,
+        content_type: Optional[str] = None,
+        if_generation_match: Optional[int] = None,
+        content_encoding: Optional[str] = None,
+    ) -> int:
+        blob = self.bucket.blob(path)
+        blob.content_encoding = content_encoding
+        try:
+            blob.upload_from_string(
+                data,
+                content_type=content_type,
+                if_generation_match=if_generation_match,
+            )
+        except gcs_exceptions.PreconditionFailed as e:
+            raise PreconditionFailedError(str(e)) from e
+        return blob.generation
+
+    def download(
+        self, path: str, generation: Optional[int] = None
+    ) -> Tuple[bytes, int]:
+        blob = self.bucket.blob(path, generation=generation)
+        try:
+            # Raw download so gzip-encoded objects are not transcoded by the server.
+            data = blob.download_as_bytes(raw_download=True)
+        except gcs_exceptions.NotFound as e:
+            raise ObjectNotFoundError(path) from e
+        return data, blob.generation
+
+    def open(self, path: str, generation: Optional[int] = None) -> BinaryIO:
+        blob = self.bucket.blob(path, generation=generation)
+        return blob.open("rb", chunk_size=STREAM_CHUNK_BYTES, raw_download=True)
+
+    def copy(self, path: str, new_path: str) -> None:
+        self.bucket.copy_blob(self.bucket.blob(path), self.bucket, new_path)
+
+    def delete(self, path: str) -> None:
+        try:
+            self.bucket.delete_blob(path)
+        except gcs_exceptions.NotFound as e:
+            raise ObjectNotFoundError(path) from e
+
+    def move(self, path: str, new_path: str) -> None:
+        self.bucket.rename_blob(self.bucket.blob(path), new_path)
+
+    def list_objects(self, prefix: str = "") -> List[StoredObject]:
+        return [
+            StoredObject(
+                name=blob.name,
+                generation=blob.generation,
+                size=blob.size,
+                time_created=(
+                    blob.time_created.isoformat() if blob.time_created else None
+                ),
+            )
+            for blob in self.storage_client.list_blobs(self.bucket_name, prefix=prefix)
+        ]
+
+    def batch(self) -> ContextManager:
+        return _translate_batch_errors(self.storage_client.batch())
+
+    def generation(self, path: str) -> int:
+        blob = self.bucket.get_blob(path)
+        return blob.generation if blob is not None else 0
+
+    def set_versioning(self, enabled: bool) -> None:
+        bucket = self.storage_client.get_bucket(self.bucket_name)
+        bucket.versioning_enabled = enabled
+        bucket.patch()
+
+    def for_bucket(self, bucket_name: str) -> "GCSStorageBackend":
+        return GCSStorageBackend(bucket_name, storage_client=self.storage_client)
+
+
+class _Revision(NamedTuple):
+    generation: int
+    data: bytes
+    content_type: Optional[str]
+    time_created: str
+
+
+class InMemoryStorageBackend(StorageBackend):
+    """
+    Storage backend that keeps objects in process memory.
+
+    Backends created with the same name share their objects, like handlers pointing
+    to the same bucket. Generations are emulated; with versioning enabled,
+    overwritten and deleted generations stay readable.
+    """
+
+    _buckets: Dict[str, Dict[str, List[Optional[_Revision]]]] = {}
+    _versioning: Dict[str, bool] = {}
+    lock = threading.RLock()
+
+    def __init__(self, bucket_name: str = "email-discriminator"):
+        self.bucket_name = bucket_name
+        self.objects = self._buckets.setdefault(bucket_name, {})
+
+    @property
+    def versioning_enabled(self) -> bool:
+        return self._versioning.get(self.bucket_name, False)
+
+    def _next_generation(self, path: str) -> int:
+        generations = [
+            revision.generation
+            for revision in self.objects.get(path, [])
+            if revision is not None
+        ]
+        return max(max(generations, default=0) + 1, time.time_ns() // 1000)
+
+    def _live(self, path: str) -> Optional[_Revision]:
+        revisions = self.objects.get(path)
+        if not revisions or revisions[-1] is None:
+            return None
+        return revisions[-1]
+
+    def _find(self, path: str, generation: Optional[int]) -> _Revision:
+        if generation is None:
+            revision = self._live(path)
+        else:
+            revision = next(
+                (
+                    revision
+                    for revision in self.objects.get(path, [])
+                    if revision is not None and revision.generation == generation
+                ),
+                None,
+            )
+        if revision is None:
+            raise ObjectNotFoundError(path)
+        return revision
+
+    def _archive(self, path: str) -> List[_Revision]:
+        revisions = self.objects.setdefault(path, [])
+        if not self.versioning_enabled:
+            revisions.clear()
+        return revisions
+
+    def upload(
+        self,
+        path: str,
+        data: bytes,
+        content_type: Optional[str] = None,
+        if_generation_match: Optional[int] = None,
+        content_encoding: Optional[str] = None,
+    ) -> int:
+        with self.lock:
+            live = self._live(path)
+            if if_generation_match is not None and if_generation_match != (
+                live.generation if live else 0
+            ):
+                raise PreconditionFailedError(path)
+            revision = _Revision(
+                self._next_generation(path),
+                bytes(data),
+                content_type,
+                datetime.now(timezone.utc).isoformat(),
+            )
+            self._archive(path).append(revision)
+            return revision.generation
+
+    def download(
+        self, path: str, generation: Optional[int] = None
+    ) -> Tuple[bytes, int]:
+        with self.lock:
+            revision = self._find(path, generation)
+        return revision.data, revision.generation
+
+    def open(self, path: str, generation: Optional[int] = None) -> BinaryIO:
+        return io.BytesIO(self.download(path, generation)[0])
+
+    def copy(self, path: str, new_path: str) -> None:
+        with self.lock:
+            revision = self._find(path, None)
+            self.upload(new_path, revision.data, revision.content_type)
+
+    def delete(self, path: str) -> None:
+        with self.lock:
+            self._find(path, None)
+            revisions = self._archive(path)
+            if revisions:
+                # A tombstone keeps the archived generations readable.
+                revisions.append(None)
+            else:
+                del self.objects[path]
+
+    def list_objects(self, prefix: str = "") -> List[StoredObject]:
+        with self.lock:
+            return [
+                StoredObject(path, live.generation, len(live.data), live.time_created)
+                for path in sorted(self.objects)
+                if path.startswith(prefix) and (live := self._live(path)) is not None
+            ]
+
+    def generation(self, path: str) -> int:
+        with self.lock:
+            live = self._live(path)
+        return live.generation if live else 0
+
+    def set_versioning(self, enabled: bool) -> None:
+        self._versioning[self.bucket_name] = enabled
+
+    def for_bucket(self, bucket_name: str) -> "InMemoryStorageBackend":
+        return InMemoryStorageBackend(bucket_name)
+
+    @classmethod
+    def clear(cls) -> None:
+        """
+        Drops the objects of every in-memory bucket.
+        """
+        cls._buckets.clear()
+        cls._versioning.clear()
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Storage backend that keeps objects in a local directory.
+
+    Live objects are plain files under `root`, so the data can be inspected with
+    any tool. Generations are emulated in a `.generations` sidecar tree and, with
+    versioning enabled, overwritten and deleted generations are kept under
+    `.versions/<path>/<generation>`. Writes go through a temporary file and an
+    atomic rename, and are serialised within the process.
+    """
+
+    GENERATIONS_DIR = ".generations"
+    VERSIONS_DIR = ".versions"
+    VERSIONING_FLAG = ".versioning"
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.bucket_name = os.path.basename(self.root)
+        self.lock = threading.RLock()
+        os.makedirs(self.root, exist_ok=True)
+
+    @property
+    def versioning_enabled(self) -> bool:
+        return os.path.exists(os.path.join(self.root, self.VERSIONING_FLAG))
+
+    def _object_path(self, path: str) -> str:
+        return os.path.join(self.root, *path.split("/"))
+
+    def _generation_path(self, path: str) -> str:
+        return os.path.join(self.root, self.GENERATIONS_DIR, *path.split("/"))
+
+    def _version_path(self, path: str, generation: int) -> str:
+        return os.path.join(
+            self.root, self.VERSIONS_DIR, *path.split("/"), str(generation)
+        )
+
+    @staticmethod
+    def _write_atomic(file_path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
+
+    def _max_archived_generation(self, path: str) -> int:
+        versions_dir = os.path.dirname(self._version_path(path, 0))
+        if not os.path.isdir(versions_dir):
+            return 0
+        return max((int(name) for name in os.listdir(versions_dir)), default=0)
+
+    def _archive(self, path: str) -> None:
+        generation = self.generation(path)
+        if generation and self.versioning_enabled:
+            version_path = self._version_path(path, generation)
+            os.makedirs(os.path.dirname(version_path), exist_ok=True)
+            os.replace(self._object_path(path), version_path)
+
+    def upload(
+        self,
+        path: str,
+        data: bytes,
+        content_type: Optional[str] = None,
+        if_generation_match: Optional[int] = None,
+        content_encoding: Optional[str] = None,
+    ) -> int:
+        with self.lock:
+            current_generation = self.generation(path)
+            if (
+                if_generation_match is not None
+                and if_generation_match != current_generation
+            ):
+                raise PreconditionFailedError(path)
+            generation = max(current_generation + 1, time.time_ns() // 1000)
+            if self.versioning_enabled:
+                # Deleted generations are archived too, new ones must not clash.
+                generation = max(generation, self._max_archived_generation(path) + 1)
+            self._archive(path)
+            self._write_atomic(self._object_path(path), bytes(data))
+            self._write_atomic(self._generation_path(path), str(generation).encode())
+            return generation
+
+    def download(
+        self, path: str, generation: Optional[int] = None
+    ) -> Tuple[bytes, int]:
+        with self.lock:
+            live_generation = self.generation(path)
+            with self.open(path, generation) as f:
+                data = f.read()
+        return data, generation or live_generation
+
+    def open(self, path: str, generation: Optional[int] = None) -> BinaryIO:
+        with self.lock:
+            live_generation = self.generation(path)
+            if generation is None or generation == live_generation:
+                file_path = self._object_path(path)
+            else:
+                file_path = self._version_path(path, generation)
+            try:
+                return open(file_path, "rb")
+            except FileNotFoundError as e:
+                raise ObjectNotFoundError(path) from e
+
+    def copy(self, path: str, new_path: str) -> None:
+        with self.lock:
+            self.upload(new_path, self.download(path)[0])
+
+    def delete(self, path: str) -> None:
+        with self.lock:
+            if not self.generation(path):
+                raise ObjectNotFoundError(path)
+            if self.versioning_enabled:
+                self._archive(path)
+            else:
+                os.remove(self._object_path(path))
+            os.remove(self._generation_path(path))
+
+    def list_objects(self, prefix: str = "") -> List[StoredObject]:
+        objects = []
+        generations_root = os.path.join(self.root, self.GENERATIONS_DIR)
+        for dir_path, _, file_names in os.walk(generations_root):
+            for file_name in file_names:
+                if file_name.endswith(".tmp"):
+                    continue
+                relative_path = os.path.relpath(
+                    os.path.join(dir_path, file_name), generations_root
+                )
+                path = relative_path.replace(os.sep, "/")
+                if not path.startswith(prefix):
+                    continue
+                object_path = self._object_path(path)
+                objects.append(
+                    StoredObject(
+                        name=path,
+                        generation=self.generation(path),
+                        size=os.path.getsize(object_path),
+                        time_created=datetime.fromtimestamp(
+                            os.path.getmtime(object_path), timezone.utc
+                        ).isoformat(),
+                    )
+                )
+        return sorted(objects, key=lambda stored_object: stored_object.name)
+
+    def generation(self, path: str) -> int:
+        try:
+            with open(self._generation_path(path), "rb") as f:
+                return int(f.read())
+        except FileNotFoundError:
+            return 0
+
+    def set_versioning(self, enabled: bool) -> None:
+        flag_path = os.path.join(self.root, self.VERSIONING_FLAG)
+        if enabled:
+            open(flag_path, "a").close()
+        elif os.path.exists(flag_path):
+            os.remove(flag_path)
+
+    def for_bucket(self, bucket_name: str) -> "LocalStorageBackend":
+        return LocalStorageBackend(
+            os.path.join(os.path.dirname(self.root), bucket_name)
+        )
+
+
+def storage_backend_from_uri(uri: str, credentials=None) -> StorageBackend:
+    """
+    Creates the storage backend for a bucket URI.
+
+    `file://<dir>` uses a local directory, `memory://<name>` an in-memory bucket and
+    `gs://<bucket>` or a bare bucket name a GCS bucket.
+
+    >>> type(storage_backend_from_uri("memory://test")).__name__
+    'InMemoryStorageBackend'
+    """
+    if uri.startswith("file://"):
+        return LocalStorageBackend(uri[len("file://") :])
+    if uri.startswith("memory://"):
+        return InMemoryStorageBackend(uri[len("memory://") :])
+    return GCSStorageBackend(uri.replace("gs://", "", 1), credentials=credentials)
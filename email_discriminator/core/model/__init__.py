@@ -1,3 +1,9 @@
 from email_discriminator.core.model.data_processor import DataProcessor, TextSelector
+from email_discriminator.core.model.feature_store import FeatureStore
+from email_discriminator.core.model.incremental import warm_start_pipeline
+from email_discriminator.core.model.inference_bundle import InferenceBundle
 from email_discriminator.core.model.label_encoder import CustomLabelEncoder
 from email_discriminator.core.model.model import Model
+from email_discriminator.core.model.model_cache import ModelCache
+from email_discriminator.core.model.out_of_core import fit_out_of_core
+from email_discriminator.core.model.text_normalizer import TextNormalizer
@@ -1,18 +1,56 @@
 import logging
 import os
+from typing import List, Optional, Sequence, Union
 
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
 from numpy import ndarray
 from pandas import DataFrame
 from rich.logging import RichHandler
+from scipy import sparse
 from sklearn.base import BaseEstimator, TransformerMixin
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import (
+    HashingVectorizer,
+    TfidfTransformer,
+    TfidfVectorizer,
+)
 from sklearn.pipeline import FeatureUnion, Pipeline
+from sklearn.preprocessing import FunctionTransformer, OneHotEncoder
 
+from email_discriminator.core.data_versioning.dataset_fingerprint import hash_rows
+from email_discriminator.core.model.feature_store import FeatureStore
 from email_discriminator.core.model.label_encoder import CustomLabelEncoder
+from email_discriminator.core.model.text_normalizer import TextNormalizer, to_column
 
 LOGGER_LEVEL = os.getenv("LOGGER_LEVEL", "WARNING")
 logging.basicConfig(level=LOGGER_LEVEL, format="%(message)s", handlers=[RichHandler()])
 logger = logging.getLogger("DataPreprocessor")
+VECTORIZERS = ["tfidf", "hashing"]
+# Columns the features are computed from, which identify a row in the feature store.
+FEATURE_COLUMNS = ["article", "section"]
+FEATURE_STORE_URI = os.getenv("FEATURE_STORE_URI")
+TRANSFORM_CHUNK_ROWS = int(os.getenv("TRANSFORM_CHUNK_ROWS", 10_000))
+# Link domains seen fewer times than this share a single "infrequent" column.
+LINK_DOMAIN_MIN_FREQUENCY = 5
+# Parameters of processors pickled before they existed, set as they behaved then
+PICKLED_DEFAULTS = {
+    "vectorizer": "tfidf",
+    "n_features": 2**16,
+    "use_idf": True,
+    "dtype": np.float64,
+    "feature_store": None,
+    "n_jobs": None,
+    "chunk_size": TRANSFORM_CHUNK_ROWS,
+    "normalize": False,
+    "normalizer": None,
+    "min_df": 1,
+    "max_df": 1.0,
+    "max_features": None,
+    "vocabulary": None,
+    "one_hot_section": False,
+}
 
 
 class TextSelector(BaseEstimator, TransformerMixin):
@@ -36,43 +74,279 @@ class TextSelector(BaseEstimator, TransformerMixin):
         return X[self.key]
 
 
+class SparseFeatureUnion(FeatureUnion):
+    """
+    FeatureUnion that always outputs a single CSR matrix of the given dtype.
+
+    Each block is converted to CSR in the output dtype, a no-op for blocks that
+    already are, and the blocks are stacked in one allocation. The default
+    `FeatureUnion` goes through COO and upcasts to the widest block dtype instead.
+    """
+
+    def __init__(
+        self,
+        transformer_list,
+        *,
+        dtype=np.float32,
+        n_jobs=None,
+        transformer_weights=None,
+        verbose=False,
+    ):
+        super().__init__(
+            transformer_list,
+            n_jobs=n_jobs,
+            transformer_weights=transformer_weights,
+            verbose=verbose,
+        )
+        self.dtype = dtype
+
+    def _hstack(self, Xs):
+        blocks = [sparse.csr_matrix(X, dtype=self.dtype) for X in Xs]
+        return sparse.hstack(blocks, format="csr", dtype=self.dtype)
+
+
 class DataProcessor(BaseEstimator, TransformerMixin):
     """
     Data processor to fit and transform input data.
+
+    Args:
+        vectorizer: "tfidf" learns a vocabulary from the articles. "hashing" maps
+            terms to `n_features` columns with a hash function instead, so the
+            memory and the size of the fitted processor do not grow with the corpus
+            and any chunk of articles can be vectorized on its own.
+        n_features: Number of columns of the hashing vectorizer.
+        use_idf: Whether the hashing vectorizer is followed by IDF reweighting.
+        dtype: Data type of the output CSR matrix.
+        feature_store: URI of a FeatureStore the transformed rows are saved to and
+            loaded from. Defaults to the FEATURE_STORE_URI environment variable.
+        n_jobs: Number of worker processes `transform` splits the rows across. The
+            output is the same as the serial transform, which is the default, as
+            the workers only pay off their overhead on several cores.
+        chunk_size: Number of rows per chunk of the parallel transform.
+        normalize: Whether the articles are cleaned by a TextNormalizer before they
+            are vectorized, which also adds their read time and link domain as
+            features. Off by default, as it changes the features of the model.
+        min_df: Minimum document frequency of the TF-IDF terms, as a count or a
+            proportion of the documents.
+        max_df: Maximum document frequency of the TF-IDF terms.
+        max_features: Maximum number of TF-IDF terms, the most frequent ones.
+        vocabulary: Fixed TF-IDF vocabulary, like the one `used_vocabulary` returns.
+        one_hot_section: Whether the section is encoded as a sparse one-hot block
+            instead of an ordinal column. Either way unseen sections are encoded as
+            an "unknown" section rather than failing.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        vectorizer: str = "tfidf",
+        n_features: int = 2**16,
+        use_idf: bool = True,
+        dtype=np.float32,
+        feature_store: Optional[str] = None,
+        n_jobs: Optional[int] = None,
+        chunk_size: int = TRANSFORM_CHUNK_ROWS,
+        normalize: bool = False,
+        min_df: Union[int, float] = 1,
+        max_df: Union[int, float] = 1.0,
+        max_features: Optional[int] = None,
+        vocabulary: Optional[List[str]] = None,
+        one_hot_section: bool = False,
+    ):
+        if vectorizer not in VECTORIZERS:
+            raise ValueError(
+                "Unknown vectorizer `{}`! Available vectorizers: {}".format(
+                    vectorizer, ", ".join(VECTORIZERS)
+                )
+            )
+        self.vectorizer = vectorizer
+        self.n_features = n_features
+        self.use_idf = use_idf
+        self.dtype = dtype
+        self.feature_store = feature_store
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+        self.normalize = normalize
+        self.min_df = min_df
+        self.max_df = max_df
+        self.max_features = max_features
+        self.vocabulary = vocabulary
+        self.one_hot_section = one_hot_section
+        self.normalizer = TextNormalizer(key="article") if normalize else None
         self.text = Pipeline(
-            [
-                ("selector", TextSelector(key="article")),
-                ("tfidf", TfidfVectorizer(stop_words="english")),
-            ]
+            [("selector", TextSelector(key="article"))] + self._text_vectorizer_steps()
         )
         self.section = Pipeline(
             [
                 ("selector", TextSelector(key="section")),
-                ("encoder", CustomLabelEncoder()),
+                (
+                    "encoder",
+                    CustomLabelEncoder(one_hot=one_hot_section, dtype=dtype),
+                ),
             ]
         )
-        self.features = FeatureUnion(
-            [("article", self.text), ("section", self.section)]
-        )
+        transformers = [("article", self.text), ("section", self.section)]
+        if normalize:
+            transformers += [
+                (
+                    "read_minutes",
+                    Pipeline(
+                        [
+                            ("selector", TextSelector(key="read_minutes")),
+                            ("reshape", FunctionTransformer(to_column)),
+                        ]
+                    ),
+                ),
+                (
+                    "link_domain",
+                    Pipeline(
+                        [
+                            ("selector", TextSelector(key="link_domain")),
+                            ("reshape", FunctionTransformer(to_column)),
+                            (
+                                "encoder",
+                                OneHotEncoder(
+                                    handle_unknown="infrequent_if_exist",
+                                    min_frequency=LINK_DOMAIN_MIN_FREQUENCY,
+                                    dtype=dtype,
+                                ),
+                            ),
+                        ]
+                    ),
+                ),
+            ]
+        self.features = SparseFeatureUnion(transformers, dtype=dtype)
+
+    def _text_vectorizer_steps(self):
+        if self.vectorizer == "tfidf":
+            return [
+                (
+                    "tfidf",
+                    TfidfVectorizer(
+                        stop_words="english",
+                        min_df=self.min_df,
+                        max_df=self.max_df,
+                        max_features=self.max_features,
+                        vocabulary=self.vocabulary,
+                        dtype=self.dtype,
+                    ),
+                )
+            ]
+        # Without IDF the hashed counts are normalized right away, as TfidfVectorizer
+        # would; with it, TfidfTransformer normalizes after reweighting.
+        steps = [
+            (
+                "hashing",
+                HashingVectorizer(
+                    stop_words="english",
+                    n_features=self.n_features,
+                    alternate_sign=False,
+                    norm=None if self.use_idf else "l2",
+                    dtype=self.dtype,
+                ),
+            )
+        ]
+        if self.use_idf:
+            steps.append(("idf", TfidfTransformer()))
+        return steps
 
     def fit(self, X: DataFrame, y: ndarray = None):
         if X.empty:
             raise ValueError("Input DataFrame is empty!")
 
         try:
-            self.features.fit(X, y)
+            self.features.fit(self._normalize(X), y)
+            tfidf = self.text.named_steps.get("tfidf")
+            if hasattr(tfidf, "stop_words_"):
+                # The terms cut by the vocabulary budget are only kept for
+                # introspection, and would take as much room as the vocabulary.
+                del tfidf.stop_words_
+            # Computed on first use, it only matters with a feature store.
+            self.fingerprint_ = None
+            self.streamed_counts_ = None
         except Exception as e:
             logging.error(f"Error fitting data: {e}")
             raise e
 
         return self
 
+    def partial_fit(self, X: DataFrame, y: ndarray = None) -> "DataProcessor":
+        """
+        Fits the processor on one more chunk of rows, for corpora that don't fit in
+        memory.
+
+        Only the hashing vectorizer, which has no vocabulary, can be fitted this
+        way. The document frequencies of the hashed terms, the sections and the
+        link domain counts are accumulated over the chunks, and after each call the
+        processor transforms like one fitted on all of them at once.
+        """
+        if self.vectorizer != "hashing":
+            raise ValueError(
+                "Streaming fit needs the `hashing` vectorizer, got `{}`!".format(
+                    self.vectorizer
+                )
+            )
+        if X.empty:
+            raise ValueError("Input DataFrame is empty!")
+
+        try:
+            counts = getattr(self, "streamed_counts_", None)
+            if counts is None:
+                counts = {
+                    "documents": 0,
+                    "terms": np.zeros(self.n_features, dtype=np.int32),
+                    "sections": np.array([], dtype=object),
+                    "link_domains": pd.Series(dtype=np.int64),
+                }
+            X = self._normalize(X)
+            counts["documents"] += len(X)
+            if self.use_idf:
+                hashed = self.text.named_steps["hashing"].transform(
+                    self.text.named_steps["selector"].transform(X)
+                )
+                # The hashed CSR rows hold each term column once
+                counts["terms"] += np.bincount(
+                    hashed.indices, minlength=self.n_features
+                )
+            counts["sections"] = np.union1d(
+                counts["sections"], X["section"].unique().astype(object)
+            )
+            if self.normalize:
+                counts["link_domains"] = counts["link_domains"].add(
+                    X["link_domain"].value_counts(), fill_value=0
+                )
+            self.streamed_counts_ = counts
+            self._fit_streamed_counts(X)
+            self.fingerprint_ = None
+        except Exception as e:
+            logging.error(f"Error fitting data: {e}")
+            raise e
+
+        return self
+
+    def _fit_streamed_counts(self, X: DataFrame):
+        counts = self.streamed_counts_
+        idf = self.text.named_steps.get("idf")
+        if idf is not None:
+            # The smoothed IDF TfidfTransformer computes from the same frequencies
+            df = counts["terms"].astype(self.dtype) + 1
+            idf.idf_ = np.log((counts["documents"] + 1) / df) + 1
+            idf.n_features_in_ = self.n_features
+        self.section.named_steps["encoder"].fit(counts["sections"])
+        if self.normalize:
+            # Only whether a domain was seen `min_frequency` times matters
+            link_domains = counts["link_domains"]
+            repeats = np.minimum(link_domains.to_numpy(), LINK_DOMAIN_MIN_FREQUENCY)
+            self.features.named_transformers["link_domain"].fit(
+                DataFrame({"link_domain": np.repeat(link_domains.index, repeats)})
+            )
+            self.features.named_transformers["read_minutes"].fit(X)
+
     def transform(self, X: DataFrame) -> ndarray:
         try:
-            return self.features.transform(X)
+            feature_store = self._get_feature_store()
+            if feature_store is None or not set(FEATURE_COLUMNS) <= set(X.columns):
+                return self._transform_features(X)
+            return self._transform_with_store(X, feature_store)
         except Exception as e:
             logging.error(f"Error transforming data: {e}")
             raise e
@@ -80,3 +354,106 @@ class DataProcessor(BaseEstimator, TransformerMixin):
     def fit_transform(self, X: DataFrame, y: ndarray = None):
         self.fit(X, y)
         return self.transform(X)
+
+    def set_params(self, **params) -> "DataProcessor":
+        super().set_params(**params)
+        # The transformers are built from the parameters, so they are rebuilt unfitted.
+        self.__init__(**self.get_params(deep=False))
+        return self
+
+    def used_vocabulary(self, feature_indices: Sequence[int]) -> Optional[List[str]]:
+        """
+        Maps output columns, like the ones a model uses, to their TF-IDF terms.
+
+        Args:
+            feature_indices: Indices of columns of the `transform` output.
+
+        Returns:
+            The terms of the article columns among them, in vocabulary order, or
+            None for the hashing vectorizer, which has no vocabulary.
+        """
+        tfidf = self.text.named_steps.get("tfidf")
+        if tfidf is None:
+            return None
+        terms = tfidf.get_feature_names_out()
+        feature_indices = np.unique(np.asarray(feature_indices, dtype=int))
+        return terms[feature_indices[feature_indices < len(terms)]].tolist()
+
+    def out_of_vocabulary_rate(self, X: DataFrame) -> float:
+        """
+        Share of the article terms missing from the fitted TF-IDF vocabulary.
+
+        The terms are the ones the vectorizer would count, normalized and without
+        the stop words. Compared with the rate of the training articles, it tells
+        how far new articles drifted from the vocabulary. Always 0 for the hashing
+        vectorizer, which has no vocabulary.
+        """
+        tfidf = self.text.named_steps.get("tfidf")
+        if tfidf is None:
+            return 0.0
+        analyzer = tfidf.build_analyzer()
+        texts = self.text.named_steps["selector"].transform(self._normalize(X))
+        n_terms = n_missing = 0
+        for text in texts:
+            terms = analyzer(text)
+            n_terms += len(terms)
+            n_missing += sum(term not in tfidf.vocabulary_ for term in terms)
+        return n_missing / n_terms if n_terms else 0.0
+
+    def _normalize(self, X: DataFrame) -> DataFrame:
+        return X if self.normalizer is None else self.normalizer.transform(X)
+
+    def _featurize(self, X: DataFrame):
+        return self.features.transform(self._normalize(X))
+
+    def _fingerprint(self) -> str:
+        return joblib.hash([self.normalizer, self.features])
+
+    def _transform_features(self, X: DataFrame):
+        if self.n_jobs in (None, 1) or len(X) <= self.chunk_size:
+            return self._featurize(X)
+        # Rows are featurized independently with the fitted vocabulary, so the
+        # stacked chunks are the same as transforming all the rows at once.
+        chunks = Parallel(n_jobs=self.n_jobs, backend="loky")(
+            delayed(self._featurize)(X.iloc[start : start + self.chunk_size])
+            for start in range(0, len(X), self.chunk_size)
+        )
+        return sparse.vstack(chunks, format="csr")
+
+    def _get_feature_store(self) -> Optional[FeatureStore]:
+        uri = self.feature_store or FEATURE_STORE_URI
+        if not uri:
+            return None
+        if getattr(self, "_feature_store_uri", None) != uri:
+            self._feature_store_instance = FeatureStore.from_uri(uri)
+            self._feature_store_uri = uri
+        return self._feature_store_instance
+
+    def _transform_with_store(self, X: DataFrame, feature_store: FeatureStore):
+        if getattr(self, "fingerprint_", None) is None:
+            self.fingerprint_ = self._fingerprint()
+        keys = hash_rows(X, FEATURE_COLUMNS)
+        found, stored = feature_store.lookup(self.fingerprint_, keys)
+        if found.all():
+            return stored
+
+        missing = np.flatnonzero(~found)
+        computed = self._transform_features(X.iloc[missing])
+        feature_store.save(self.fingerprint_, keys[missing], computed)
+        if stored is None:
+            return computed
+        # Put the stored and the computed rows back in the order of X
+        order = np.argsort(np.concatenate([np.flatnonzero(found), missing]))
+        return sparse.vstack([stored, computed], format="csr")[order]
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        # The store holds storage clients, it is recreated from its URI.
+        state.pop("_feature_store_instance", None)
+        state.pop("_feature_store_uri", None)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in PICKLED_DEFAULTS.items():
+            state.setdefault(name, value)
+        super().__setstate__(state)
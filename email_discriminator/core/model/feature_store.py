@@ -0,0 +1,236 @@
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+from rich.logging import RichHandler
+from scipy import sparse
+
+from email_discriminator.core.data_versioning.storage_backend import (
+    StorageBackend,
+    storage_backend_from_uri,
+)
+
+LOGGER_LEVEL = os.getenv("LOGGER_LEVEL", "WARNING")
+logging.basicConfig(level=LOGGER_LEVEL, format="%(message)s", handlers=[RichHandler()])
+logger = logging.getLogger("FeatureStore")
+FEATURE_STORE_CACHE_DIR = os.getenv(
+    "FEATURE_STORE_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "email-discriminator-features"),
+)
+# The keys are written last, so a segment with keys is complete.
+SEGMENT_ARRAYS = ["data", "indices", "indptr", "shape", "keys"]
+
+
+class Segment:
+    """
+    A batch of stored feature rows: a memory-mapped CSR matrix and the row keys.
+    """
+
+    def __init__(self, path: str):
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in SEGMENT_ARRAYS
+        }
+        self.keys = arrays["keys"]
+        self.matrix = sparse.csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]),
+            shape=tuple(arrays["shape"]),
+            copy=False,
+        )
+
+
+class FeatureStore:
+    """
+    Store of transformed feature rows, keyed by row content hash.
+
+    Rows are grouped by the fingerprint of the fitted processor that produced them.
+    Each `save` writes a segment of CSR `data`, `indices` and `indptr` arrays plus
+    the row keys as .npy files, which `lookup` memory-maps, so stored rows are read
+    by slicing instead of loading whole segments.
+
+    Segments live in a local directory. With a storage backend they are also
+    uploaded under `prefix` in the bucket and downloaded to the local directory,
+    which acts as a cache. The bucket is listed once per fingerprint, on its first
+    lookup, so segments other processes store afterwards are only seen by new
+    stores.
+
+    A processor refitted on other rows, like each CV fold, has another fingerprint,
+    so stored rows are only reused by the same fitted processor, e.g. when it
+    transforms the same rows again or is loaded for predictions.
+
+    Args:
+        root: Local directory of the segments.
+        backend: Optional bucket the segments are shared through.
+        prefix: Path of the segments in the bucket.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        backend: Optional[StorageBackend] = None,
+        prefix: str = "features/",
+    ):
+        self.root = root
+        self.backend = backend
+        self.prefix = prefix
+        self._segments: Dict[str, Dict[str, Segment]] = {}
+        self._indexes: Dict[str, Tuple[pd.Index, np.ndarray, np.ndarray, List]] = {}
+        self._synced: Set[str] = set()
+
+    @classmethod
+    def from_uri(cls, uri: str, cache_dir: str = FEATURE_STORE_CACHE_DIR):
+        """
+        Creates a feature store from a URI.
+
+        "gs://<bucket>" and "memory://<bucket>" share the segments through a bucket,
+        cached in `cache_dir`. "file://<path>" or a plain path stores them in a
+        local directory.
+        """
+        if uri.startswith(("gs://", "memory://")):
+            backend = storage_backend_from_uri(uri)
+            return cls(os.path.join(cache_dir, backend.bucket_name), backend=backend)
+        return cls(uri[len("file://") :] if uri.startswith("file://") else uri)
+
+    def _local_segments(self, fingerprint: str) -> List[str]:
+        fingerprint_dir = os.path.join(self.root, fingerprint)
+        if not os.path.isdir(fingerprint_dir):
+            return []
+        return [
+            name for name in os.listdir(fingerprint_dir) if not name.startswith(".")
+        ]
+
+    def _sync(self, fingerprint: str) -> None:
+        stored_objects = self.backend.list_objects(f"{self.prefix}{fingerprint}/")
+        remote_segments = {
+            stored_object.name.split("/")[-2]
+            for stored_object in stored_objects
+            if stored_object.name.endswith("/keys.npy")
+        }
+        for segment in remote_segments - set(self._local_segments(fingerprint)):
+            logger.info(f"Downloading feature segment {fingerprint}/{segment}...")
+            tmp_dir = self._tmp_dir(fingerprint)
+            for name in SEGMENT_ARRAYS:
+                data, _ = self.backend.download(
+                    f"{self.prefix}{fingerprint}/{segment}/{name}.npy"
+                )
+                with open(os.path.join(tmp_dir, f"{name}.npy"), "wb") as f:
+                    f.write(data)
+            self._commit(tmp_dir, fingerprint, segment)
+
+    def _tmp_dir(self, fingerprint: str) -> str:
+        tmp_dir = os.path.join(self.root, fingerprint, f".{uuid.uuid4().hex}.tmp")
+        os.makedirs(tmp_dir)
+        return tmp_dir
+
+    def _commit(self, tmp_dir: str, fingerprint: str, segment: str) -> None:
+        try:
+            os.rename(tmp_dir, os.path.join(self.root, fingerprint, segment))
+        except OSError:
+            # Another process stored the same segment first.
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _load(self, fingerprint: str) -> Dict[str, Segment]:
+        if self.backend is not None and fingerprint not in self._synced:
+            self._sync(fingerprint)
+            self._synced.add(fingerprint)
+        segments = self._segments.setdefault(fingerprint, {})
+        new_segments = [
+            segment
+            for segment in self._local_segments(fingerprint)
+            if segment not in segments
+        ]
+        for segment in new_segments:
+            segments[segment] = Segment(os.path.join(self.root, fingerprint, segment))
+        if new_segments or fingerprint not in self._indexes:
+            self._indexes[fingerprint] = self._build_index(segments)
+        return segments
+
+    @staticmethod
+    def _build_index(segments: Dict[str, Segment]):
+        names = list(segments)
+        keys = [segments[name].keys for name in names]
+        all_keys = np.concatenate(keys) if keys else np.array([], dtype=np.uint64)
+        segment_ids = np.repeat(np.arange(len(names)), [len(k) for k in keys])
+        rows = np.concatenate([np.arange(len(k)) for k in keys]) if keys else all_keys
+        index = pd.Index(all_keys)
+        unique = ~index.duplicated()
+        return index[unique], segment_ids[unique], rows[unique], names
+
+    def lookup(
+        self, fingerprint: str, keys: np.ndarray
+    ) -> Tuple[np.ndarray, Optional[sparse.csr_matrix]]:
+        """
+        Looks up stored feature rows.
+
+        Args:
+            fingerprint: Fingerprint of the fitted processor.
+            keys: Row keys to look up.
+
+        Returns:
+            A boolean mask of the keys found, and the CSR matrix of their rows in
+            the order of `keys`, or None if no key was found.
+        """
+        segments = self._load(fingerprint)
+        index, segment_ids, rows, names = self._indexes[fingerprint]
+        positions = index.get_indexer(keys)
+        found = positions >= 0
+        if not found.any():
+            return found, None
+
+        found_segment_ids = segment_ids[positions[found]]
+        found_rows = rows[positions[found]]
+        blocks, order = [], []
+        for segment_id in np.unique(found_segment_ids):
+            selected = np.flatnonzero(found_segment_ids == segment_id)
+            blocks.append(segments[names[segment_id]].matrix[found_rows[selected]])
+            order.append(selected)
+        matrix = sparse.vstack(blocks, format="csr")
+        matrix = matrix[np.argsort(np.concatenate(order))]
+        logger.info(f"Loaded {found.sum()} of {len(keys)} feature rows from the store.")
+        return found, matrix
+
+    def save(
+        self, fingerprint: str, keys: np.ndarray, matrix: sparse.spmatrix
+    ) -> Optional[str]:
+        """
+        Stores feature rows as a new segment.
+
+        Args:
+            fingerprint: Fingerprint of the fitted processor.
+            keys: Row keys, one per row of `matrix`.
+            matrix: The feature rows.
+
+        Returns:
+            The name of the segment, or None if there were no rows.
+        """
+        keys, first_rows = np.unique(
+            np.asarray(keys, dtype=np.uint64), return_index=True
+        )
+        if len(keys) == 0:
+            return None
+        matrix = sparse.csr_matrix(matrix)[first_rows]
+        segment = uuid.uuid4().hex
+        tmp_dir = self._tmp_dir(fingerprint)
+        arrays = {
+            "data": matrix.data,
+            "indices": matrix.indices,
+            "indptr": matrix.indptr,
+            "shape": np.array(matrix.shape),
+            "keys": keys,
+        }
+        for name in SEGMENT_ARRAYS:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), arrays[name])
+        if self.backend is not None:
+            for name in SEGMENT_ARRAYS:
+                with open(os.path.join(tmp_dir, f"{name}.npy"), "rb") as f:
+                    self.backend.upload(
+                        f"{self.prefix}{fingerprint}/{segment}/{name}.npy", f.read()
+                    )
+        self._commit(tmp_dir, fingerprint, segment)
+        logger.info(f"Stored {len(keys)} feature rows in segment {segment}.")
+        return segment
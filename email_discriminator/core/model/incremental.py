@@ -0,0 +1,77 @@
+import copy
+import logging
+import os
+from typing import Optional
+
+import numpy as np
+from numpy import ndarray
+from pandas import DataFrame
+from rich.logging import RichHandler
+
+LOGGER_LEVEL = os.getenv("LOGGER_LEVEL", "WARNING")
+logging.basicConfig(level=LOGGER_LEVEL, format="%(message)s", handlers=[RichHandler()])
+logger = logging.getLogger("Incremental")
+
+
+def warm_start_pipeline(
+    pipeline,
+    X: DataFrame,
+    y: ndarray,
+    n_estimators: int,
+    X_calibration: Optional[DataFrame] = None,
+    y_calibration: Optional[ndarray] = None,
+):
+    """
+    Continues training a fitted pipeline on new rows only.
+
+    The fitted DataProcessor is reused as is, so the vocabulary is frozen and the
+    new rows get the columns the booster was trained on. They are resampled by the
+    pipeline or the model sampler, if any, and `n_estimators` trees are boosted on
+    all of them on top of the trees the model predicts with, without early
+    stopping. The threshold is re-tuned on the calibration rows if given, which the
+    pipeline must not have been trained on, and kept otherwise. The new rows must
+    hold every class, or the booster would forget the missing ones.
+
+    Args:
+        pipeline: Fitted pipeline with `features` and XGBoost `model` steps, and
+            optionally a `sampling` step.
+        X: New rows.
+        y: Labels of the new rows.
+        n_estimators: Number of trees to add.
+        X_calibration: Rows to re-tune the threshold on.
+        y_calibration: Labels of the calibration rows.
+
+    Returns:
+        A warm started copy of the pipeline.
+    """
+    classes = pipeline.named_steps["model"].classes_
+    if not np.isin(classes, y).all():
+        raise ValueError(
+            "Warm start needs rows of every class! Classes: {}, got: {}".format(
+                ", ".join(map(str, classes)), ", ".join(map(str, np.unique(y)))
+            )
+        )
+    warm = copy.deepcopy(pipeline)
+    model = warm.named_steps["model"]
+    booster = model.warm_start_booster()
+    features = warm.named_steps["features"].transform(X)
+    sampler = warm.named_steps.get("sampling")
+    if sampler is not None:
+        features, y = sampler.fit_resample(features, y)
+    thresholds = model.thresholds
+    model.set_params(
+        n_estimators=n_estimators,
+        early_stopping_rounds=None,
+        thresholds=[model.threshold],
+    )
+    model.fit(features, y, xgb_model=booster)
+    model.set_params(thresholds=thresholds)
+    if X_calibration is not None:
+        model.calibrate(
+            warm.named_steps["features"].transform(X_calibration), y_calibration
+        )
+    logger.info(
+        f"Boosted {n_estimators} trees on {len(X)} new rows, "
+        f"{model.model.get_booster().num_boosted_rounds()} trees in total"
+    )
+    return warm
@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import pickle
+from typing import List, Optional, Tuple
+
+import numpy as np
+import xgboost as xgb
+from numpy import ndarray
+from pandas import DataFrame
+from rich.logging import RichHandler
+from xgboost import XGBModel
+
+from email_discriminator.core.model.data_processor import DataProcessor
+from email_discriminator.core.model.model import is_logistic, linear_proba
+
+LOGGER_LEVEL = os.getenv("LOGGER_LEVEL", "WARNING")
+logging.basicConfig(level=LOGGER_LEVEL, format="%(message)s", handlers=[RichHandler()])
+logger = logging.getLogger("InferenceBundle")
+# Run artifact path the train flow logs the bundle under
+INFERENCE_BUNDLE_ARTIFACT = "inference_bundle"
+BUNDLE_FORMAT_VERSION = 1
+BOOSTER_FILE = "booster.ubj"
+LINEAR_FILE = "linear.npz"
+FEATURES_FILE = "features.pkl"
+METADATA_FILE = "bundle.json"
+
+
+class InferenceBundle:
+    """
+    The parts of a trained pipeline needed to score articles, stored without it.
+
+    An XGBoost booster is saved in its native UBJSON format, the coefficients of a
+    logistic regression as NumPy arrays, the fitted DataProcessor, whose
+    vocabulary and IDF weights are the only other learned state, pickled, and the
+    threshold, classes and trees to use as JSON. Loading it needs neither MLflow
+    nor imblearn, and skips the oversampler and the scikit-learn wrappers of the
+    model.
+
+    Args:
+        features: Fitted DataProcessor of the pipeline.
+        booster: Booster of an XGBoost pipeline model.
+        threshold: Probability threshold of the positive class.
+        classes: Class labels, negative first.
+        iteration_range: Trees to predict with, all of them if (0, 0).
+        coef: Coefficients of a logistic regression pipeline model, instead of a
+            booster.
+        intercept: Intercept of the logistic regression.
+    """
+
+    def __init__(
+        self,
+        features: DataProcessor,
+        booster: Optional[xgb.Booster],
+        threshold: float,
+        classes: List,
+        iteration_range: Tuple[int, int] = (0, 0),
+        coef: Optional[ndarray] = None,
+        intercept: float = 0.0,
+    ):
+        self.features = features
+        self.booster = booster
+        self.threshold = threshold
+        self.classes = classes
+        self.iteration_range = tuple(iteration_range)
+        self.coef = coef
+        self.intercept = intercept
+
+    @classmethod
+    def from_pipeline(cls, pipeline) -> "InferenceBundle":
+        """
+        Extracts the bundle from a fitted pipeline with `features` and `model` steps.
+        """
+        model = pipeline.named_steps["model"]
+        params = {
+            "features": pipeline.named_steps["features"],
+            "threshold": float(model.threshold),
+            "classes": np.asarray(model.classes_).tolist(),
+        }
+        if isinstance(model.model, XGBModel):
+            return cls(
+                **params,
+                booster=model.model.get_booster(),
+                iteration_range=model.iteration_range,
+            )
+        if is_logistic(model.model):
+            return cls(
+                **params,
+                booster=None,
+                coef=model.model.coef_[0],
+                intercept=float(model.model.intercept_[0]),
+            )
+        raise ValueError(
+            "Inference bundles need an XGBoost or logistic model, got `{}`!".format(
+                type(model.model).__name__
+            )
+        )
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        if self.booster is not None:
+            self.booster.save_model(os.path.join(path, BOOSTER_FILE))
+        else:
+            np.savez(
+                os.path.join(path, LINEAR_FILE),
+                coef=self.coef,
+                intercept=self.intercept,
+            )
+        # joblib's unpickler is several times slower on the vocabulary dict
+        with open(os.path.join(path, FEATURES_FILE), "wb") as f:
+            pickle.dump(self.features, f, protocol=pickle.HIGHEST_PROTOCOL)
+        metadata = {
+            "format_version": BUNDLE_FORMAT_VERSION,
+            "backend": "xgboost" if self.booster is not None else "linear",
+            "threshold": self.threshold,
+            "classes": self.classes,
+            "iteration_range": list(self.iteration_range),
+        }
+        with open(os.path.join(path, METADATA_FILE), "w") as f:
+            json.dump(metadata, f)
+        logger.info(f"Saved inference bundle to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "InferenceBundle":
+        with open(os.path.join(path, METADATA_FILE)) as f:
+            metadata = json.load(f)
+        if metadata["format_version"] != BUNDLE_FORMAT_VERSION:
+            raise ValueError(
+                "Unsupported inference bundle format `{}`! Supported formats: {}".format(
+                    metadata["format_version"], BUNDLE_FORMAT_VERSION
+                )
+            )
+        with open(os.path.join(path, FEATURES_FILE), "rb") as f:
+            features = pickle.load(f)
+        params = {
+            "features": features,
+            "booster": None,
+            "threshold": metadata["threshold"],
+            "classes": metadata["classes"],
+            "iteration_range": metadata["iteration_range"],
+        }
+        if metadata.get("backend", "xgboost") == "xgboost":
+            params["booster"] = xgb.Booster()
+            params["booster"].load_model(os.path.join(path, BOOSTER_FILE))
+        else:
+            with np.load(os.path.join(path, LINEAR_FILE)) as arrays:
+                params["coef"] = arrays["coef"]
+                params["intercept"] = float(arrays["intercept"])
+        return cls(**params)
+
+    def predict_proba(self, X: DataFrame) -> ndarray:
+        features = self.features.transform(X)
+        if self.booster is not None:
+            # The CSR features are read in place, without building a DMatrix
+            y_proba_pos = self.booster.inplace_predict(
+                features, iteration_range=self.iteration_range
+            )
+        else:
+            y_proba_pos = linear_proba(features, self.coef, self.intercept)
+        return np.column_stack([1 - y_proba_pos, y_proba_pos])
+
+    def predict(self, X: DataFrame) -> ndarray:
+        y_proba_pos = self.predict_proba(X)[:, 1]
+        return np.asarray(self.classes)[(y_proba_pos >= self.threshold).astype(int)]
@@ -1,10 +1,14 @@
 import logging
 import os
 
+import numpy as np
+import pandas as pd
 from numpy import ndarray
 from rich.logging import RichHandler
+from scipy import sparse
 from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.preprocessing import LabelEncoder
+from sklearn.utils.validation import check_is_fitted
 
 LOGGER_LEVEL = os.getenv("LOGGER_LEVEL", "WARNING")
 logging.basicConfig(level=LOGGER_LEVEL, format="%(message)s", handlers=[RichHandler()])
@@ -14,22 +18,54 @@ logger = logging.getLogger("LabelEncoder")
 class CustomLabelEncoder(BaseEstimator, TransformerMixin):
     """
     Custom LabelEncoder that extends BaseEstimator and TransformerMixin.
+
+    Labels are looked up in a hash index of the fitted classes, and labels unseen
+    during fit are encoded as an extra "unknown" class, `len(classes)`, instead of
+    raising, so new newsletter sections can still be predicted.
+
+    Args:
+        one_hot: Whether to output a sparse one-hot matrix, with a last column for
+            the unknown labels, instead of a column of codes.
+        dtype: Data type of the one-hot matrix.
     """
 
-    def __init__(self):
+    def __init__(self, one_hot: bool = False, dtype=np.float32):
+        self.one_hot = one_hot
+        self.dtype = dtype
         self.encoder = LabelEncoder()
 
     def fit(self, X: ndarray, y: ndarray = None) -> "CustomLabelEncoder":
         try:
             self.encoder.fit(X)
+            self.index_ = pd.Index(self.encoder.classes_)
             return self
         except Exception as e:
             logging.error(f"Error fitting data: {e}")
             raise e
 
-    def transform(self, X: ndarray) -> ndarray:
+    def transform(self, X: ndarray):
         try:
-            return self.encoder.transform(X).reshape(-1, 1)
+            check_is_fitted(self.encoder)
+            codes = self._get_index().get_indexer(np.asarray(X).ravel())
+            n_classes = len(self.encoder.classes_)
+            codes[codes == -1] = n_classes
+            if not getattr(self, "one_hot", False):
+                return codes.reshape(-1, 1)
+            # One non-zero per row, built from the codes without a dense copy
+            return sparse.csr_matrix(
+                (
+                    np.ones(len(codes), dtype=self.dtype),
+                    codes,
+                    np.arange(len(codes) + 1),
+                ),
+                shape=(len(codes), n_classes + 1),
+            )
         except Exception as e:
             logging.error(f"Error transforming data: {e}")
             raise e
+
+    def _get_index(self) -> pd.Index:
+        # Encoders pickled before the index existed build it on first use.
+        if getattr(self, "index_", None) is None:
+            self.index_ = pd.Index(self.encoder.classes_)
+        return self.index_
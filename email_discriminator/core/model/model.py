@@ -1,49 +1,379 @@
 import logging
 import os
+from typing import Callable, Iterable, Optional, Tuple
 
 import numpy as np
+import xgboost as xgb
 from numpy import ndarray
 from rich.logging import RichHandler
+from scipy.special import expit
 from sklearn.base import BaseEstimator, ClassifierMixin
 from sklearn.exceptions import NotFittedError
-from sklearn.metrics import f1_score, recall_score
-from xgboost import XGBClassifier
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.model_selection import train_test_split
+from xgboost import XGBClassifier, XGBModel
 
 LOGGER_LEVEL = os.getenv("LOGGER_LEVEL", "WARNING")
 logging.basicConfig(level=LOGGER_LEVEL, format="%(message)s", handlers=[RichHandler()])
 logger = logging.getLogger("DataPreprocessor")
+CALIBRATIONS = ["train", "validation"]
+BACKENDS = ["xgboost", "logistic", "sgd"]
+# Parameters of models pickled before they existed, set as they behaved then
+PICKLED_DEFAULTS = {
+    "backend": "xgboost",
+    "tree_method": None,
+    "n_jobs": None,
+    "early_stopping_rounds": None,
+    "validation_fraction": 0.1,
+    "calibration": "train",
+    "sampler": None,
+}
+
+
+def make_backend_model(backend: str):
+    """
+    Builds the unfitted classifier of a Model backend.
+    """
+    if backend == "logistic":
+        return LogisticRegression(max_iter=1000)
+    if backend == "sgd":
+        # The log loss makes it a logistic regression with probabilities
+        return SGDClassifier(loss="log_loss", random_state=42)
+    return XGBClassifier(eval_metric="logloss")
+
+
+def is_logistic(model) -> bool:
+    """
+    Whether a model is a binary logistic regression, scored as `linear_proba`.
+    """
+    if isinstance(model, SGDClassifier):
+        return model.loss == "log_loss"
+    return isinstance(model, LogisticRegression)
+
+
+def linear_proba(X, coef: ndarray, intercept: float) -> ndarray:
+    """
+    Positive class probabilities of a binary logistic regression on CSR or dense rows.
+    """
+    # In float64 like scikit-learn, the coefficients of float32 rows are float32
+    return expit(X @ np.asarray(coef, dtype=np.float64) + intercept)
+
+
+def _divide(numerator: ndarray, denominator: ndarray) -> ndarray:
+    # Ill-defined scores are 0, like scikit-learn's default zero_division
+    return np.divide(
+        numerator,
+        denominator,
+        out=np.zeros(len(numerator)),
+        where=denominator != 0,
+    )
+
+
+def _f1(tp: ndarray, fp: ndarray, fn: ndarray) -> ndarray:
+    # Same operations as sklearn.metrics.f1_score, so the scores are identical
+    precision = _divide(tp, tp + fp)
+    recall = _divide(tp, tp + fn)
+    denominator = precision + recall
+    mask = np.isclose(denominator, 0) | np.isclose(2 * tp + fp + fn, 0)
+    denominator[mask] = 1
+    f1 = 2.0 * precision * recall / denominator
+    f1[mask] = 0
+    return f1
+
+
+def threshold_scores(y: ndarray, y_proba_pos: ndarray, thresholds: ndarray):
+    """
+    Scores the predictions `y_proba_pos >= threshold` for all the thresholds at once.
+
+    Counts the predicted positives at each threshold with a binary search in the
+    sorted probabilities, instead of scoring one prediction array per threshold.
+
+    Args:
+        y: Binary labels.
+        y_proba_pos: Probabilities of the positive class.
+        thresholds: Thresholds to score.
+
+    Returns:
+        The positive class recall and the lowest per class F1 score, over the
+        classes in the labels or the predictions, of each threshold.
+    """
+    y_positive = np.asarray(y) == 1
+    y_proba_pos = np.asarray(y_proba_pos)
+    thresholds = np.asarray(thresholds)
+    n_positives = y_positive.sum()
+    n_negatives = len(y_positive) - n_positives
+
+    def count_at_least(values: ndarray) -> ndarray:
+        return len(values) - np.searchsorted(np.sort(values), thresholds, "left")
+
+    predicted_positives = count_at_least(y_proba_pos)
+    tp = count_at_least(y_proba_pos[y_positive])
+    fp = predicted_positives - tp
+    fn = n_positives - tp
+    tn = n_negatives - fp
+
+    recall = _divide(tp, np.full(len(tp), n_positives))
+    f1_positive = np.where(
+        n_positives + predicted_positives > 0, _f1(tp, fp, fn), np.inf
+    )
+    f1_negative = np.where(
+        n_negatives + len(y_positive) - predicted_positives > 0,
+        _f1(tn, fn, fp),
+        np.inf,
+    )
+    return recall, np.minimum(f1_positive, f1_negative)
+
+
+class BatchIterator(xgb.DataIter):
+    """
+    XGBoost data iterator over the (features, labels) batches of a callable.
+
+    XGBoost iterates the batches once to write them to its cache files, so only one
+    batch is held in memory at a time.
+
+    Args:
+        batches: Returns a new iterable over the batches on each call.
+        cache_prefix: Path prefix of the XGBoost cache files.
+    """
+
+    def __init__(
+        self, batches: Callable[[], Iterable[Tuple]], cache_prefix: Optional[str]
+    ):
+        self.batches = batches
+        self._iterator = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data: Callable) -> int:
+        if self._iterator is None:
+            self._iterator = iter(self.batches())
+        batch = next(self._iterator, None)
+        if batch is None:
+            return 0
+        X, y = batch
+        input_data(data=X, label=y)
+        return 1
+
+    def reset(self):
+        self._iterator = None
 
 
 class Model(BaseEstimator, ClassifierMixin):
     """
     Classifier model to fit and predict input data.
+
+    The engine parameters configure XGBoost models. Parameters of the wrapped model,
+    like `n_estimators`, can be set through `set_params` as well.
+
+    Args:
+        model: Classifier to wrap, built from `backend` if None.
+        thresholds: Candidate thresholds, the ones with all the F1 scores above
+            `min_f1` and the highest recall is picked. 0 to 0.99 by 0.01 if None.
+        backend: "xgboost" for a gradient boosted trees ensemble, or "logistic" and
+            "sgd" for a sparse logistic regression, fitted by L-BFGS or stochastic
+            gradient descent, which is smaller and faster to score.
+        tree_method: XGBoost tree construction algorithm, its own choice if None.
+            "hist" bins the features once, which pays off on large dense data, but
+            not on the few thousand sparse TF-IDF rows of the articles.
+        n_jobs: Number of XGBoost threads, all the cores if None. When the model is
+            fitted by parallel cross validation jobs, their product should not
+            exceed the number of cores.
+        early_stopping_rounds: If set, `validation_fraction` of the training rows
+            are held out and boosting stops when their log loss has not improved
+            for this many rounds, so `n_estimators` is only a cap.
+        sampler: Resampler of the training rows, like a RandomOverSampler. The
+            validation rows are held out before it, so none of their duplicates
+            are trained on, unlike with a sampler step ahead of the model.
+        validation_fraction: Proportion of the rows held out for early stopping and
+            the validation calibration.
+        calibration: Rows the threshold is tuned on. "train" scores all the
+            training rows once more after fitting. "validation" only scores the
+            held-out rows, the early stopping ones if any, which costs a fraction of
+            the training pass and is not biased by the model fitting its own rows,
+            but trains on fewer rows. It falls back to "train" when the rows are
+            too few to hold out a stratified split.
     """
 
     def __init__(
-        self, model=None, threshold=0.5, thresholds=np.arange(0, 1, 0.01), min_f1=0.75
+        self,
+        model=None,
+        threshold=0.5,
+        thresholds=None,
+        min_f1=0.75,
+        tree_method=None,
+        n_jobs=None,
+        early_stopping_rounds=None,
+        validation_fraction=0.1,
+        calibration="train",
+        backend="xgboost",
+        sampler=None,
     ):
-        self.model = (
-            model if model is not None else XGBClassifier(eval_metric="logloss")
-        )
+        if backend not in BACKENDS:
+            raise ValueError(
+                "Unknown backend `{}`! Available backends: {}".format(
+                    backend, ", ".join(BACKENDS)
+                )
+            )
+        if calibration not in CALIBRATIONS:
+            raise ValueError(
+                "Unknown calibration `{}`! Available calibrations: {}".format(
+                    calibration, ", ".join(CALIBRATIONS)
+                )
+            )
+        self.model = model if model is not None else make_backend_model(backend)
+        self.backend = backend
         self.threshold = threshold
         self.thresholds = thresholds
         self.min_f1 = min_f1
+        self.tree_method = tree_method
+        self.n_jobs = n_jobs
+        self.early_stopping_rounds = early_stopping_rounds
+        self.validation_fraction = validation_fraction
+        self.calibration = calibration
+        self.sampler = sampler
         self.fitted = False
 
-    def fit(self, X: ndarray, y: ndarray):
+    def fit(self, X: ndarray, y: ndarray, xgb_model: Optional[xgb.Booster] = None):
+        """
+        Fits the model and tunes its threshold.
+
+        Args:
+            X: Features of the rows.
+            y: Labels of the rows.
+            xgb_model: Booster to continue boosting from, like the `warm_start_booster`
+                of a trained model, instead of training from scratch. The rows must
+                have the same features.
+        """
         try:
-            self.model.fit(X, y)
+            if xgb_model is not None:
+                self._check_warm_start()
+            validation = self._fit_model(X, y, xgb_model)
             # Find the best threshold for recall
-            if len(self.thresholds) > 1:
-                y_proba_pos = self.model.predict_proba(X)[:, 1]
-                best_recall = 0
-                for threshold in self.thresholds:
-                    y_pred = (y_proba_pos >= threshold).astype(int)
-                    f1 = f1_score(y, y_pred, average=None)
-                    recall = recall_score(y, y_pred, pos_label=1)
-                    if recall > best_recall and min(f1) > self.min_f1:
-                        self.threshold = threshold
-                        best_recall = recall
+            if len(self._thresholds()) > 1:
+                X_calibration, y_calibration = (
+                    validation
+                    if self.calibration == "validation" and validation is not None
+                    else (X, y)
+                )
+                y_proba_pos = self.model.predict_proba(X_calibration)[:, 1]
+                self._tune_threshold(y_calibration, y_proba_pos)
+            self.fitted = True
+        except Exception as e:
+            logging.error(f"Error fitting the model: {e}")
+            raise e
+
+    def calibrate(self, X: ndarray, y: ndarray):
+        """
+        Tunes the threshold of the fitted model on rows it wasn't trained on.
+        """
+        if not self.fitted:
+            raise NotFittedError(
+                "Model instance is not fitted yet. Call 'fit' with appropriate arguments before using this method."
+            )
+        self._tune_threshold(y, self.model.predict_proba(X)[:, 1])
+        return self
+
+    def fit_batches(
+        self,
+        batches: Callable[[], Iterable[Tuple]],
+        cache_prefix: str,
+        validation_batches: Optional[Callable[[], Iterable[Tuple]]] = None,
+    ):
+        """
+        Fits the XGBoost model on batches of rows streamed through external memory.
+
+        The batches are written to XGBoost cache files and trained on from there,
+        so the rows don't have to fit in memory. With `early_stopping_rounds`,
+        boosting stops early on the validation batches, written to their own cache
+        files, and runs for `n_estimators` rounds otherwise. The threshold is then
+        tuned on the validation batches with the "validation" calibration, and on
+        the training batches, streamed once more, with the "train" one. Without
+        validation batches, early stopping is turned off and the threshold is tuned
+        on the training batches, as `fit` does on rows too few to split. The rows
+        can't be resampled in external memory, so a `sampler` is refused. The
+        "exact" tree method can't train from external memory, "hist" is used unless
+        another one is set.
+
+        Args:
+            batches: Returns a new iterable over (features, labels) batches on each
+                call.
+            cache_prefix: Path prefix of the XGBoost cache files.
+            validation_batches: Returns a new iterable over held-out (features,
+                labels) batches on each call.
+        """
+        if not isinstance(self.model, XGBClassifier):
+            raise ValueError(
+                "Out-of-core training needs an XGBoost model, got `{}`!".format(
+                    type(self.model).__name__
+                )
+            )
+        if self.sampler is not None:
+            raise ValueError(
+                "Out-of-core training can't resample the rows, got sampler `{}`! "
+                "Weight the classes with `scale_pos_weight` instead.".format(
+                    type(self.sampler).__name__
+                )
+            )
+        needs_validation = self.calibration == "validation" or bool(
+            self.early_stopping_rounds
+        )
+        if needs_validation and validation_batches is None:
+            logger.warning(
+                "No validation batches, training without early stopping and "
+                "calibrating on the training batches"
+            )
+        try:
+            # XGBoost's own choice for external memory is "approx", which
+            # takes twice the time and memory of "hist" on the hashed articles
+            tree_method = self.tree_method
+            if tree_method in (None, "auto"):
+                tree_method = "hist"
+            self.model.set_params(
+                tree_method=tree_method, n_jobs=self.n_jobs, early_stopping_rounds=None
+            )
+            params = {
+                key: value
+                for key, value in self.model.get_xgb_params().items()
+                if value is not None
+            }
+            data = xgb.DMatrix(BatchIterator(batches, cache_prefix))
+            train_params = {}
+            if self.early_stopping_rounds and validation_batches is not None:
+                validation = xgb.DMatrix(
+                    BatchIterator(validation_batches, f"{cache_prefix}-validation")
+                )
+                train_params = {
+                    "evals": [(validation, "validation")],
+                    "early_stopping_rounds": self.early_stopping_rounds,
+                    "verbose_eval": False,
+                }
+            booster = xgb.train(
+                params,
+                data,
+                num_boost_round=self.model.get_params()["n_estimators"],
+                **train_params,
+            )
+            # The state XGBClassifier.load_model restores for a binary classifier
+            self.model._Booster = booster
+            self.model.n_classes_ = 2
+            self.model.classes_ = np.arange(2)
+            if train_params:
+                logger.info(f"Early stopped at {self.model.best_iteration + 1} trees")
+            if len(self._thresholds()) > 1:
+                calibration_batches = (
+                    validation_batches
+                    if self.calibration == "validation"
+                    and validation_batches is not None
+                    else batches
+                )
+                y, y_proba_pos = [], []
+                for X_batch, y_batch in calibration_batches():
+                    y.append(np.asarray(y_batch))
+                    y_proba_pos.append(
+                        booster.inplace_predict(
+                            X_batch, iteration_range=self.iteration_range
+                        )
+                    )
+                self._tune_threshold(np.concatenate(y), np.concatenate(y_proba_pos))
             self.fitted = True
         except Exception as e:
             logging.error(f"Error fitting the model: {e}")
@@ -60,27 +390,190 @@ class Model(BaseEstimator, ClassifierMixin):
             logging.error(f"Error predicting probabilities: {e}")
             raise e
 
-    def predict(self, X: ndarray) -> ndarray:
+    def predict(self, X: ndarray, out: Optional[ndarray] = None) -> ndarray:
+        """
+        Predicts the classes of the rows, 1 if their positive probability reaches
+        the threshold.
+
+        XGBoost models are scored straight by the booster, in place on CSR or dense
+        inputs, and logistic regressions by a product with their coefficients,
+        without the checks and the two column probability array of `predict_proba`,
+        which dominate the latency of small batches.
+
+        Args:
+            X: Features of the rows.
+            out: Integer array of one element per row the predictions are written to,
+                so a caller scoring batches of the same size can reuse it.
+
+        Returns:
+            The predictions, in `out` if given.
+        """
         if not self.fitted:
             raise NotFittedError(
                 "Model instance is not fitted yet. Call 'fit' with appropriate arguments before using this method."
             )
         try:
-            y_proba = self.predict_proba(X)
-            y_proba_pos = y_proba[:, 1]
-            return (y_proba_pos >= self.threshold).astype(int)
+            if isinstance(self.model, XGBModel):
+                y_proba_pos = self.model.get_booster().inplace_predict(
+                    X, iteration_range=self.iteration_range
+                )
+            elif is_logistic(self.model):
+                y_proba_pos = linear_proba(
+                    X, self.model.coef_[0], self.model.intercept_[0]
+                )
+            else:
+                y_proba_pos = self.predict_proba(X)[:, 1]
+            if out is None:
+                out = np.empty(len(y_proba_pos), dtype=int)
+            return np.greater_equal(
+                y_proba_pos, self.threshold, out=out, casting="unsafe"
+            )
         except Exception as e:
             logging.error(f"Error predicting: {e}")
             raise e
 
-    def get_params(self, deep=True):
-        return {"model": self.model, "threshold": self.threshold}
+    @property
+    def iteration_range(self) -> Tuple[int, int]:
+        """
+        Trees the XGBoost model predicts with, up to the best one if it stopped early.
+        """
+        best_iteration = getattr(self.model, "best_iteration", None)
+        return (0, 0 if best_iteration is None else best_iteration + 1)
 
     def set_params(self, **parameters):
+        own_parameters = self._get_param_names()
+        model_parameters = {}
         for parameter, value in parameters.items():
-            setattr(self, parameter, value)
+            if parameter in own_parameters:
+                setattr(self, parameter, value)
+            else:
+                model_parameters[parameter] = value
+        # Like `model__n_estimators` of a grid search over a pipeline, which
+        # reaches this model as `n_estimators`.
+        if model_parameters:
+            self.model.set_params(**model_parameters)
         return self
 
+    def warm_start_booster(self) -> xgb.Booster:
+        """
+        Returns a copy of the booster to continue boosting from.
+
+        The trees past the best early stopping iteration are dropped, and so is the
+        early stopping state, which XGBoost would otherwise keep and predict with
+        the old trees only.
+        """
+        if not self.fitted:
+            raise NotFittedError(
+                "Model instance is not fitted yet. Call 'fit' with appropriate arguments before using this method."
+            )
+        self._check_warm_start()
+        start, end = self.iteration_range
+        booster = self.model.get_booster()
+        booster = booster[start:end] if end else booster.copy()
+        booster.set_attr(best_iteration=None, best_ntree_limit=None, best_score=None)
+        return booster
+
+    def _check_warm_start(self):
+        if not isinstance(self.model, XGBModel):
+            raise ValueError(
+                "Warm start needs an XGBoost model, got `{}`!".format(
+                    type(self.model).__name__
+                )
+            )
+
+    def _fit_model(
+        self, X: ndarray, y: ndarray, xgb_model: Optional[xgb.Booster] = None
+    ) -> Optional[Tuple[ndarray, ndarray]]:
+        """
+        Fits the wrapped model and returns the rows held out from it, if any.
+        """
+        fit_params = {} if xgb_model is None else {"xgb_model": xgb_model}
+        early_stopping = False
+        if isinstance(self.model, XGBModel):
+            self.model.set_params(
+                tree_method=self.tree_method,
+                n_jobs=self.n_jobs,
+                early_stopping_rounds=self.early_stopping_rounds,
+            )
+            early_stopping = bool(self.early_stopping_rounds)
+        calibrating = self.calibration == "validation" and len(self._thresholds()) > 1
+        split = None
+        if early_stopping or calibrating:
+            split = self._split_validation(X, y)
+        if split is None:
+            if early_stopping:
+                self.model.set_params(early_stopping_rounds=None)
+            self.model.fit(*self._resample(X, y), **fit_params)
+            return None
+        X_fit, X_val, y_fit, y_val = split
+        X_fit, y_fit = self._resample(X_fit, y_fit)
+        if early_stopping:
+            self.model.fit(
+                X_fit, y_fit, eval_set=[(X_val, y_val)], verbose=False, **fit_params
+            )
+            logger.info(f"Early stopped at {self.model.best_iteration + 1} trees")
+        else:
+            self.model.fit(X_fit, y_fit, **fit_params)
+        return X_val, y_val
+
+    def _split_validation(self, X: ndarray, y: ndarray) -> Optional[Tuple]:
+        # Too few rows of a class to stratify, or a split smaller than the classes
+        try:
+            return train_test_split(
+                X, y, test_size=self.validation_fraction, stratify=y, random_state=42
+            )
+        except ValueError as e:
+            logger.warning(
+                "Can't hold out a stratified validation split, fitting on all the "
+                f"rows without early stopping and calibrating on them: {e}"
+            )
+            return None
+
+    def _resample(self, X: ndarray, y: ndarray) -> Tuple[ndarray, ndarray]:
+        if self.sampler is None:
+            return X, y
+        return self.sampler.fit_resample(X, y)
+
+    def _tune_threshold(self, y: ndarray, y_proba_pos: ndarray):
+        # The first threshold with the highest recall among the ones with all the
+        # F1 scores above min_f1, the threshold is kept if none is.
+        thresholds = self._thresholds()
+        recall, min_f1 = threshold_scores(y, y_proba_pos, thresholds)
+        valid = (min_f1 > self.min_f1) & (recall > 0)
+        if valid.any():
+            self.threshold = thresholds[np.argmax(np.where(valid, recall, -1))]
+
+    def _thresholds(self) -> ndarray:
+        # Not an array default, which scikit-learn can't compare in the repr
+        if self.thresholds is None:
+            return np.arange(0, 1, 0.01)
+        return np.asarray(self.thresholds)
+
+    def used_features(self) -> ndarray:
+        """
+        Returns the sorted indices of the input features the fitted model uses.
+        """
+        if not self.fitted:
+            raise NotFittedError(
+                "Model instance is not fitted yet. Call 'fit' with appropriate arguments before using this method."
+            )
+        if hasattr(self.model, "get_booster"):
+            booster = self.model.get_booster()
+            feature_names = booster.feature_names or [
+                f"f{i}" for i in range(booster.num_features())
+            ]
+            positions = {name: i for i, name in enumerate(feature_names)}
+            scores = booster.get_score(importance_type="weight")
+            return np.array(sorted(positions[name] for name in scores), dtype=int)
+        if hasattr(self.model, "coef_"):
+            return np.flatnonzero(np.any(self.model.coef_ != 0, axis=0))
+        return np.flatnonzero(self.model.feature_importances_)
+
     @property
     def classes_(self):
         return self.model.classes_
+
+    def __setstate__(self, state):
+        for name, value in PICKLED_DEFAULTS.items():
+            state.setdefault(name, value)
+        super().__setstate__(state)
@@ -0,0 +1,210 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import mlflow
+from mlflow.entities.model_registry import ModelVersion
+from rich.logging import RichHandler
+
+from email_discriminator.core.model.inference_bundle import (
+    INFERENCE_BUNDLE_ARTIFACT,
+    InferenceBundle,
+)
+
+LOGGER_LEVEL = os.getenv("LOGGER_LEVEL", "WARNING")
+logging.basicConfig(level=LOGGER_LEVEL, format="%(message)s", handlers=[RichHandler()])
+logger = logging.getLogger("ModelCache")
+MODEL_CACHE_DIR = os.getenv(
+    "MODEL_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "email-discriminator-models"),
+)
+# Subdirectories of a cached version, holding its downloaded artifacts
+BUNDLE_DIR = "bundle"
+PYFUNC_DIR = "pyfunc"
+
+
+class ModelCache:
+    """
+    Local cache of registered model versions, downloaded and deserialized once.
+
+    `load` resolves the version of a stage with one registry query. The artifacts of
+    a version are downloaded to `root/<model name>/<version>` the first time it is
+    loaded, and the deserialized model is kept in memory, so a version is only
+    downloaded once per machine and deserialized once per process. The inference
+    bundle of the version's run is cached if it has one, and its pyfunc model
+    otherwise, like for models trained before bundles. A cached pyfunc model is
+    replaced by the bundle once one is logged for the version.
+
+    Versions are evicted by least recent use, beyond `max_versions` of a model or
+    once the cached versions take more than `max_bytes` on disk. The version just
+    loaded is never evicted.
+
+    Args:
+        root: Local directory of the cached versions.
+        max_versions: Versions of each model kept.
+        max_bytes: Optional limit of the disk size of all the cached versions.
+        tracking_uri: MLflow tracking and registry URI, the current one if None.
+    """
+
+    def __init__(
+        self,
+        root: str = MODEL_CACHE_DIR,
+        max_versions: int = 2,
+        max_bytes: Optional[int] = None,
+        tracking_uri: Optional[str] = None,
+    ):
+        if max_versions < 1:
+            raise ValueError(f"max_versions must be at least 1, got {max_versions}!")
+        self.root = root
+        self.max_versions = max_versions
+        self.max_bytes = max_bytes
+        self.tracking_uri = tracking_uri
+        self._models: Dict[Tuple[str, str], Any] = {}
+        self._lock = threading.Lock()
+
+    def _client(self) -> mlflow.tracking.MlflowClient:
+        return mlflow.tracking.MlflowClient(
+            tracking_uri=self.tracking_uri, registry_uri=self.tracking_uri
+        )
+
+    def resolve(self, model_name: str, stage: str = "Production") -> ModelVersion:
+        """
+        The latest version of the model in `stage`, with one registry query.
+        """
+        versions = self._client().get_latest_versions(model_name, stages=[stage])
+        if not versions:
+            raise ValueError(f"Model `{model_name}` has no version in stage {stage}!")
+        return versions[0]
+
+    def load(self, model_name: str, stage: str = "Production") -> Tuple[Any, str]:
+        """
+        Loads the latest version of the model in `stage`.
+
+        Returns:
+            The InferenceBundle or pyfunc model, and its version.
+        """
+        model_version = self.resolve(model_name, stage)
+        version = str(model_version.version)
+        with self._lock:
+            model = self._models.get((model_name, version))
+            path = self._path(model_name, version)
+            if os.path.isdir(os.path.join(path, PYFUNC_DIR)) and self._has_bundle(
+                model_version
+            ):
+                logger.info(
+                    f"Model {model_name} version {version} has an inference bundle "
+                    "now, replacing its cached pyfunc model"
+                )
+                self._models.pop((model_name, version), None)
+                shutil.rmtree(path, ignore_errors=True)
+                model = None
+            if model is not None:
+                logger.info(f"Model {model_name} version {version} already loaded")
+            else:
+                if os.path.isdir(path):
+                    logger.info(f"Model {model_name} version {version} found in cache")
+                else:
+                    self._download(model_version, path)
+                model = self._models[(model_name, version)] = self._deserialize(path)
+            os.utime(path)
+            self._evict(model_name, keep=path)
+        return model, version
+
+    def _path(self, model_name: str, version: str) -> str:
+        return os.path.join(self.root, model_name, version)
+
+    def _has_bundle(self, model_version: ModelVersion) -> bool:
+        return bool(
+            self._client().list_artifacts(
+                model_version.run_id, INFERENCE_BUNDLE_ARTIFACT
+            )
+        )
+
+    def _download(self, model_version: ModelVersion, path: str) -> None:
+        logger.info(
+            f"Downloading model {model_version.name} version {model_version.version}..."
+        )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_dir = os.path.join(os.path.dirname(path), f".{uuid.uuid4().hex}.tmp")
+        os.makedirs(tmp_dir)
+        try:
+            if self._has_bundle(model_version):
+                downloaded = mlflow.artifacts.download_artifacts(
+                    run_id=model_version.run_id,
+                    artifact_path=INFERENCE_BUNDLE_ARTIFACT,
+                    dst_path=tmp_dir,
+                    tracking_uri=self.tracking_uri,
+                )
+                target = BUNDLE_DIR
+            else:
+                logger.warning(
+                    f"Model {model_version.name} version {model_version.version} has "
+                    "no inference bundle, caching its pyfunc model"
+                )
+                downloaded = mlflow.artifacts.download_artifacts(
+                    artifact_uri=model_version.source,
+                    dst_path=tmp_dir,
+                    tracking_uri=self.tracking_uri,
+                )
+                target = PYFUNC_DIR
+            os.rename(downloaded, os.path.join(tmp_dir, target))
+            os.rename(tmp_dir, path)
+        except OSError:
+            # Another process cached the same version first.
+            if not os.path.isdir(path):
+                raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @staticmethod
+    def _deserialize(path: str) -> Any:
+        if os.path.isdir(os.path.join(path, BUNDLE_DIR)):
+            return InferenceBundle.load(os.path.join(path, BUNDLE_DIR))
+        return mlflow.pyfunc.load_model(os.path.join(path, PYFUNC_DIR))
+
+    def cached_versions(self) -> List[Tuple[str, str]]:
+        """
+        The (model name, version) pairs on disk, least recently used first.
+        """
+        if not os.path.isdir(self.root):
+            return []
+        versions = [
+            (model_name, version)
+            for model_name in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, model_name))
+            for version in os.listdir(os.path.join(self.root, model_name))
+            if not version.startswith(".")
+        ]
+        return sorted(versions, key=lambda key: os.path.getmtime(self._path(*key)))
+
+    def _evict(self, model_name: str, keep: str) -> None:
+        cached_versions = [
+            key for key in self.cached_versions() if self._path(*key) != keep
+        ]
+        model_versions = [key for key in cached_versions if key[0] == model_name]
+        evicted = model_versions[: max(len(model_versions) + 1 - self.max_versions, 0)]
+        if self.max_bytes is not None:
+            remaining = [key for key in cached_versions if key not in evicted]
+            sizes = {key: _dir_size(self._path(*key)) for key in remaining}
+            total_bytes = _dir_size(keep) + sum(sizes.values())
+            for key in remaining:
+                if total_bytes <= self.max_bytes:
+                    break
+                evicted.append(key)
+                total_bytes -= sizes[key]
+        for key in evicted:
+            logger.info(f"Evicting model {key[0]} version {key[1]} from the cache")
+            self._models.pop(key, None)
+            shutil.rmtree(self._path(*key), ignore_errors=True)
+
+
+def _dir_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(dirpath, filename))
+        for dirpath, _, filenames in os.walk(path)
+        for filename in filenames
+    )
@@ -0,0 +1,125 @@
+import logging
+import os
+from typing import Callable, Dict, Iterable, Tuple
+
+import numpy as np
+from numpy import ndarray
+from pandas import DataFrame
+from rich.logging import RichHandler
+from sklearn.pipeline import Pipeline
+
+from email_discriminator.core.data_versioning.dataset_fingerprint import hash_rows
+from email_discriminator.core.model.data_processor import FEATURE_COLUMNS, DataProcessor
+from email_discriminator.core.model.model import Model
+from email_discriminator.core.profiling import MemoryUsage, track_peak_memory
+
+LOGGER_LEVEL = os.getenv("LOGGER_LEVEL", "WARNING")
+logging.basicConfig(level=LOGGER_LEVEL, format="%(message)s", handlers=[RichHandler()])
+logger = logging.getLogger("OutOfCore")
+# Resolution of the hash split, in rows per thousand
+SPLIT_BUCKETS = 1000
+
+
+def hash_buckets(df: DataFrame) -> ndarray:
+    """
+    Split bucket of each row, from 0 to SPLIT_BUCKETS, by a hash of its features.
+
+    Each chunk of rows is split on its own, and the same way every time it is
+    streamed, so the splits never have to be held in memory.
+    """
+    return hash_rows(df, FEATURE_COLUMNS) % SPLIT_BUCKETS
+
+
+def in_test_split(df: DataFrame, test_size: float = 0.2) -> ndarray:
+    """
+    Whether each row belongs to the test split, the lowest hash buckets.
+    """
+    return hash_buckets(df) < int(test_size * SPLIT_BUCKETS)
+
+
+def in_validation_split(df: DataFrame, validation_fraction: float = 0.1) -> ndarray:
+    """
+    Whether each row belongs to the validation split, the highest hash buckets, so
+    it doesn't overlap the test split while both fractions add up to at most 1.
+    """
+    return hash_buckets(df) >= SPLIT_BUCKETS - int(validation_fraction * SPLIT_BUCKETS)
+
+
+def fit_out_of_core(
+    data_processor: DataProcessor,
+    model: Model,
+    chunks: Callable[[], Iterable[DataFrame]],
+    cache_dir: str,
+    label: str = "is_relevant",
+) -> Tuple[Pipeline, Dict[str, MemoryUsage]]:
+    """
+    Fits a hashing DataProcessor and an XGBoost Model on chunks of rows streamed
+    from storage, so the corpus doesn't have to fit in memory.
+
+    The chunks are streamed three times: to fit the processor chunk by chunk, to
+    write the featurized chunks to the XGBoost cache the model is trained from, and
+    to tune the threshold. The classes are balanced by weighting the positive rows
+    instead of oversampling them. If the model stops early or calibrates on
+    validation rows, the `validation_fraction` of the rows in the highest hash
+    buckets, see `in_validation_split`, are held out of the processor and the
+    model, and stopped or calibrated on instead.
+
+    Args:
+        data_processor: Unfitted DataProcessor with the hashing vectorizer.
+        model: Unfitted XGBoost Model.
+        chunks: Returns a new iterable over the training DataFrame chunks, with
+            the label column, on each call.
+        cache_dir: Directory of the XGBoost cache files.
+        label: Label column of the chunks.
+
+    Returns:
+        The fitted pipeline, and the memory usage of each stage.
+    """
+    holdout = model.calibration == "validation" or bool(model.early_stopping_rounds)
+
+    def split(validation: bool) -> Iterable[DataFrame]:
+        for chunk in chunks():
+            if holdout:
+                in_validation = in_validation_split(chunk, model.validation_fraction)
+                chunk = chunk[in_validation == validation]
+            if len(chunk):
+                yield chunk
+
+    stages = {}
+    with track_peak_memory("streaming feature fit") as usage:
+        n_rows = n_positives = 0
+        for chunk in split(validation=False):
+            data_processor.partial_fit(chunk)
+            n_rows += len(chunk)
+            n_positives += int((chunk[label] == 1).sum())
+    stages["feature_fit"] = usage
+    logger.info(f"Fitted the features on {n_rows} rows, {n_positives} positive")
+    model.set_params(scale_pos_weight=(n_rows - n_positives) / max(n_positives, 1))
+
+    def batches(validation: bool):
+        for chunk in split(validation):
+            yield data_processor.transform(chunk), chunk[label].to_numpy()
+
+    with track_peak_memory("external memory model fit") as usage:
+        model.fit_batches(
+            lambda: batches(validation=False),
+            os.path.join(cache_dir, "features"),
+            (lambda: batches(validation=True)) if holdout else None,
+        )
+    stages["model_fit"] = usage
+    return Pipeline([("features", data_processor), ("model", model)]), stages
+
+
+def predict_chunks(
+    pipeline, chunks: Iterable[DataFrame], label: str = "is_relevant"
+) -> Tuple[ndarray, ndarray]:
+    """
+    Predicts streamed chunks of rows, and returns their labels and predictions.
+    """
+    y, y_pred = [], []
+    for chunk in chunks:
+        y.append(chunk[label].to_numpy())
+        y_pred.append(pipeline.predict(chunk))
+    if not y:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    return np.concatenate(y), np.concatenate(y_pred)
@@ -0,0 +1,68 @@
+import logging
+import os
+
+import numpy as np
+from numpy import ndarray
+from pandas import DataFrame
+from rich.logging import RichHandler
+from sklearn.base import BaseEstimator, TransformerMixin
+
+LOGGER_LEVEL = os.getenv("LOGGER_LEVEL", "WARNING")
+logging.basicConfig(level=LOGGER_LEVEL, format="%(message)s", handlers=[RichHandler()])
+logger = logging.getLogger("TextNormalizer")
+
+READ_TIME_PATTERN = r"\((\d+)\s+MINUTE\s+READ\)"
+LINK_DOMAIN_PATTERN = r"https?://(?:www\.)?([^/\s\]?#:]+)"
+URL_PATTERN = r"https?://[^\s\]]+"
+NOISE_PATTERN = rf"{READ_TIME_PATTERN}|{URL_PATTERN}|[\[\]]"
+
+
+def to_column(X) -> ndarray:
+    """
+    Reshapes a column into the 2D array scikit-learn transformers expect.
+    """
+    return np.asarray(X).reshape(-1, 1)
+
+
+class TextNormalizer(BaseEstimator, TransformerMixin):
+    """
+    Transformer that cleans the article text before it is vectorized.
+
+    The URLs, the "(N MINUTE READ)" markers, line breaks and markdown brackets are
+    removed from the `key` column with vectorized string operations. The read time
+    in minutes (0 if unknown) and the domain of the first link ("" if none) are
+    extracted into the `read_minutes` and `link_domain` columns.
+
+    >>> df = DataFrame({"article": ["TITLE (3 MINUTE READ)\\r\\n[https://www.a.com/x]"]})
+    >>> TextNormalizer().transform(df).iloc[0].tolist()
+    ['TITLE', 3.0, 'a.com']
+    """
+
+    def __init__(self, key: str = "article"):
+        self.key = key
+
+    def fit(self, X: DataFrame, y: ndarray = None) -> "TextNormalizer":
+        return self
+
+    def transform(self, X: DataFrame) -> DataFrame:
+        if self.key not in X.columns:
+            raise ValueError(
+                "Column `{}` not found! Available columns: {}".format(
+                    self.key, ", ".join(X.columns)
+                )
+            )
+        text = X[self.key].fillna("").astype(str)
+        read_minutes = (
+            text.str.extract(READ_TIME_PATTERN, expand=False).astype(float).fillna(0)
+        )
+        link_domain = (
+            text.str.extract(LINK_DOMAIN_PATTERN, expand=False).fillna("").str.lower()
+        )
+        # Splitting on whitespace and joining also drops the line breaks, and is
+        # faster than a regex replacement of the whitespace runs.
+        text = (
+            text.str.replace(NOISE_PATTERN, " ", regex=True).str.split().str.join(" ")
+        )
+        return X.assign(
+            **{self.key: text, "read_minutes": read_minutes, "link_domain": link_domain}
+        )
@@ -0,0 +1,3 @@
+from email_discriminator.core.profiling.artifact import ArtifactStats, measure_artifact
+from email_discriminator.core.profiling.memory import MemoryUsage, track_peak_memory
+from email_discriminator.core.profiling.timeline import StageTimeline
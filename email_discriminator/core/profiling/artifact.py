@@ -0,0 +1,49 @@
+import logging
+import os
+import pickle
+import time
+
+from rich.logging import RichHandler
+
+LOGGER_LEVEL = os.getenv("LOGGER_LEVEL", "WARNING")
+logging.basicConfig(level=LOGGER_LEVEL, format="%(message)s", handlers=[RichHandler()])
+logger = logging.getLogger("Profiling")
+
+
+class ArtifactStats:
+    """
+    Serialized size of an object and the time it takes to load it back.
+    """
+
+    def __init__(self, size_bytes: int, load_seconds: float):
+        self.size_bytes = size_bytes
+        self.load_seconds = load_seconds
+
+    @property
+    def size_mb(self) -> float:
+        return self.size_bytes / 2**20
+
+
+def measure_artifact(obj, name: str = "artifact", repeat: int = 3) -> ArtifactStats:
+    """
+    Pickles an object, as the model registry stores it, and times unpickling it.
+
+    Args:
+        obj: Object to measure, like a fitted pipeline.
+        name: Name of the object in the logs.
+        repeat: Number of loads, the fastest one is reported.
+
+    Returns:
+        The size of the pickle and its load time in seconds.
+    """
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    load_seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pickle.loads(data)
+        load_seconds = min(load_seconds, time.perf_counter() - start)
+    stats = ArtifactStats(len(data), load_seconds)
+    logger.info(
+        f"Size of {name}: {stats.size_mb:.2f} MB, loaded in {load_seconds:.3f} s"
+    )
+    return stats
@@ -0,0 +1,110 @@
+import logging
+import os
+import re
+import tracemalloc
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from rich.logging import RichHandler
+
+LOGGER_LEVEL = os.getenv("LOGGER_LEVEL", "WARNING")
+logging.basicConfig(level=LOGGER_LEVEL, format="%(message)s", handlers=[RichHandler()])
+logger = logging.getLogger("Profiling")
+# Linux process status with the resident set size high-water mark
+PROC_STATUS = "/proc/self/status"
+PROC_CLEAR_REFS = "/proc/self/clear_refs"
+
+
+def reset_peak_rss() -> bool:
+    """
+    Resets the resident set size high-water mark of the process, on Linux only.
+
+    Returns:
+        Whether the mark was reset.
+    """
+    try:
+        with open(PROC_CLEAR_REFS, "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """
+    Returns the resident set size high-water mark of the process, None if unknown.
+    """
+    try:
+        with open(PROC_STATUS) as f:
+            match = re.search(r"VmHWM:\s+(\d+) kB", f.read())
+    except OSError:
+        return None
+    return int(match.group(1)) * 1024 if match else None
+
+
+class MemoryUsage:
+    """
+    Memory allocated while a `track_peak_memory` block ran, in bytes.
+
+    `peak_rss_bytes` is the highest resident set size of the whole process during
+    the block, which unlike the traced allocations includes native buffers. It is
+    None where the high-water mark can't be reset, as it would include the peaks
+    of earlier blocks.
+    """
+
+    def __init__(self):
+        self.peak_bytes = 0
+        self.retained_bytes = 0
+        self.peak_rss_bytes: Optional[int] = None
+
+    @property
+    def peak_mb(self) -> float:
+        return self.peak_bytes / 2**20
+
+    @property
+    def retained_mb(self) -> float:
+        return self.retained_bytes / 2**20
+
+    @property
+    def peak_rss_mb(self) -> Optional[float]:
+        return None if self.peak_rss_bytes is None else self.peak_rss_bytes / 2**20
+
+
+@contextmanager
+def track_peak_memory(name: str = "block") -> Iterator[MemoryUsage]:
+    """
+    Measures the peak memory allocated inside the block with tracemalloc.
+
+    Only allocations made through the Python allocators are traced, which covers
+    NumPy and SciPy arrays but not the native buffers of libraries like XGBoost.
+    Those are covered by the peak resident set size, measured on Linux. Blocks
+    should not be nested, as each one resets the traced peak.
+
+    >>> with track_peak_memory() as usage:
+    ...     data = bytearray(2**20)
+    >>> usage.peak_bytes >= 2**20
+    True
+    """
+    usage = MemoryUsage()
+    was_tracing = tracemalloc.is_tracing()
+    if was_tracing:
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    rss_reset = reset_peak_rss()
+    try:
+        yield usage
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        if not was_tracing:
+            tracemalloc.stop()
+        usage.peak_bytes = max(peak - start, 0)
+        usage.retained_bytes = max(current - start, 0)
+        if rss_reset:
+            usage.peak_rss_bytes = peak_rss_bytes()
+        rss = "" if usage.peak_rss_mb is None else f", {usage.peak_rss_mb:.1f} MB RSS"
+        logger.info(
+            f"Peak memory of {name}: {usage.peak_mb:.1f} MB "
+            f"({usage.retained_mb:.1f} MB retained{rss})"
+        )
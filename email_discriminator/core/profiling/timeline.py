@@ -0,0 +1,96 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, NamedTuple, Sequence, Tuple
+
+from rich.logging import RichHandler
+
+LOGGER_LEVEL = os.getenv("LOGGER_LEVEL", "WARNING")
+logging.basicConfig(level=LOGGER_LEVEL, format="%(message)s", handlers=[RichHandler()])
+logger = logging.getLogger("Profiling")
+
+
+class Stage(NamedTuple):
+    start: float
+    end: float
+    depends_on: Tuple[str, ...]
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class StageTimeline:
+    """
+    Start and end times of the stages of a run, in seconds, and the stages each
+    one depends on.
+
+    The critical path is the chain of stages the end of the run waited for: from
+    the stage that ended last, back through the dependency of each stage that ended
+    last. Only shortening these stages makes the run end earlier.
+
+    >>> timeline = StageTimeline()
+    >>> timeline.record("load model", 0, 2)
+    >>> timeline.record("fetch", 0, 1)
+    >>> timeline.record("predict", 2, 3, depends_on=["load model", "fetch"])
+    >>> timeline.critical_path()
+    ['load model', 'predict']
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Stage] = {}
+
+    def record(
+        self, name: str, start: float, end: float, depends_on: Sequence[str] = ()
+    ) -> None:
+        self.stages[name] = Stage(start, end, tuple(depends_on))
+
+    @contextmanager
+    def stage(self, name: str, depends_on: Sequence[str] = ()) -> Iterator[None]:
+        """
+        Records the block as a stage, timed with `time.perf_counter`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter(), depends_on)
+
+    def critical_path(self) -> List[str]:
+        if not self.stages:
+            return []
+        name = max(self.stages, key=lambda name: self.stages[name].end)
+        path = [name]
+        while True:
+            dependencies = [
+                dependency
+                for dependency in self.stages[name].depends_on
+                if dependency in self.stages and dependency not in path
+            ]
+            if not dependencies:
+                return path[::-1]
+            name = max(dependencies, key=lambda name: self.stages[name].end)
+            path.append(name)
+
+    def to_table(self) -> List[Dict]:
+        """
+        Rows of the stages by start time, with times relative to the first start.
+        """
+        if not self.stages:
+            return []
+        origin = min(stage.start for stage in self.stages.values())
+        critical_path = set(self.critical_path())
+        return [
+            {
+                "Stage": name,
+                "Start (s)": round(stage.start - origin, 3),
+                "End (s)": round(stage.end - origin, 3),
+                "Duration (s)": round(stage.duration, 3),
+                "Depends on": ", ".join(stage.depends_on),
+                "Critical path": name in critical_path,
+            }
+            for name, stage in sorted(
+                self.stages.items(), key=lambda item: item[1].start
+            )
+        ]
@@ -0,0 +1,3 @@
+from email_discriminator.core.serving.load_generator import LoadReport, generate_load
+from email_discriminator.core.serving.micro_batcher import MicroBatcher
+from email_discriminator.core.serving.scoring_server import ScoringServer
@@ -0,0 +1,116 @@
+"""
+Resident scoring service, and a load generator to measure it.
+
+`serve` loads the model once, from the Production version in the MLflow registry
+or a local inference bundle, and serves predictions over HTTP. `load` sends
+concurrent requests with the articles of a CSV to a running service and reports
+its throughput and latency percentiles.
+
+    python -m email_discriminator.core.serving serve --model-name email_discriminator
+    python -m email_discriminator.core.serving load --url http://127.0.0.1:8080
+"""
+import argparse
+import json
+import os
+import urllib.request
+
+import pandas as pd
+from rich.console import Console
+from rich.table import Table
+
+from email_discriminator.core.model import InferenceBundle, ModelCache
+from email_discriminator.core.model.data_processor import FEATURE_COLUMNS
+from email_discriminator.core.serving.load_generator import generate_load
+from email_discriminator.core.serving.scoring_server import ScoringServer
+
+
+def serve(args):
+    if args.bundle_path is not None:
+        model, version = InferenceBundle.load(args.bundle_path), None
+    else:
+        model_cache = ModelCache(tracking_uri=args.tracking_uri)
+        model, version = model_cache.load(args.model_name)
+    server = ScoringServer(
+        (args.host, args.port),
+        model,
+        max_batch_size=args.max_batch_size,
+        max_latency_ms=args.max_latency_ms,
+        model_version=version,
+    )
+    Console().print(f"Serving predictions on {server.url}/predict")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def health(url: str) -> dict:
+    with urllib.request.urlopen(f"{url}/health") as response:
+        return json.load(response)
+
+
+def load(args):
+    articles = pd.read_csv(args.data_path, usecols=FEATURE_COLUMNS)
+    articles = articles.fillna("").to_dict("records")
+    before = health(args.url)
+    report = generate_load(
+        args.url,
+        articles,
+        n_requests=args.requests,
+        concurrency=args.concurrency,
+        articles_per_request=args.articles_per_request,
+    )
+    after = health(args.url)
+    batches = after["batches"] - before["batches"]
+
+    table = Table(title=f"{args.concurrency} concurrent clients against {args.url}")
+    for column in [
+        "requests",
+        "errors",
+        "requests/s",
+        "p50 (ms)",
+        "p99 (ms)",
+        "mean batch size",
+    ]:
+        table.add_column(column, justify="right")
+    table.add_row(
+        str(report.requests),
+        str(report.errors),
+        f"{report.throughput:.0f}",
+        "n/a" if report.p50_ms is None else f"{report.p50_ms:.1f}",
+        "n/a" if report.p99_ms is None else f"{report.p99_ms:.1f}",
+        f"{(after['rows'] - before['rows']) / max(batches, 1):.1f}",
+    )
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    subparsers = parser.add_subparsers(required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Serve predictions")
+    serve_parser.set_defaults(command=serve)
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("--max-batch-size", type=int, default=256)
+    serve_parser.add_argument("--max-latency-ms", type=float, default=5.0)
+    serve_parser.add_argument(
+        "--model-name", default=os.getenv("MODEL_NAME", "email_discriminator")
+    )
+    serve_parser.add_argument("--tracking-uri", default=os.getenv("MLFLOW_URI"))
+    serve_parser.add_argument(
+        "--bundle-path", help="Local inference bundle, instead of the registry model"
+    )
+
+    load_parser = subparsers.add_parser("load", help="Measure a running service")
+    load_parser.set_defaults(command=load)
+    load_parser.add_argument("--url", default="http://127.0.0.1:8080")
+    load_parser.add_argument("--data-path", default="data/tldr_articles.csv")
+    load_parser.add_argument("--requests", type=int, default=2000)
+    load_parser.add_argument("--concurrency", type=int, default=32)
+    load_parser.add_argument("--articles-per-request", type=int, default=1)
+
+    args = parser.parse_args()
+    args.command(args)
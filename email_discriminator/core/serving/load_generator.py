@@ -0,0 +1,114 @@
+import http.client
+import json
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import numpy as np
+
+
+class LoadReport:
+    """
+    Latencies of the requests of a `generate_load` run, in milliseconds.
+    """
+
+    def __init__(self, latencies_ms: List[float], errors: int, elapsed_s: float):
+        self.latencies_ms = np.asarray(latencies_ms)
+        self.errors = errors
+        self.elapsed_s = elapsed_s
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies_ms) + self.errors
+
+    @property
+    def throughput(self) -> float:
+        """
+        Successful requests per second.
+        """
+        return len(self.latencies_ms) / self.elapsed_s if self.elapsed_s else 0.0
+
+    def percentile_ms(self, q: float) -> Optional[float]:
+        if not len(self.latencies_ms):
+            return None
+        return float(np.percentile(self.latencies_ms, q))
+
+    @property
+    def p50_ms(self) -> Optional[float]:
+        return self.percentile_ms(50)
+
+    @property
+    def p99_ms(self) -> Optional[float]:
+        return self.percentile_ms(99)
+
+
+def generate_load(
+    url: str,
+    articles: List[Dict],
+    n_requests: int = 1000,
+    concurrency: int = 16,
+    articles_per_request: int = 1,
+) -> LoadReport:
+    """
+    Sends scoring requests to a scoring server from concurrent clients, each
+    keeping its connection alive, and times them.
+
+    Args:
+        url: Base URL of the server.
+        articles: Articles the requests cycle through, with `article` and `section`.
+        n_requests: Requests sent in total.
+        concurrency: Clients sending requests at the same time.
+        articles_per_request: Articles scored by each request.
+    """
+    address = urlparse(url)
+    bodies = [
+        json.dumps(
+            {
+                "articles": [
+                    articles[(i + j) % len(articles)]
+                    for j in range(articles_per_request)
+                ]
+            }
+        ).encode()
+        for i in range(0, len(articles), articles_per_request)
+    ]
+    counter = iter(range(n_requests))
+    lock = threading.Lock()
+    latencies_ms, errors = [], []
+
+    def client():
+        connection = http.client.HTTPConnection(address.hostname, address.port)
+        try:
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                start = time.perf_counter()
+                try:
+                    connection.request(
+                        "POST",
+                        "/predict",
+                        body=bodies[i % len(bodies)],
+                        headers={"Content-Type": "application/json"},
+                    )
+                    response = connection.getresponse()
+                    response.read()
+                    ok = response.status == 200
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    ok = False
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                with lock:
+                    (latencies_ms if ok else errors).append(elapsed_ms)
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return LoadReport(latencies_ms, len(errors), time.perf_counter() - start)
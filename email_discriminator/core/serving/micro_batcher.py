@@ -0,0 +1,138 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+from numpy import ndarray
+from pandas import DataFrame
+from rich.logging import RichHandler
+
+LOGGER_LEVEL = os.getenv("LOGGER_LEVEL", "WARNING")
+logging.basicConfig(level=LOGGER_LEVEL, format="%(message)s", handlers=[RichHandler()])
+logger = logging.getLogger("MicroBatcher")
+
+
+class Request(NamedTuple):
+    rows: DataFrame
+    future: Future
+    enqueued: float
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent scoring requests into micro batches.
+
+    Requests are queued, and a worker thread scores the rows of all the requests
+    it collects with one call to `predict`, so the fixed cost of featurizing and
+    scoring is paid once per batch instead of once per request. A batch is scored
+    once it has `max_batch_size` rows, or once its first request has waited
+    `max_latency_ms`, the latency budget of batching. Requests that arrive while a
+    batch is being scored join the next one.
+
+    >>> with MicroBatcher(lambda rows: rows["article"].str.len()) as batcher:
+    ...     batcher.predict(pd.DataFrame({"article": ["a", "bc"]})).tolist()
+    [1, 2]
+
+    Args:
+        predict: Scores a DataFrame of rows, returning one prediction per row.
+        max_batch_size: Rows after which a batch is scored without waiting.
+        max_latency_ms: Longest a request waits for other requests to join it.
+    """
+
+    def __init__(
+        self,
+        predict: Callable[[DataFrame], ndarray],
+        max_batch_size: int = 256,
+        max_latency_ms: float = 5.0,
+    ):
+        self.predict_fn = predict
+        self.max_batch_size = max_batch_size
+        self.max_latency_ms = max_latency_ms
+        self.n_batches = 0
+        self.n_rows = 0
+        self._queue: "queue.Queue[Optional[Request]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+
+    def start(self) -> "MicroBatcher":
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, daemon=True)
+            self._worker.start()
+        return self
+
+    def close(self) -> None:
+        """
+        Scores the queued requests and stops the worker.
+        """
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+
+    def __enter__(self) -> "MicroBatcher":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def submit(self, rows: DataFrame) -> Future:
+        """
+        Queues rows for scoring, and returns the future of their predictions.
+        """
+        if self._worker is None:
+            raise RuntimeError("The micro batcher is not started!")
+        future = Future()
+        self._queue.put(Request(rows, future, time.perf_counter()))
+        return future
+
+    def predict(self, rows: DataFrame) -> ndarray:
+        return self.submit(rows).result()
+
+    def stats(self) -> Dict:
+        return {
+            "batches": self.n_batches,
+            "rows": self.n_rows,
+            "mean_batch_size": self.n_rows / max(self.n_batches, 1),
+        }
+
+    def _run(self) -> None:
+        closing = False
+        while not closing:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch = [request]
+            n_rows = len(request.rows)
+            deadline = request.enqueued + self.max_latency_ms / 1000
+            while n_rows < self.max_batch_size:
+                try:
+                    request = self._queue.get(
+                        timeout=max(deadline - time.perf_counter(), 0)
+                    )
+                except queue.Empty:
+                    break
+                if request is None:
+                    closing = True
+                    break
+                batch.append(request)
+                n_rows += len(request.rows)
+            self._score(batch)
+
+    def _score(self, batch: List[Request]) -> None:
+        try:
+            rows = pd.concat([request.rows for request in batch], ignore_index=True)
+            predictions = np.asarray(self.predict_fn(rows))
+        except Exception as e:
+            logger.exception(f"Scoring a batch of {len(batch)} requests failed")
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        self.n_batches += 1
+        self.n_rows += len(rows)
+        offsets = np.cumsum([0] + [len(request.rows) for request in batch])
+        for request, start, end in zip(batch, offsets[:-1], offsets[1:]):
+            request.future.set_result(predictions[start:end])
@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional, Tuple
+
+import pandas as pd
+from rich.logging import RichHandler
+
+from email_discriminator.core.model.data_processor import FEATURE_COLUMNS
+from email_discriminator.core.serving.micro_batcher import MicroBatcher
+
+LOGGER_LEVEL = os.getenv("LOGGER_LEVEL", "WARNING")
+logging.basicConfig(level=LOGGER_LEVEL, format="%(message)s", handlers=[RichHandler()])
+logger = logging.getLogger("ScoringServer")
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    """
+    `POST /predict` scores a JSON body `{"articles": [{"article": ..., "section":
+    ...}, ...]}` and answers `{"predictions": [...]}`, one per article.
+    `GET /health` answers the model version and the batching statistics.
+    """
+
+    # Keeps connections alive between requests, and sends the body of a response
+    # right after its headers instead of waiting for the client to acknowledge them
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "ScoringServer"
+
+    def do_GET(self) -> None:
+        if self.path != "/health":
+            self._send(404, {"error": f"Unknown path `{self.path}`!"})
+            return
+        self._send(
+            200,
+            {
+                "status": "ok",
+                "model_version": self.server.model_version,
+                **self.server.batcher.stats(),
+            },
+        )
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path != "/predict":
+            self._send(404, {"error": f"Unknown path `{self.path}`!"})
+            return
+        try:
+            articles = json.loads(body)["articles"]
+            rows = pd.DataFrame(articles, columns=FEATURE_COLUMNS)
+        except (ValueError, KeyError, TypeError) as e:
+            self._send(400, {"error": f"Invalid request: {e}"})
+            return
+        if rows.isna().any(axis=None):
+            self._send(400, {"error": f"Articles need the fields {FEATURE_COLUMNS}!"})
+            return
+        if rows.empty:
+            self._send(200, {"predictions": []})
+            return
+        try:
+            predictions = self.server.batcher.predict(rows)
+        except Exception as e:
+            self._send(500, {"error": f"Scoring failed: {e}"})
+            return
+        self._send(200, {"predictions": predictions.tolist()})
+
+    def _send(self, status: int, payload: Any) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(format % args)
+
+
+class ScoringServer(ThreadingHTTPServer):
+    """
+    Resident HTTP scoring service of a loaded model.
+
+    The model is loaded once, and each connection is handled in its own thread,
+    whose requests are scored in micro batches shared with the other connections.
+
+    Args:
+        address: Host and port to listen on, port 0 for any free port.
+        model: Loaded model with a `predict` method taking a DataFrame of articles,
+            like an InferenceBundle or a fitted pipeline.
+        max_batch_size: Rows after which a batch is scored without waiting.
+        max_latency_ms: Longest a request waits for other requests to join it.
+        model_version: Version of the model reported by `GET /health`.
+    """
+
+    daemon_threads = True
+    # Listen backlog, so clients connecting at once aren't refused
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        model,
+        max_batch_size: int = 256,
+        max_latency_ms: float = 5.0,
+        model_version: Optional[str] = None,
+    ):
+        super().__init__(address, ScoringHandler)
+        self.model_version = model_version
+        self.batcher = MicroBatcher(model.predict, max_batch_size, max_latency_ms)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def serve_forever(self, poll_interval: float = 0.5) -> None:
+        self.batcher.start()
+        logger.info(f"Serving predictions on {self.url}/predict")
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            self.batcher.close()
+
+    def start(self) -> threading.Thread:
+        """
+        Serves in a background thread, until `shutdown` is called.
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
@@ -1,13 +1,13 @@
-import hashlib
 import io
 import os
-from typing import List, Tuple
+from typing import List, Optional, Tuple, Union
 
 import mlflow
 import pandas as pd
 from mlflow.pyfunc import PythonModel
 from pandas import DataFrame
 from prefect import flow, get_run_logger, task
+from prefect.task_runners import ConcurrentTaskRunner
 from prefect_alert import alert_on_failure
 
 from email_discriminator.core.data_fetcher import (
@@ -15,15 +15,35 @@ from email_discriminator.core.data_fetcher import (
     EmailFetcher,
     TLDRContentParser,
 )
-from email_discriminator.core.data_versioning import GCSVersionedDataHandler
+from email_discriminator.core.data_versioning import (
+    GCSVersionedDataHandler,
+    dataset_fingerprint,
+)
+from email_discriminator.core.model import InferenceBundle, ModelCache
+from email_discriminator.workflows.task_cache import (
+    cached,
+    log_cache_state,
+    unlabelled_data_cache_key,
+)
+from email_discriminator.workflows.task_timeline import (
+    create_timeline_artifact,
+    task_run_timeline,
+)
 
 # Fetching configurations from environment variables
 MLFLOW_URI = os.getenv("MLFLOW_URI", "http://35.206.147.175:5000")
 DATA_PATH = os.getenv("DATA_PATH", "data/")
 MODEL_NAME = os.getenv("MODEL_NAME", "email_discriminator")
 BUCKET_NAME = os.getenv("BUCKET_NAME", "email-discriminator")
+MODEL_CACHE_MAX_VERSIONS = int(os.getenv("MODEL_CACHE_MAX_VERSIONS", 2))
+MODEL_CACHE_MAX_MB = os.getenv("MODEL_CACHE_MAX_MB")
 
 mlflow.set_tracking_uri(MLFLOW_URI)
+# Downloaded and deserialized Production models, reused while the version is the same
+MODEL_CACHE = ModelCache(
+    max_versions=MODEL_CACHE_MAX_VERSIONS,
+    max_bytes=None if MODEL_CACHE_MAX_MB is None else int(MODEL_CACHE_MAX_MB) * 2**20,
+)
 
 
 @task
@@ -49,7 +69,7 @@ def upload_unread_emails(df: DataFrame, gcs_handler: GCSVersionedDataHandler) ->
     logger.info("Uploading unread emails to Google Cloud Storage.")
 
     # Calculate the hash of the data content.
-    data_hash = hashlib.sha256(df.to_string().encode()).hexdigest()[:10]
+    data_hash = dataset_fingerprint(df)
 
     # Convert the DataFrame to a CSV string.
     csv_string = df.to_csv(index=False)
@@ -76,7 +96,7 @@ def delete_emails(email_fetcher: EmailFetcher, email_ids: List[str]) -> None:
     logger.info("Deleted emails")
 
 
-@task
+@task(**cached(unlabelled_data_cache_key))
 def load_unlabelled_data(
     gcs_handler: GCSVersionedDataHandler, data_hash: str
 ) -> DataFrame:
@@ -97,28 +117,33 @@ def load_unlabelled_data(
 
 
 @task
-def load_pipeline(model_name: str) -> PythonModel:
+def load_pipeline(model_name: str) -> Union[InferenceBundle, PythonModel]:
     """
-    Load a model pipeline from MLFlow.
+    Load the Production model pipeline from MLFlow, through the local model cache.
+
+    The inference bundle logged with the production model is loaded if there is
+    one, and the pyfunc model otherwise, like for models trained before bundles.
     """
     logger = get_run_logger()
     logger.info(f"Loading model {model_name}")
-    model_uri = (
-        f"models:/{model_name}/Production"  # loading the model in 'Production' stage
-    )
-    pipeline = mlflow.pyfunc.load_model(model_uri)
+    pipeline, version = MODEL_CACHE.load(model_name)
+    logger.info(f"Loaded version {version} of model {model_name}")
     return pipeline
 
 
 @task
-def predict(pipeline: PythonModel, data: DataFrame) -> pd.Series:
+def predict(
+    pipeline: Union[InferenceBundle, PythonModel], data: DataFrame
+) -> pd.Series:
     """
     Make predictions using a model pipeline and data.
+
+    The data is not modified, since it may be uploaded at the same time.
     """
     logger = get_run_logger()
     logger.info("Making predictions")
-    # Add the predictions to the DataFrame as a new column.
-    data["predicted_is_relevant"] = pipeline.predict(data)
+    # Add the predictions to a copy of the DataFrame as a new column.
+    data = data.assign(predicted_is_relevant=pipeline.predict(data))
     logger.info(data)
     return data
 
@@ -132,7 +157,7 @@ def upload_predicted_data(df: DataFrame, gcs_handler: GCSVersionedDataHandler) -
     logger.info("Uploading predictions to Google Cloud Storage")
 
     # Calculate the hash of the data content.
-    data_hash = hashlib.sha256(df.to_string().encode()).hexdigest()[:10]
+    data_hash = dataset_fingerprint(df)
 
     # Convert the DataFrame to a CSV string.
     csv_string = df.to_csv(index=False)
@@ -144,10 +169,17 @@ def upload_predicted_data(df: DataFrame, gcs_handler: GCSVersionedDataHandler) -
     return data_hash
 
 
-@flow(name="predict-flow")
-def predict_flow(do_delete_emails: bool) -> None:
+@flow(name="predict-flow", task_runner=ConcurrentTaskRunner())
+def predict_flow(do_delete_emails: bool, data_hash: Optional[str] = None) -> None:
     """
     The main flow for fetching emails, loading data, loading a model, and making predictions.
+
+    The fetched emails are predicted as they are in memory, while they are uploaded
+    to GCS. Passing the `data_hash` of uploaded unlabelled data replays its
+    predictions instead, without fetching any emails.
+
+    Independent tasks run concurrently, and a timeline of the tasks with their
+    critical path is created as the `predict-timeline` artifact.
     """
     logger = get_run_logger()
     logger.info("Starting prediction flow")
@@ -155,29 +187,52 @@ def predict_flow(do_delete_emails: bool) -> None:
     # Create a GCSVersionedDataHandler instance.
     gcs_handler = GCSVersionedDataHandler(BUCKET_NAME)
 
-    # Create a EmailDatasetBuilder instance.
-    email_fetcher = EmailFetcher()
-    builder = EmailDatasetBuilder(email_fetcher, TLDRContentParser())
-
-    # Fetch unread emails and upload them to GCS.
-    unread_emails, email_ids = fetch_unread_emails(builder)
-    data_hash = upload_unread_emails(unread_emails, gcs_handler)
-
-    # Delete emails from the user's Gmail account.
-    if do_delete_emails:
-        delete_emails(email_fetcher, email_ids)
-
-    # Load the unlabelled data.
-    df = load_unlabelled_data(gcs_handler, data_hash)
-
-    # Load the model pipeline.
-    pipeline = load_pipeline(MODEL_NAME)
+    # Load the model pipeline, which doesn't depend on the emails, while they are fetched.
+    futures = {"load_pipeline": load_pipeline.submit(MODEL_NAME)}
+
+    if data_hash is None:
+        # Create a EmailDatasetBuilder instance.
+        email_fetcher = EmailFetcher()
+        builder = EmailDatasetBuilder(email_fetcher, TLDRContentParser())
+
+        # Fetch unread emails, and upload them to GCS while they are predicted.
+        futures["fetch_unread_emails"] = fetch_unread_emails.submit(builder)
+        data_future = futures["fetch_unread_emails"]
+        data, email_ids = data_future.result()
+        futures["upload_unread_emails"] = upload_unread_emails.submit(
+            data, gcs_handler, wait_for=[data_future]
+        )
+
+        # Delete emails from the user's Gmail account once they are uploaded,
+        # without blocking the predictions.
+        if do_delete_emails:
+            futures["delete_emails"] = delete_emails.submit(
+                email_fetcher, email_ids, wait_for=[futures["upload_unread_emails"]]
+            )
+    else:
+        # Replay the predictions of the uploaded unlabelled data.
+        logger.info(f"Replaying the predictions of data_hash {data_hash}")
+        futures["load_unlabelled_data"] = load_unlabelled_data.submit(
+            gcs_handler, data_hash
+        )
+        data = data_future = futures["load_unlabelled_data"]
+
+    # Make predictions and upload them to GCS.
+    futures["predict"] = predict.submit(
+        futures["load_pipeline"], data, wait_for=[data_future]
+    )
+    futures["upload_predicted_data"] = upload_predicted_data.submit(
+        futures["predict"], gcs_handler
+    )
 
-    # Make predictions.
-    predicted_data = predict(pipeline, df)
+    timeline = task_run_timeline(futures)
+    if "load_unlabelled_data" in futures:
+        log_cache_state(load_unlabelled_data, futures["load_unlabelled_data"].wait())
+    create_timeline_artifact(timeline, key="predict-timeline")
 
-    # Upload the predictions to GCS.
-    data_hash = upload_predicted_data(predicted_data, gcs_handler)
+    # Raise the error of the first failed task, if any.
+    for future in futures.values():
+        future.result()
 
 
 if __name__ == "__main__":
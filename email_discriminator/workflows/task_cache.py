@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+from datetime import timedelta
+from typing import Any, Dict
+
+from prefect import Task, get_run_logger
+from prefect.context import TaskRunContext
+from prefect.states import State
+
+from email_discriminator.core.data_versioning import dataset_fingerprint
+
+# Cached task results are persisted to Prefect's local result storage, under
+# PREFECT_LOCAL_STORAGE_PATH, and PREFECT_TASKS_REFRESH_CACHE=true ignores them.
+CACHE_EXPIRATION = timedelta(hours=float(os.getenv("CACHE_EXPIRATION_HOURS", 24)))
+
+
+def cache_key(context: TaskRunContext, *parts: Any) -> str:
+    """
+    Digest of the task name and the parts its result depends on.
+    """
+    key = json.dumps([context.task.name, *parts], sort_keys=True, default=str)
+    return f"{context.task.name}-{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+def training_data_cache_key(context: TaskRunContext, parameters: Dict) -> str:
+    """
+    Keys `load_training_data` by the manifest entries of the shards it loads.
+    """
+    gcs_handler = parameters["gcs_handler"]
+    manifest = gcs_handler.load_manifest()
+    fingerprints = [
+        manifest.fingerprint("data/training_data/", parameters.get("data_hashes"))
+    ]
+    if parameters.get("include_original", True):
+        fingerprints.append(manifest.fingerprint("data/original_data/"))
+    return cache_key(context, gcs_handler.bucket_name, fingerprints)
+
+
+def unlabelled_data_cache_key(context: TaskRunContext, parameters: Dict) -> str:
+    """
+    Keys `load_unlabelled_data` by its data hash, a fingerprint of the content.
+    """
+    return cache_key(
+        context, parameters["gcs_handler"].bucket_name, parameters["data_hash"]
+    )
+
+
+def dataframe_cache_key(context: TaskRunContext, parameters: Dict) -> str:
+    """
+    Keys a task by the content of its `df` parameter.
+    """
+    return cache_key(context, dataset_fingerprint(parameters["df"]))
+
+
+def cached(cache_key_fn) -> Dict:
+    """
+    Options of a task whose results are cached under the keys of `cache_key_fn`.
+    """
+    return {
+        "cache_key_fn": cache_key_fn,
+        "cache_expiration": CACHE_EXPIRATION,
+        "persist_result": True,
+    }
+
+
+def log_cache_state(task: Task, state: State) -> None:
+    """
+    Logs whether the final state of a cached task run came from the cache.
+
+    Prefect doesn't run the completion hooks of the runs it resolves from the
+    cache, so the final state is checked instead.
+    """
+    logger = get_run_logger()
+    if state.name == "Cached":
+        logger.info(f"Cache hit for {task.name}, reusing the cached result")
+    elif state.is_completed():
+        logger.info(f"Cache miss for {task.name}, caching the result")
+
+
+def run_cached(task: Task, *args, **kwargs):
+    """
+    Runs a cached task and logs whether its result came from the cache.
+    """
+    state = task(*args, return_state=True, **kwargs)
+    log_cache_state(task, state)
+    return state.result()
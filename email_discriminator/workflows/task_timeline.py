@@ -0,0 +1,70 @@
+import asyncio
+from typing import Dict, List
+from uuid import UUID
+
+from prefect import get_run_logger
+from prefect.artifacts import create_table_artifact
+from prefect.client.orchestration import get_client
+from prefect.client.schemas.objects import TaskRun
+from prefect.futures import PrefectFuture
+
+from email_discriminator.core.profiling import StageTimeline
+
+
+async def _read_task_runs(task_run_ids: List[UUID]) -> List[TaskRun]:
+    async with get_client() as client:
+        return await asyncio.gather(
+            *(client.read_task_run(task_run_id) for task_run_id in task_run_ids)
+        )
+
+
+def task_run_timeline(futures: Dict[str, PrefectFuture]) -> StageTimeline:
+    """
+    Waits for the submitted task runs and reads their timeline from the Prefect API.
+
+    Each stage depends on the runs among `futures` it took inputs from or waited
+    for. Runs resolved from the cache take no time, and runs that never started,
+    because an upstream run failed, are left out.
+
+    Args:
+        futures: Futures of the submitted task runs, by stage name.
+    """
+    states = {name: future.wait() for name, future in futures.items()}
+    names = {state.state_details.task_run_id: name for name, state in states.items()}
+    task_runs = asyncio.run(_read_task_runs(list(names)))
+
+    timeline = StageTimeline()
+    for task_run in task_runs:
+        state = states[names[task_run.id]]
+        if task_run.start_time is None and not state.is_final():
+            continue
+        end = task_run.end_time or state.timestamp
+        start = task_run.start_time or end
+        depends_on = {
+            names[task_input.id]
+            for task_inputs in task_run.task_inputs.values()
+            for task_input in task_inputs
+            if getattr(task_input, "input_type", None) == "task_run"
+            and task_input.id in names
+        }
+        timeline.record(
+            names[task_run.id],
+            start.timestamp(),
+            end.timestamp(),
+            sorted(depends_on),
+        )
+    return timeline
+
+
+def create_timeline_artifact(timeline: StageTimeline, key: str) -> None:
+    """
+    Creates a table artifact of the stages of the timeline, flagging the stages on
+    its critical path.
+    """
+    critical_path = " -> ".join(timeline.critical_path())
+    get_run_logger().info(f"Critical path: {critical_path}")
+    create_table_artifact(
+        key=key,
+        table=timeline.to_table(),
+        description=f"Stage timeline, critical path: {critical_path}",
+    )
@@ -1,6 +1,9 @@
-import io
+import asyncio
+import itertools
 import os
-from typing import Dict, Optional, Tuple
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple, Union
 
 import mlflow
 import pandas as pd
@@ -9,28 +12,145 @@ from imblearn.pipeline import Pipeline as imblearnPipeline
 from prefect import flow, get_run_logger, task
 from prefect.artifacts import create_table_artifact
 from prefect_alert import alert_on_failure
-from sklearn.metrics import classification_report, make_scorer, recall_score
+from sklearn.base import clone
+from sklearn.metrics import (
+    accuracy_score,
+    classification_report,
+    make_scorer,
+    recall_score,
+)
 from sklearn.model_selection import GridSearchCV, train_test_split
-
-from email_discriminator.core.data_versioning import GCSVersionedDataHandler
-from email_discriminator.core.model import DataProcessor, Model
+from sklearn.pipeline import Pipeline
+from xgboost import XGBModel
+
+from email_discriminator.core.data_versioning import (
+    AsyncVersionedDataHandler,
+    GCSVersionedDataHandler,
+)
+from email_discriminator.core.model import (
+    DataProcessor,
+    InferenceBundle,
+    Model,
+    fit_out_of_core,
+    warm_start_pipeline,
+)
+from email_discriminator.core.model.inference_bundle import INFERENCE_BUNDLE_ARTIFACT
+from email_discriminator.core.model.out_of_core import in_test_split, predict_chunks
+from email_discriminator.core.profiling import (
+    MemoryUsage,
+    measure_artifact,
+    track_peak_memory,
+)
+from email_discriminator.workflows.task_cache import (
+    cached,
+    dataframe_cache_key,
+    run_cached,
+    training_data_cache_key,
+)
 
 MLFLOW_URI = os.getenv("MLFLOW_URI", "http://35.206.147.175:5000")
 DATA_PATH = os.getenv("DATA_PATH", "data/tldr_articles.csv")
 MODEL_NAME = os.getenv("MODEL_NAME", "email_discriminator")
 BUCKET_NAME = os.getenv("BUCKET_NAME", "email-discriminator")
+# Article vectorizer of the DataProcessor: "tfidf" or "hashing"
+VECTORIZER = os.getenv("VECTORIZER", "tfidf")
+HASHING_N_FEATURES = int(os.getenv("HASHING_N_FEATURES", 2**16))
+# Clean the articles with a TextNormalizer and add their read time and link domain
+NORMALIZE_TEXT = os.getenv("NORMALIZE_TEXT", "false").lower() == "true"
+
+
+def document_frequency(value: str) -> Union[int, float]:
+    """
+    Parses a document frequency: a count if it is an integer, a proportion otherwise.
+    """
+    return int(value) if value.isdigit() else float(value)
+
+
+# Vocabulary budget of the tfidf vectorizer
+MIN_DF = document_frequency(os.getenv("MIN_DF", "1"))
+MAX_DF = document_frequency(os.getenv("MAX_DF", "1.0"))
+MAX_FEATURES = int(os.getenv("MAX_FEATURES", 0)) or None
+# Classifier of the pipeline: "xgboost", or "logistic" and "sgd" for a linear model
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "xgboost")
+# Backends whose accuracy, latency and size are reported next to the trained one,
+# e.g. "xgboost,logistic", none by default as each one fits another pipeline
+COMPARED_BACKENDS = [
+    backend for backend in os.getenv("COMPARED_BACKENDS", "").split(",") if backend
+]
+# Parallel cross validation jobs, the cores are shared between their XGBoost threads
+CV_N_JOBS = int(os.getenv("CV_N_JOBS", 1))
+XGB_N_JOBS = max(1, (os.cpu_count() or 1) // CV_N_JOBS)
+XGB_TREE_METHOD = os.getenv("XGB_TREE_METHOD", "auto")
+# Off by default, which keeps the n_estimators grid and trains on every row. When
+# set, boosting stops early on a split held out of each fit and the grid's number
+# of trees becomes a single MAX_ESTIMATORS cap
+EARLY_STOPPING_ROUNDS = int(os.getenv("EARLY_STOPPING_ROUNDS", 0)) or None
+MAX_ESTIMATORS = int(os.getenv("MAX_ESTIMATORS", 300))
+# Rows the decision threshold is tuned on: the "train" ones, or the "validation" ones
+# held out before oversampling, which are not scored by a model fitted on them
+THRESHOLD_CALIBRATION = os.getenv("THRESHOLD_CALIBRATION", "train")
+# Refit the best pipeline on the vocabulary terms its model uses, which changes the
+# model that is registered
+PRUNE_VOCABULARY = os.getenv("PRUNE_VOCABULARY", "false").lower() == "true"
+# Incremental training boosts trees on the reviewed shards the Production model
+# wasn't trained on, unless they are too many or too unlike its vocabulary, and the
+# result is only promoted if it doesn't score worse than the Production model
+INCREMENTAL_N_ESTIMATORS = int(os.getenv("INCREMENTAL_N_ESTIMATORS", 20))
+MIN_NEW_ROWS = int(os.getenv("MIN_NEW_ROWS", 50))
+FULL_RETRAIN_NEW_FRACTION = float(os.getenv("FULL_RETRAIN_NEW_FRACTION", 0.5))
+MAX_OOV_DRIFT = float(os.getenv("MAX_OOV_DRIFT", 0.05))
+# Metrics of a classification report, as logged, a warm started model must not score
+# lower on than the Production model to be promoted
+PROMOTION_METRICS = {
+    "1_recall": lambda report: report["1"]["recall"],
+    "f1-score": lambda report: report["macro avg"]["f1-score"],
+}
+# Stream the data from the bucket into XGBoost external memory instead of loading
+# it, for corpora larger than the instance memory. It always hashes the articles,
+# as a vocabulary can't be fitted chunk by chunk, and skips the grid search.
+OUT_OF_CORE = os.getenv("OUT_OF_CORE", "false").lower() == "true"
+OUT_OF_CORE_N_ESTIMATORS = int(os.getenv("OUT_OF_CORE_N_ESTIMATORS", 100))
+# Run artifact with the shards and rows a model was trained on
+TRAINING_STATE_ARTIFACT = "training_state.json"
 
 mlflow.set_tracking_uri(MLFLOW_URI)
 mlflow.set_experiment(MODEL_NAME)
 
 
+def memory_metrics(stage: str, usage: MemoryUsage) -> Dict[str, float]:
+    """
+    Formats the memory usage of a training stage as metrics to log.
+    """
+    metrics = {f"{stage}_peak_memory_mb": usage.peak_mb}
+    if usage.peak_rss_mb is not None:
+        metrics[f"{stage}_peak_rss_mb"] = usage.peak_rss_mb
+    return metrics
+
+
 @task
-def load_training_data(gcs_handler: GCSVersionedDataHandler) -> pd.DataFrame:
+def list_training_shards(gcs_handler: GCSVersionedDataHandler) -> List[Dict]:
+    """
+    Lists the manifest entries of the reviewed training data shards.
+    """
+    logger = get_run_logger()
+    shards = gcs_handler.get_training_data_shards()
+    logger.info(f"Found {len(shards)} training data shards")
+    return shards
+
+
+@task(**cached(training_data_cache_key))
+def load_training_data(
+    gcs_handler: GCSVersionedDataHandler,
+    data_hashes: Optional[List[str]] = None,
+    include_original: bool = True,
+) -> pd.DataFrame:
     """
-    Loads the original data and all the training data from GCS.
+    Loads the original data and the training data from GCS.
 
     Args:
         gcs_handler: GCSVersionedDataHandler instance.
+        data_hashes: Training data shards to load, all of them if None.
+        include_original: Whether to load the original data too.
 
     Returns:
         A pandas DataFrame containing the loaded data.
@@ -38,21 +158,28 @@ def load_training_data(gcs_handler: GCSVersionedDataHandler) -> pd.DataFrame:
     logger = get_run_logger()
     logger.info("Loading original and training data from GCS")
 
-    # Load original data
-    csv_string = gcs_handler.download_original_data()
-    original_data = pd.read_csv(io.StringIO(csv_string))
-    logger.info("Original data shape: {}".format(original_data.shape))
-    logger.debug(original_data.head())
+    # Download the original data and the training data shards concurrently
+    async def download_data():
+        async_handler = AsyncVersionedDataHandler(gcs_handler)
+        shards = await async_handler.list_shards("data/training_data/")
+        if data_hashes is not None:
+            shards = [shard for shard in shards if shard["data_hash"] in data_hashes]
+        downloads = [async_handler.download_shards_dataframes(shards)]
+        if include_original:
+            downloads.append(async_handler.download_original_dataframe())
+        return await asyncio.gather(*downloads)
+
+    training_data_files, *original = asyncio.run(download_data())
+    for original_data in original:
+        logger.info("Original data shape: {}".format(original_data.shape))
+        logger.debug(original_data.head())
 
     # Load all training data
-    training_data_files = gcs_handler.download_all_training_data()
     logger.info("Number of training data files: {}".format(len(training_data_files)))
     training_data_dfs = []
-    for csv in training_data_files.values():
-        df = pd.read_csv(io.StringIO(csv))
-        df.drop(
+    for df in training_data_files.values():
+        df = df.drop(
             columns=["predicted_is_relevant", "Unnamed: 0"],
-            inplace=True,
             errors="ignore",
         )
         logger.info(f"Loaded training data with shape {df.shape}")
@@ -63,13 +190,13 @@ def load_training_data(gcs_handler: GCSVersionedDataHandler) -> pd.DataFrame:
     )
 
     # Concatenate all dataframes together
-    df = pd.concat([original_data] + training_data_dfs, ignore_index=True)
+    df = pd.concat(original + training_data_dfs, ignore_index=True)
 
     logger.info(f"Loaded data with shape {df.shape}")
     return df
 
 
-@task
+@task(**cached(dataframe_cache_key))
 def split_data(
     df: pd.DataFrame,
 ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.Series, pd.Series]:
@@ -89,56 +216,407 @@ def split_data(
     )
 
 
-@task
-def create_pipeline() -> imblearnPipeline:
-    logger = get_run_logger()
-    logger.info("Creating pipeline")
+def make_pipeline(backend: str) -> imblearnPipeline:
     return imblearnPipeline(
         [
-            ("features", DataProcessor()),
-            ("sampling", RandomOverSampler()),
-            ("model", Model()),
+            (
+                "features",
+                DataProcessor(
+                    vectorizer=VECTORIZER,
+                    n_features=HASHING_N_FEATURES,
+                    normalize=NORMALIZE_TEXT,
+                    min_df=MIN_DF,
+                    max_df=MAX_DF,
+                    max_features=MAX_FEATURES,
+                ),
+            ),
+            (
+                "model",
+                Model(
+                    backend=backend,
+                    tree_method=XGB_TREE_METHOD,
+                    n_jobs=XGB_N_JOBS,
+                    early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+                    calibration=THRESHOLD_CALIBRATION,
+                    # Oversampled after the validation rows are held out
+                    sampler=RandomOverSampler(),
+                ),
+            ),
         ]
     )
 
 
 @task
-def create_grid_search(pipeline: imblearnPipeline) -> GridSearchCV:
+def create_pipeline(backend: str = MODEL_BACKEND) -> imblearnPipeline:
+    logger = get_run_logger()
+    logger.info(f"Creating {backend} pipeline with the {VECTORIZER} vectorizer")
+    return make_pipeline(backend)
+
+
+@task
+def create_grid_search(
+    pipeline: imblearnPipeline, backend: str = MODEL_BACKEND
+) -> GridSearchCV:
     logger = get_run_logger()
     logger.info("Creating GridSearchCV object")
     scorer = make_scorer(recall_score)
-    model_params = {
-        "model__n_estimators": [100, 200, 300],
-        "model__learning_rate": [0.01, 0.1, 0.2],
-    }
-    return GridSearchCV(pipeline, model_params, cv=3, scoring=scorer)
+    if backend == "logistic":
+        model_params = {"model__C": [0.1, 1.0, 10.0]}
+    elif backend == "sgd":
+        model_params = {"model__alpha": [1e-5, 1e-4, 1e-3]}
+    else:
+        # With early stopping the number of trees is tuned by each fit, up to the cap
+        n_estimators = [MAX_ESTIMATORS] if EARLY_STOPPING_ROUNDS else [100, 200, 300]
+        model_params = {
+            "model__n_estimators": n_estimators,
+            "model__learning_rate": [0.01, 0.1, 0.2],
+        }
+    return GridSearchCV(pipeline, model_params, cv=3, scoring=scorer, n_jobs=CV_N_JOBS)
 
 
 @task
-def fit(grid_search: GridSearchCV, X_train: pd.DataFrame, y_train: pd.Series) -> None:
+def fit(
+    grid_search: GridSearchCV, X_train: pd.DataFrame, y_train: pd.Series
+) -> Dict[str, float]:
+    """
+    Fits the grid search and returns the fit metrics to log, like its peak memory.
+    """
     logger = get_run_logger()
     logger.info("Fitting GridSearchCV object")
-    grid_search.fit(X_train, y_train)
+    with track_peak_memory("GridSearchCV fit") as memory_usage:
+        grid_search.fit(X_train, y_train)
+    logger.info(f"GridSearchCV fit peak memory: {memory_usage.peak_mb:.1f} MB")
+    return memory_metrics("fit", memory_usage)
+
+
+@task
+def prune_pipeline(
+    pipeline: imblearnPipeline, X_train: pd.DataFrame, y_train: pd.Series
+) -> Tuple[imblearnPipeline, Dict[str, float]]:
+    """
+    Refits a pipeline on the vocabulary terms its fitted model uses.
+
+    The articles are vectorized with only those terms, so the TF-IDF weights of
+    the remaining terms, normalized over fewer terms, change and the model is
+    refitted on them rather than remapped.
+
+    Args:
+        pipeline: Fitted pipeline, like the best estimator of the grid search.
+        X_train: Training data the pipeline was fitted on.
+        y_train: Training labels.
+
+    Returns:
+        The pruned pipeline, or the given one if it has no vocabulary to prune,
+        and the size and load time of both as metrics to log.
+    """
+    logger = get_run_logger()
+    before = measure_artifact(pipeline, "pipeline")
+    metrics = {
+        "unpruned_artifact_size_mb": before.size_mb,
+        "unpruned_artifact_load_s": before.load_seconds,
+    }
+    used_features = pipeline.named_steps["model"].used_features()
+    terms = pipeline.named_steps["features"].used_vocabulary(used_features)
+    if not terms:
+        logger.info("No vocabulary to prune")
+        metrics.update(
+            {
+                "artifact_size_mb": before.size_mb,
+                "artifact_load_s": before.load_seconds,
+            }
+        )
+        return pipeline, metrics
+
+    logger.info(f"Refitting the pipeline on the {len(terms)} vocabulary terms used")
+    pruned = clone(pipeline).set_params(features__vocabulary=terms)
+    pruned.fit(X_train, y_train)
+    after = measure_artifact(pruned, "pruned pipeline")
+    logger.info(
+        f"Pipeline size: {before.size_mb:.2f} MB -> {after.size_mb:.2f} MB, "
+        f"load time: {before.load_seconds:.3f} s -> {after.load_seconds:.3f} s"
+    )
+    metrics.update(
+        {
+            "vocabulary_size": len(terms),
+            "artifact_size_mb": after.size_mb,
+            "artifact_load_s": after.load_seconds,
+        }
+    )
+    return pruned, metrics
+
+
+def best_time(fn, repeat: int = 3) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+@task
+def compare_backends(
+    pipeline: imblearnPipeline,
+    X_train: pd.DataFrame,
+    y_train: pd.Series,
+    X_test: pd.DataFrame,
+    y_test: pd.Series,
+    backends: List[str],
+    backend: str = MODEL_BACKEND,
+) -> Dict[str, float]:
+    """
+    Reports the test scores, prediction latency and artifact size of model backends.
+
+    The trained backend is measured on its tuned pipeline, the others are fitted
+    with their default parameters, and the rows are logged as a table artifact.
+
+    Args:
+        pipeline: Trained pipeline of `backend`.
+        X_train: Training data.
+        y_train: Training labels.
+        X_test: Test data.
+        y_test: Test labels.
+        backends: Backends to compare.
+        backend: Backend of `pipeline`.
+
+    Returns:
+        The metrics of each backend, prefixed by its name.
+    """
+    logger = get_run_logger()
+    metrics, table = {}, []
+    for name in backends:
+        if name == backend:
+            compared = pipeline
+        else:
+            logger.info(f"Fitting a {name} pipeline to compare")
+            compared = make_pipeline(name).fit(X_train, y_train)
+        y_pred = compared.predict(X_test)
+        features = compared.named_steps["features"].transform(X_test)
+        model = compared.named_steps["model"]
+        row = {
+            "accuracy": accuracy_score(y_test, y_pred),
+            "recall": recall_score(y_test, y_pred),
+            "predict_ms": best_time(lambda: compared.predict(X_test)) * 1000,
+            "model_predict_ms": best_time(lambda: model.predict(features)) * 1000,
+            "artifact_size_mb": measure_artifact(compared, name).size_mb,
+        }
+        logger.info(f"{name} backend: {row}")
+        metrics.update({f"{name}_{key}": value for key, value in row.items()})
+        table.append(
+            {"Backend": name, **{key: round(value, 4) for key, value in row.items()}}
+        )
+    create_table_artifact(
+        key="backend-comparison",
+        table=table,
+        description="Accuracy, latency on the test set and size of the backends",
+    )
+    return metrics
+
+
+@task
+def load_production_state(
+    model_name: str,
+) -> Optional[Tuple[imblearnPipeline, Dict]]:
+    """
+    Loads the Production pipeline and the training state logged with it.
+
+    Returns:
+        The pipeline and its training state, or None if there is no Production
+        XGBoost model with a training state to warm start from.
+    """
+    logger = get_run_logger()
+    client = mlflow.tracking.MlflowClient()
+    try:
+        (model_version,) = client.get_latest_versions(model_name, stages=["Production"])
+        run_uri = f"runs:/{model_version.run_id}"
+        state = mlflow.artifacts.load_dict(f"{run_uri}/{TRAINING_STATE_ARTIFACT}")
+        pipeline = mlflow.sklearn.load_model(f"{run_uri}/model")
+    except Exception as e:
+        logger.info(f"No Production model to warm start from: {e}")
+        return None
+    if not isinstance(pipeline.named_steps["model"].model, XGBModel):
+        logger.info("The Production model can't be warm started")
+        return None
+    if "full_shards" not in state:
+        logger.info("The test rows of the Production model are unknown")
+        return None
+    logger.info(
+        f"Loaded Production model version {model_version.version}, "
+        f"trained on {state['rows']} rows"
+    )
+    return pipeline, state
+
+
+@task
+def check_drift(
+    pipeline: imblearnPipeline, state: Dict, new_df: pd.DataFrame
+) -> Tuple[bool, Dict[str, float]]:
+    """
+    Decides whether new data needs a full retrain rather than a warm start.
+
+    A full retrain is needed once the rows boosted on since the last one exceed
+    FULL_RETRAIN_NEW_FRACTION of the rows it was trained on, when the share of
+    article terms missing from the frozen vocabulary grew by more than
+    MAX_OOV_DRIFT, or when the new rows miss a class to warm start on.
+
+    Returns:
+        Whether a full retrain is needed, and the drift metrics to log.
+    """
+    logger = get_run_logger()
+    incremental_rows = state["rows"] - state["full_rows"] + len(new_df)
+    new_fraction = incremental_rows / state["full_rows"]
+    oov_rate = pipeline.named_steps["features"].out_of_vocabulary_rate(new_df)
+    oov_drift = oov_rate - state["oov_rate"]
+    logger.info(
+        f"Rows since the last full retrain: {new_fraction:.1%} of it, "
+        f"out of vocabulary rate: {state['oov_rate']:.1%} -> {oov_rate:.1%}"
+    )
+    missing_class = new_df["is_relevant"].nunique() < 2
+    if missing_class:
+        logger.info("The new rows hold a single class")
+    needs_full_retrain = (
+        new_fraction > FULL_RETRAIN_NEW_FRACTION
+        or oov_drift > MAX_OOV_DRIFT
+        or missing_class
+    )
+    metrics = {"new_rows_fraction": new_fraction, "oov_rate_drift": oov_drift}
+    return needs_full_retrain, metrics
+
+
+@task
+def warm_start(
+    pipeline: imblearnPipeline,
+    X_train: pd.DataFrame,
+    y_train: pd.Series,
+    X_calibration: pd.DataFrame,
+    y_calibration: pd.Series,
+) -> Tuple[imblearnPipeline, Dict[str, float]]:
+    """
+    Boosts INCREMENTAL_N_ESTIMATORS trees on new rows on top of a fitted pipeline,
+    and re-tunes its threshold on the calibration rows.
+    """
+    logger = get_run_logger()
+    logger.info(f"Warm starting the pipeline on {len(X_train)} new rows")
+    with track_peak_memory("Warm start fit") as memory_usage:
+        start = time.perf_counter()
+        warm = warm_start_pipeline(
+            pipeline,
+            X_train,
+            y_train,
+            INCREMENTAL_N_ESTIMATORS,
+            X_calibration,
+            y_calibration,
+        )
+        fit_seconds = time.perf_counter() - start
+    logger.info(f"Warm start fit took {fit_seconds:.2f} s")
+    return warm, {**memory_metrics("fit", memory_usage), "fit_seconds": fit_seconds}
+
+
+@task
+def train_out_of_core(
+    gcs_handler: GCSVersionedDataHandler, data_hashes: List[str]
+) -> Tuple[Pipeline, Dict, Dict[str, float], int]:
+    """
+    Trains a pipeline on the data streamed from GCS chunk by chunk.
+
+    Neither the data nor its features are held in memory at once: the featurized
+    chunks go to XGBoost external memory, and the rows are split into train and
+    test sets by a hash of their features.
+
+    Args:
+        gcs_handler: GCSVersionedDataHandler instance.
+        data_hashes: Training data shards to train on, with the original data.
+
+    Returns:
+        The fitted pipeline, the classification report of the test rows, the peak
+        memory of each stage as metrics to log, and the number of rows.
+    """
+    logger = get_run_logger()
+    shards = [
+        shard
+        for shard in gcs_handler.get_training_data_shards()
+        if shard["data_hash"] in data_hashes
+    ]
+
+    def stream(test: bool):
+        chunks = itertools.chain(
+            gcs_handler.download_original_data_chunks(),
+            (chunk for _, chunk in gcs_handler.download_shards_chunks(shards)),
+        )
+        for chunk in chunks:
+            chunk = chunk[["article", "section", "is_relevant"]]
+            chunk = chunk[in_test_split(chunk) == test]
+            if len(chunk):
+                yield chunk
+
+    logger.info(f"Training out of core on the original data and {len(shards)} shards")
+    model = Model(tree_method=XGB_TREE_METHOD, calibration=THRESHOLD_CALIBRATION)
+    model.set_params(n_estimators=OUT_OF_CORE_N_ESTIMATORS)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        pipeline, stages = fit_out_of_core(
+            DataProcessor(
+                vectorizer="hashing",
+                n_features=HASHING_N_FEATURES,
+                normalize=NORMALIZE_TEXT,
+            ),
+            model,
+            lambda: stream(test=False),
+            cache_dir,
+        )
+    with track_peak_memory("streaming evaluation") as usage:
+        y_test, y_pred = predict_chunks(pipeline, stream(test=True))
+    stages["evaluation"] = usage
+    metrics = {}
+    for stage, usage in stages.items():
+        logger.info(f"{stage} peak memory: {usage.peak_mb:.1f} MB")
+        metrics.update(memory_metrics(stage, usage))
+    n_rows = pipeline.named_steps["features"].streamed_counts_["documents"]
+    report = classification_report(y_test, y_pred, output_dict=True)
+    return pipeline, report, metrics, n_rows + len(y_test)
 
 
 @task
 def evaluation(
-    grid_search: GridSearchCV, X_test: pd.DataFrame, y_test: pd.Series
+    pipeline: imblearnPipeline, X_test: pd.DataFrame, y_test: pd.Series
 ) -> Dict:
     logger = get_run_logger()
     logger.info("Evaluating the best model")
-    y_pred = grid_search.predict(X_test)
+    y_pred = pipeline.predict(X_test)
     report = classification_report(y_test, y_pred, output_dict=True)
     return report
 
 
+def regressed_metrics(report: Dict, baseline_report: Dict) -> List[str]:
+    """
+    The PROMOTION_METRICS of a classification report lower than in the baseline one.
+    """
+    return [
+        name
+        for name, metric in PROMOTION_METRICS.items()
+        if metric(report) < metric(baseline_report)
+    ]
+
+
 @task
 def log_metrics_and_model(
-    report: Dict, grid_search: GridSearchCV, model_name: str, model_stage: Optional[str]
+    report: Dict,
+    grid_search: Optional[GridSearchCV],
+    model_name: str,
+    model_stage: Optional[str],
+    fit_metrics: Optional[Dict[str, float]] = None,
+    pipeline: Optional[imblearnPipeline] = None,
+    training_state: Optional[Dict] = None,
 ) -> None:
     """
     Logs metrics and model to MLFlow, registers the model, and logs model version as a Prefect artifact.
+
+    The pipeline logged is the best estimator of the grid search, unless another
+    one, like its pruned refit or a warm started pipeline without grid search, is
+    given. The training state, the shards and rows the pipeline was trained on, is
+    logged for the next incremental run.
     """
+    if pipeline is None:
+        pipeline = grid_search.best_estimator_
     logger = get_run_logger()
     logger.info("Logging metrics and model")
     logger.info(report)
@@ -146,10 +624,15 @@ def log_metrics_and_model(
     mlflow.log_metric("precision", report["macro avg"]["precision"])
     mlflow.log_metric("recall", report["macro avg"]["recall"])
     mlflow.log_metric("f1-score", report["macro avg"]["f1-score"])
+    if fit_metrics:
+        mlflow.log_metrics(fit_metrics)
 
-    class_labels = grid_search.best_estimator_.named_steps["model"].classes_
+    class_labels = pipeline.named_steps["model"].classes_
     table_data = []
     for i, class_label in enumerate(class_labels):
+        # A few new rows of an incremental run may hold a single class
+        if str(i) not in report:
+            continue
         mlflow.log_metric(f"{class_label}_precision", report[str(i)]["precision"])
         mlflow.log_metric(f"{class_label}_recall", report[str(i)]["recall"])
         mlflow.log_metric(f"{class_label}_f1-score", report[str(i)]["f1-score"])
@@ -187,10 +670,27 @@ def log_metrics_and_model(
         description="Classification Report",
     )
 
-    logger.info(grid_search.best_params_)
-    mlflow.log_params(grid_search.best_params_)
+    if grid_search is not None:
+        logger.info(grid_search.best_params_)
+        mlflow.log_params(grid_search.best_params_)
+    if training_state is not None:
+        mlflow.log_param("training_mode", training_state["mode"])
+        mlflow.log_dict(training_state, TRAINING_STATE_ARTIFACT)
+    features = pipeline.named_steps["features"]
+    mlflow.log_params(
+        {
+            f"features__{key}": value
+            for key, value in features.get_params().items()
+            # The pruned vocabulary is too long for a parameter, its size is a metric
+            if key != "vocabulary"
+        }
+    )
     mlflow.set_tag("model_name", model_name)
-    mlflow.sklearn.log_model(grid_search.best_estimator_, "model")
+    mlflow.sklearn.log_model(pipeline, "model")
+    # Lean copy of the model the predict flow loads without unpickling the pipeline
+    with tempfile.TemporaryDirectory() as bundle_dir:
+        InferenceBundle.from_pipeline(pipeline).save(bundle_dir)
+        mlflow.log_artifacts(bundle_dir, INFERENCE_BUNDLE_ARTIFACT)
 
     # Register the model
     run_id = mlflow.active_run().info.run_id
@@ -226,33 +726,161 @@ def log_metrics_and_model(
 
 
 @flow(name="train-flow")
-def train_flow(model_stage: Optional[str]) -> None:
+def train_flow(model_stage: Optional[str], full_retrain: bool = True) -> None:
     """
     The main flow for training the model, includes loading data, splitting it, creating and fitting a pipeline,
     evaluating the pipeline, and logging metrics and model.
+
+    With `full_retrain` unset, the Production model is warm started on all the
+    reviewed shards it wasn't trained on instead, so the fit scales with the new
+    data. Its threshold is re-tuned on half of the test rows of the last full
+    retrain, and it is evaluated against the Production model on the other half,
+    only moving to `model_stage` if none of its PROMOTION_METRICS is lower.
+    A full retrain still runs if there is no such model or the new data drifted.
     """
     logger = get_run_logger()
     logger.info("Starting training flow")
 
     # Create a GCSVersionedDataHandler instance
     gcs_handler = GCSVersionedDataHandler(BUCKET_NAME)
+    shards = list_training_shards(gcs_handler)
+    data_hashes = [shard["data_hash"] for shard in shards]
+
+    production = None if full_retrain else load_production_state(MODEL_NAME)
+    if production is not None:
+        pipeline, state = production
+        new_shards = [
+            shard for shard in shards if shard["data_hash"] not in state["shards"]
+        ]
+        new_rows = sum(shard["rows"] for shard in new_shards)
+        if new_rows < MIN_NEW_ROWS:
+            logger.info(
+                f"Only {new_rows} new rows to train on, keeping the Production model"
+            )
+            return
+        new_hashes = [shard["data_hash"] for shard in new_shards]
+        new_df = run_cached(
+            load_training_data, gcs_handler, new_hashes, include_original=False
+        )
+        needs_full_retrain, drift_metrics = check_drift(pipeline, state, new_df)
+        if not needs_full_retrain:
+            # No model since the last full retrain was trained on its test rows
+            full_df = run_cached(load_training_data, gcs_handler, state["full_shards"])
+            _, X_holdout, _, y_holdout = run_cached(split_data, full_df)
+            X_calibration, X_test, y_calibration, y_test = train_test_split(
+                X_holdout,
+                y_holdout,
+                test_size=0.5,
+                stratify=y_holdout,
+                random_state=42,
+            )
+            warm_pipeline, fit_metrics = warm_start(
+                pipeline,
+                new_df[["article", "section"]],
+                new_df["is_relevant"],
+                X_calibration,
+                y_calibration,
+            )
+            report = evaluation(warm_pipeline, X_test, y_test)
+            production_report = evaluation(pipeline, X_test, y_test)
+            regressed = regressed_metrics(report, production_report)
+            if regressed:
+                logger.info(
+                    f"The warm started model has a lower {' and '.join(regressed)} "
+                    "than the Production model, registering it without promoting it"
+                )
+            training_state = {
+                **state,
+                "mode": "incremental",
+                "shards": state["shards"] + new_hashes,
+                "rows": state["rows"] + len(new_df),
+            }
+            production_metrics = {
+                f"production_{name}": metric(production_report)
+                for name, metric in PROMOTION_METRICS.items()
+            }
+            log_metrics_and_model(
+                report,
+                None,
+                MODEL_NAME,
+                None if regressed else model_stage,
+                {**fit_metrics, **drift_metrics, **production_metrics},
+                warm_pipeline,
+                training_state,
+            )
+            return
+        logger.info("The new data drifted from the Production model, retraining")
+
+    if OUT_OF_CORE:
+        pipeline, report, fit_metrics, n_rows = train_out_of_core(
+            gcs_handler, data_hashes
+        )
+        # Hashed articles have no vocabulary to drift from. The test rows are split by
+        # hash, not by split_data, so no `full_shards` is logged to warm start from
+        training_state = {
+            "mode": "full",
+            "shards": data_hashes,
+            "rows": n_rows,
+            "full_rows": n_rows,
+            "oov_rate": 0.0,
+        }
+        log_metrics_and_model(
+            report,
+            None,
+            MODEL_NAME,
+            model_stage,
+            fit_metrics,
+            pipeline,
+            training_state,
+        )
+        return
 
     # Load and split the data
-    df = load_training_data(gcs_handler)
-    X_train, X_test, y_train, y_test = split_data(df)
+    df = run_cached(load_training_data, gcs_handler, data_hashes)
+    X_train, X_test, y_train, y_test = run_cached(split_data, df)
 
     # Create pipeline and grid search
     pipeline = create_pipeline()
     grid_search = create_grid_search(pipeline)
 
     # Train
-    fit(grid_search, X_train, y_train)
+    fit_metrics = fit(grid_search, X_train, y_train)
+    best_pipeline = grid_search.best_estimator_
+    if PRUNE_VOCABULARY:
+        best_pipeline, prune_metrics = prune_pipeline(best_pipeline, X_train, y_train)
+        fit_metrics = {**fit_metrics, **prune_metrics}
 
     # Evaluate
-    report = evaluation(grid_search, X_test, y_test)
+    report = evaluation(best_pipeline, X_test, y_test)
+    if COMPARED_BACKENDS:
+        backend_metrics = compare_backends(
+            best_pipeline, X_train, y_train, X_test, y_test, COMPARED_BACKENDS
+        )
+        fit_metrics = {**fit_metrics, **backend_metrics}
+
+    # Baseline the drift checks of the next incremental runs compare against, and
+    # the shards their test rows are split from
+    training_state = {
+        "mode": "full",
+        "shards": data_hashes,
+        "full_shards": data_hashes,
+        "rows": len(df),
+        "full_rows": len(df),
+        "oov_rate": best_pipeline.named_steps["features"].out_of_vocabulary_rate(
+            X_test
+        ),
+    }
 
     # Log metrics and model
-    log_metrics_and_model(report, grid_search, MODEL_NAME, model_stage)
+    log_metrics_and_model(
+        report,
+        grid_search,
+        MODEL_NAME,
+        model_stage,
+        fit_metrics,
+        best_pipeline,
+        training_state,
+    )
 
 
 if __name__ == "__main__":
@@ -1,11 +1,13 @@
-import hashlib
 import os
 
 import pandas as pd
 import streamlit as st
 from google.oauth2 import service_account
 
-from email_discriminator.core.data_versioning import GCSVersionedDataHandler
+from email_discriminator.core.data_versioning import (
+    GCSVersionedDataHandler,
+    dataset_fingerprint,
+)
 
 # Initialize GCS handler
 BUCKET_NAME = os.getenv("BUCKET_NAME", "email-discriminator")
@@ -40,21 +42,19 @@ def upload_reviewed_data(
     unreviewed_csv_string = unreviewed_df.to_csv(index=False)
 
     # Compute the data hash for each CSV string
-    reviewed_data_hash = hashlib.sha256(reviewed_df.to_string().encode()).hexdigest()[
-        :10
-    ]
-    unreviewed_data_hash = hashlib.sha256(
-        unreviewed_df.to_string().encode()
-    ).hexdigest()[:10]
-
-    # Upload the reviewed data to the training_data folder
-    gcs_handler.upload_training_data(reviewed_csv_string, reviewed_data_hash)
-
-    # Upload the unreviewed data to the 'new' folder and the reviewed data to the 'old' folder in the predicted_data directory
-    gcs_handler.upload_predicted_data(reviewed_csv_string, reviewed_data_hash, "old/")
-    gcs_handler.upload_predicted_data(
-        unreviewed_csv_string, unreviewed_data_hash, "new/"
-    )
-
-    # Delete the old file from the 'new' folder
-    gcs_handler.delete_predicted_file(old_file_name)
+    reviewed_data_hash = dataset_fingerprint(reviewed_df)
+    unreviewed_data_hash = dataset_fingerprint(unreviewed_df)
+
+    # Batch the server-side copy and delete, and update the manifest once
+    with gcs_handler.batch():
+        # Upload the reviewed data to the training_data folder
+        gcs_handler.upload_training_data(reviewed_csv_string, reviewed_data_hash)
+
+        # Upload the unreviewed data to the 'new' folder and copy the reviewed data to the 'old' folder in the predicted_data directory
+        gcs_handler.upload_predicted_data(
+            unreviewed_csv_string, unreviewed_data_hash, "new/"
+        )
+        gcs_handler.copy_training_data_to_predicted(reviewed_data_hash, "old/")
+
+        # Delete the old file from the 'new' folder
+        gcs_handler.delete_predicted_file(old_file_name)
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from email_discriminator.core.data_versioning import (
+    AsyncVersionedDataHandler,
+    GCSVersionedDataHandler,
+    InMemoryStorageBackend,
+    ObjectNotFoundError,
+)
+
+
+# Fixture for a fresh async handler, backed by an in-memory bucket
+@pytest.fixture
+def handler():
+    yield AsyncVersionedDataHandler("memory://test-bucket", max_concurrency=4)
+    InMemoryStorageBackend.clear()
+
+
+def test_wraps_handler():
+    gcs_handler = GCSVersionedDataHandler("memory://test-bucket")
+    assert AsyncVersionedDataHandler(gcs_handler).handler is gcs_handler
+    InMemoryStorageBackend.clear()
+
+
+def test_upload_download_string(handler):
+    async def main():
+        await handler.upload_string("test", "path/to/test.txt")
+        return await handler.download_string("path/to/test.txt")
+
+    assert asyncio.run(main()) == "test"
+
+
+def test_download_dataframe(handler):
+    async def main():
+        await handler.upload_training_data("article,section\na,b\nc,d\n", "0")
+        return await handler.download_dataframe(
+            "data/training_data/tldr_articles_0.csv", chunksize=1
+        )
+
+    assert asyncio.run(main())["article"].tolist() == ["a", "c"]
+
+
+def test_move_and_delete(handler):
+    async def main():
+        await asyncio.gather(
+            handler.upload_predicted_data("article\na\n", "0", "new/"),
+            handler.upload_predicted_data("article\nb\n", "1", "new/"),
+        )
+        await asyncio.gather(
+            handler.move_predicted_data_to_old("0"),
+            handler.delete_predicted_file("1"),
+        )
+        return await handler.list_shards()
+
+    shards = asyncio.run(main())
+    assert [shard["path"] for shard in shards] == [
+        "data/predicted_data/old/tldr_articles_0.csv"
+    ]
+    with pytest.raises(ObjectNotFoundError):
+        handler.handler.download_predicted_data("1")
+
+
+def test_concurrent_uploads_update_manifest(handler):
+    async def main():
+        await asyncio.gather(
+            *(
+                handler.upload_training_data(f"article\n{i}\n", str(i))
+                for i in range(10)
+            )
+        )
+        return await handler.download_all_training_data()
+
+    result = asyncio.run(main())
+    assert result == {str(i): f"article\n{i}\n" for i in range(10)}
+
+
+def test_concurrent_uploads_do_not_conflict(handler):
+    load_manifest = handler.handler.load_manifest
+
+    def slow_load_manifest():
+        manifest = load_manifest()
+        # Leaves time for other threads to write the manifest in between.
+        time.sleep(0.01)
+        return manifest
+
+    async def main():
+        await asyncio.gather(
+            *(handler.upload_training_data(f"article\n{i}\n", str(i)) for i in range(8))
+        )
+        return await handler.list_shards("data/training_data/")
+
+    with patch.object(
+        handler.handler, "load_manifest", side_effect=slow_load_manifest
+    ), patch(
+        "email_discriminator.core.data_versioning.gcs_versioned_data_handler."
+        "MANIFEST_MAX_RETRIES",
+        1,
+    ):
+        shards = asyncio.run(main())
+    assert len(shards) == 8
+
+
+def test_download_all_training_dataframes(handler):
+    async def main():
+        for i in range(3):
+            await handler.upload_training_data("article\na\nb\n", str(i))
+        await handler.upload_predicted_data("article\na\n", "3", "new/")
+        return (
+            await handler.download_all_training_dataframes(),
+            await handler.download_new_predicted_data(),
+        )
+
+    training_data, predicted_data = asyncio.run(main())
+    assert sorted(training_data) == ["0", "1", "2"]
+    assert all(len(df) == 2 for df in training_data.values())
+    assert predicted_data == {"3": "article\na\n"}
+
+
+def test_concurrency_limit(handler):
+    lock = threading.Lock()
+    running = []
+    max_running = []
+
+    def slow_operation():
+        with lock:
+            running.append(1)
+            max_running.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.pop()
+
+    async def main():
+        await asyncio.gather(*(handler.run(slow_operation) for _ in range(20)))
+
+    asyncio.run(main())
+    assert max(max_running) == 4
+    # The handler can be used again from a new event loop.
+    asyncio.run(main())
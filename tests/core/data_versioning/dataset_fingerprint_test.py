@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+from email_discriminator.core.data_versioning import dataset_fingerprint, hash_rows
+
+
+def make_df():
+    return pd.DataFrame(
+        {
+            "section": ["QUICK LINKS", "MISCELLANEOUS", "QUICK LINKS"],
+            "article": ["First article", "Second article", "Third article"],
+            "is_relevant": [1, 0, 1],
+        }
+    )
+
+
+def test_fingerprint_is_deterministic():
+    assert dataset_fingerprint(make_df()) == dataset_fingerprint(make_df())
+
+
+def test_fingerprint_length():
+    assert len(dataset_fingerprint(make_df())) == 10
+    assert len(dataset_fingerprint(make_df(), length=16)) == 16
+
+
+def test_fingerprint_ignores_column_order_and_index():
+    df = make_df()
+    reordered = df[["is_relevant", "article", "section"]]
+    reindexed = df.set_index(pd.Index([10, 20, 30]))
+    assert dataset_fingerprint(df) == dataset_fingerprint(reordered)
+    assert dataset_fingerprint(df) == dataset_fingerprint(reindexed)
+
+
+def test_fingerprint_changes_with_content():
+    df = make_df()
+    changed = df.copy()
+    changed.loc[1, "is_relevant"] = 1
+    assert dataset_fingerprint(df) != dataset_fingerprint(changed)
+    assert dataset_fingerprint(df) != dataset_fingerprint(df.iloc[::-1])
+    assert dataset_fingerprint(df) != dataset_fingerprint(
+        df.rename(columns={"article": "text"})
+    )
+
+
+def test_fingerprint_canonical_columns():
+    df = make_df()
+    predicted = df.assign(predicted_is_relevant=[0, 0, 1])
+    assert dataset_fingerprint(
+        df, columns=["section", "article"]
+    ) == dataset_fingerprint(predicted, columns=["article", "section"])
+
+
+def test_fingerprint_does_not_depend_on_display_options():
+    df = make_df()
+    fingerprint = dataset_fingerprint(df)
+    with pd.option_context("display.max_colwidth", 5, "display.max_rows", 1):
+        assert dataset_fingerprint(df) == fingerprint
+
+
+def test_fingerprint_empty_dataframe():
+    df = make_df().iloc[:0]
+    assert len(dataset_fingerprint(df)) == 10
+    assert len(hash_rows(df)) == 0
+
+
+def test_hash_rows():
+    df = make_df()
+    row_hashes = hash_rows(df, columns=["article", "section"])
+    assert row_hashes.dtype == np.uint64
+    assert len(np.unique(row_hashes)) == 3
+    assert np.array_equal(
+        row_hashes[1:], hash_rows(df.iloc[1:], ["section", "article"])
+    )
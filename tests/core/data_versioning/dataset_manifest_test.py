@@ -0,0 +1,97 @@
+from email_discriminator.core.data_versioning import DatasetManifest
+from email_discriminator.core.data_versioning.dataset_manifest import (
+    data_hash_from_path,
+    describe_csv,
+    is_dataset_path,
+)
+
+
+def test_describe_csv():
+    csv_string = 'article,section\n"multi\nline",a\nsingle,b\n'
+    description = describe_csv(csv_string)
+    assert description["rows"] == 2, "Quoted newlines should not count as rows."
+    assert description["schema"] == ["article", "section"]
+    assert description["bytes"] == len(csv_string.encode())
+
+
+def test_describe_empty_csv():
+    description = describe_csv("")
+    assert description["rows"] == 0
+    assert description["schema"] == []
+
+
+def test_data_hash_from_path():
+    assert data_hash_from_path("data/training_data/tldr_articles_abc.csv") == "abc"
+    assert data_hash_from_path("data/original_data/tldr_articles.csv") is None
+
+
+def test_is_dataset_path():
+    assert is_dataset_path("data/training_data/tldr_articles_abc.csv")
+    assert not is_dataset_path("data/manifest.json")
+    assert not is_dataset_path("secrets/token.pickle")
+
+
+def test_manifest_add_move_remove():
+    manifest = DatasetManifest()
+    manifest.add_shard("data/predicted_data/new/tldr_articles_a.csv", "x\n1\n")
+    manifest.add_shard("data/training_data/tldr_articles_b.csv", "x\n1\n2\n")
+
+    assert len(manifest) == 2
+    assert manifest.get_shards("data/training_data/")[0]["rows"] == 2
+
+    manifest.move_shard(
+        "data/predicted_data/new/tldr_articles_a.csv",
+        "data/predicted_data/old/tldr_articles_a.csv",
+    )
+    assert manifest.get_shards("data/predicted_data/new/") == []
+    moved = manifest.get_shards("data/predicted_data/old/")[0]
+    assert moved["path"] == "data/predicted_data/old/tldr_articles_a.csv"
+    assert moved["data_hash"] == "a"
+
+    manifest.remove_shard("data/training_data/tldr_articles_b.csv")
+    assert "data/training_data/tldr_articles_b.csv" not in manifest
+
+
+def test_manifest_missing_shards_are_ignored():
+    manifest = DatasetManifest()
+    manifest.remove_shard("data/training_data/tldr_articles_missing.csv")
+    manifest.move_shard(
+        "data/training_data/tldr_articles_missing.csv",
+        "data/training_data/tldr_articles_other.csv",
+    )
+    assert len(manifest) == 0
+
+
+def test_manifest_json_roundtrip():
+    manifest = DatasetManifest()
+    manifest.add_shard(
+        "data/training_data/tldr_articles_a.csv", "x\n1\n", created="2023-08-01"
+    )
+    loaded = DatasetManifest.from_json(manifest.to_json(), generation=7)
+    assert loaded.shards == manifest.shards
+    assert loaded.generation == 7
+
+
+def test_manifest_fingerprint():
+    manifest = DatasetManifest()
+    manifest.add_shard(
+        "data/training_data/tldr_articles_a.csv", "x\n1\n", created="2023-08-01"
+    )
+    manifest.add_shard(
+        "data/original_data/tldr_articles.csv", "x\n2\n", created="2023-08-01"
+    )
+    fingerprint = manifest.fingerprint("data/training_data/")
+    assert fingerprint == manifest.fingerprint("data/training_data/", ["a"])
+    assert fingerprint != manifest.fingerprint()
+    assert fingerprint != manifest.fingerprint("data/training_data/", ["b"])
+
+    # Another shard under the prefix or a rewritten one changes the fingerprint
+    manifest.add_shard(
+        "data/training_data/tldr_articles_b.csv", "x\n3\n", created="2023-08-02"
+    )
+    assert fingerprint == manifest.fingerprint("data/training_data/", ["a"])
+    assert fingerprint != manifest.fingerprint("data/training_data/")
+    manifest.add_shard(
+        "data/training_data/tldr_articles_a.csv", "x\n1\n", created="2023-08-03"
+    )
+    assert fingerprint != manifest.fingerprint("data/training_data/", ["a"])
@@ -1,27 +1,57 @@
+import gzip
 import json
 import pickle
-from unittest.mock import MagicMock, Mock, patch
+from unittest.mock import DEFAULT, MagicMock, patch
 
 import pytest
+from google.api_core.exceptions import NotFound
 
-from email_discriminator.core.data_versioning import GCSVersionedDataHandler
+from email_discriminator.core.data_versioning import (
+    MANIFEST_PATH,
+    DatasetManifest,
+    GCSVersionedDataHandler,
+    InMemoryStorageBackend,
+    ObjectNotFoundError,
+    PreconditionFailedError,
+)
 
 # Mocked objects for our tests
 mock_bucket = MagicMock()
 mock_blob = MagicMock()
+mock_manifest_blob = MagicMock()
 
 
 # Fixture for a fresh instance of the handler
 @pytest.fixture
 def handler():
     with patch(
-        "email_discriminator.core.data_versioning.gcs_versioned_data_handler.storage.Client"
+        "email_discriminator.core.data_versioning.storage_backend.storage.Client"
     ) as MockClient:
         MockClient.return_value.get_bucket.return_value = mock_bucket
         MockClient.return_value.bucket.return_value = mock_bucket
         mock_bucket.blob.return_value = mock_blob
+        # The bucket has no dataset manifest yet, so it is rebuilt from a listing.
+        mock_bucket.blob.side_effect = lambda path, generation=None: (
+            mock_manifest_blob if path == MANIFEST_PATH else DEFAULT
+        )
+        mock_bucket.get_blob.return_value = None
+        mock_manifest_blob.download_as_bytes.side_effect = NotFound("manifest")
+        mock_blob.download_as_bytes.return_value = b"test"
         yield GCSVersionedDataHandler("test-bucket")
         mock_bucket.reset_mock()
+        mock_blob.reset_mock()
+        mock_manifest_blob.reset_mock()
+
+
+def uploaded_data():
+    return gzip.decompress(mock_blob.upload_from_string.call_args.args[0]).decode()
+
+
+def mock_blobs(prefix, n):
+    blobs = [MagicMock(size=4, time_created=None) for _ in range(n)]
+    for i, blob in enumerate(blobs):
+        blob.name = f"{prefix}tldr_articles_{i}.csv"
+    return blobs
 
 
 def test_enable_versioning(handler):
@@ -40,14 +70,16 @@ def test_upload_string(handler):
     test_str = "test"
     test_path = "path/to/test.txt"
     handler.upload_string(test_str, test_path)
-    mock_blob.upload_from_string.assert_called_with(test_str)
+    mock_blob.upload_from_string.assert_called_with(
+        test_str.encode(), content_type=None, if_generation_match=None
+    )
 
 
 def test_download_string_without_version(handler):
     test_path = "path/to/test.txt"
     handler.download_string(test_path)
     mock_bucket.blob.assert_called_with(test_path, generation=None)
-    assert mock_blob.download_as_text.called
+    assert mock_blob.download_as_bytes.called
 
 
 def test_download_string_with_version(handler):
@@ -55,19 +87,19 @@ def test_download_string_with_version(handler):
     test_path = "path/to/test.txt"
     handler.download_string(test_path, version)
     mock_bucket.blob.assert_called_with(test_path, generation=version)
-    assert mock_blob.download_as_text.called
+    assert mock_blob.download_as_bytes.called
 
 
 def test_move_file_string(handler):
     src_path = "path/to/source.txt"
     dest_path = "path/to/dest.txt"
     handler.move_file_string(src_path, dest_path)
-    mock_blob.move_to.assert_called_once()
+    mock_bucket.rename_blob.assert_called_once_with(mock_blob, dest_path)
 
 
 def test_upload_original_data(handler):
     handler.upload_original_data("path/on/disk.csv")
-    mock_blob.upload_from_string.assert_called_with("path/on/disk.csv")
+    assert uploaded_data() == "path/on/disk.csv"
 
 
 def test_download_original_data(handler):
@@ -75,14 +107,14 @@ def test_download_original_data(handler):
     mock_bucket.blob.assert_called_with(
         "data/original_data/tldr_articles.csv", generation=None
     )
-    assert mock_blob.download_as_text.called
+    assert mock_blob.download_as_bytes.called
 
 
 def test_upload_unlabelled_data(handler):
     csv_string = "test_csv"
     data_hash = "test_hash"
     handler.upload_unlabelled_data(csv_string, data_hash)
-    mock_blob.upload_from_string.assert_called_with(csv_string)
+    assert uploaded_data() == csv_string
 
 
 def test_download_unlabelled_data(handler):
@@ -91,7 +123,7 @@ def test_download_unlabelled_data(handler):
     mock_bucket.blob.assert_called_with(
         f"data/unlabelled_data/tldr_articles_{data_hash}.csv", generation=None
     )
-    assert mock_blob.download_as_text.called
+    assert mock_blob.download_as_bytes.called
 
 
 def test_upload_predicted_data(handler):
@@ -99,7 +131,7 @@ def test_upload_predicted_data(handler):
     data_hash = "test_hash"
     folder = "test_folder"
     handler.upload_predicted_data(csv_string, data_hash, folder)
-    mock_blob.upload_from_string.assert_called_with(csv_string)
+    assert uploaded_data() == csv_string
 
 
 def test_download_predicted_data(handler):
@@ -108,20 +140,20 @@ def test_download_predicted_data(handler):
     mock_bucket.blob.assert_called_with(
         f"data/predicted_data/new/tldr_articles_{data_hash}.csv", generation=None
     )
-    assert mock_blob.download_as_text.called
+    assert mock_blob.download_as_bytes.called
 
 
 def test_move_predicted_data_to_old(handler):
     data_hash = "test_hash"
     handler.move_predicted_data_to_old(data_hash)
-    mock_blob.move_to.assert_called_once()
+    mock_bucket.rename_blob.assert_called_once()
 
 
 def test_upload_training_data(handler):
     csv_string = "test_csv"
     data_hash = "test_hash"
     handler.upload_training_data(csv_string, data_hash)
-    mock_blob.upload_from_string.assert_called_with(csv_string)
+    assert uploaded_data() == csv_string
 
 
 def test_download_training_data(handler):
@@ -130,24 +162,19 @@ def test_download_training_data(handler):
     mock_bucket.blob.assert_called_with(
         f"data/training_data/tldr_articles_{data_hash}.csv", generation=None
     )
-    assert mock_blob.download_as_text.called
+    assert mock_blob.download_as_bytes.called
 
 
 def test_download_all_training_data(handler):
-    blobs = [
-        MagicMock(name=f"data/training_data/tldr_articles_{i}.csv") for i in range(5)
-    ]
-    mock_bucket.list_blobs.return_value = blobs
+    blobs = mock_blobs("data/training_data/", 5)
+    handler.backend.storage_client.list_blobs.return_value = blobs
     result = handler.download_all_training_data()
     assert len(result) == 5
 
 
 def test_download_new_predicted_data(handler):
-    blobs = [
-        MagicMock(name=f"data/predicted_data/new/tldr_articles_{i}.csv")
-        for i in range(5)
-    ]
-    mock_bucket.list_blobs.return_value = blobs
+    blobs = mock_blobs("data/predicted_data/new/", 5)
+    handler.backend.storage_client.list_blobs.return_value = blobs
     result = handler.download_new_predicted_data()
     assert len(result) == 5
 
@@ -155,7 +182,9 @@ def test_download_new_predicted_data(handler):
 def test_delete_predicted_file(handler):
     data_hash = "test_hash"
     handler.delete_predicted_file(data_hash)
-    mock_blob.delete.assert_called_once()
+    mock_bucket.delete_blob.assert_called_once_with(
+        f"data/predicted_data/new/tldr_articles_{data_hash}.csv"
+    )
 
 
 def test_read_token_from_gcs(handler):
@@ -169,11 +198,441 @@ def test_read_token_from_gcs(handler):
 def test_write_token_to_gcs(handler):
     test_creds = "credentials"
     handler.write_token_to_gcs(test_creds, "test-bucket", "blob-name")
-    mock_blob.upload_from_string.assert_called_with(pickle.dumps(test_creds))
+    mock_blob.upload_from_string.assert_called_with(
+        pickle.dumps(test_creds), content_type=None, if_generation_match=None
+    )
 
 
 def test_read_client_secret_from_gcs(handler):
     client_secrets_json = {"test": "test"}
-    mock_blob.download_as_text.return_value = json.dumps(client_secrets_json)
+    mock_blob.download_as_bytes.return_value = json.dumps(client_secrets_json).encode()
     result = handler.read_client_secrets_from_gcs("test-bucket", "blob-name")
     assert result == client_secrets_json
+
+
+# Fixture for a fresh instance of the handler, backed by an in-memory bucket
+@pytest.fixture
+def memory_handler():
+    yield GCSVersionedDataHandler("memory://test-bucket")
+    InMemoryStorageBackend.clear()
+
+
+def read(handler, path):
+    data = handler.backend.download(path)[0]
+    if path.endswith(".csv"):
+        data = gzip.decompress(data)
+    return data.decode()
+
+
+def stored_manifest(handler):
+    return DatasetManifest.from_json(read(handler, MANIFEST_PATH))
+
+
+def put_shards(handler, prefix, n):
+    for i in range(n):
+        handler.upload_string("article\ntest\n", f"{prefix}tldr_articles_{i}.csv")
+
+
+def test_uri_selects_backend():
+    with patch(
+        "email_discriminator.core.data_versioning.storage_backend.storage.Client"
+    ) as MockClient:
+        handler = GCSVersionedDataHandler("test-bucket")
+    MockClient.return_value.bucket.assert_called_with("test-bucket")
+    assert type(handler.backend).__name__ == "GCSStorageBackend"
+
+
+def test_custom_backend():
+    backend = InMemoryStorageBackend("custom")
+    handler = GCSVersionedDataHandler("any-name", backend=backend)
+    assert handler.backend is backend
+
+
+def test_enable_versioning_in_memory(memory_handler):
+    memory_handler.enable_versioning()
+    assert memory_handler.backend.versioning_enabled == True
+
+
+def test_disable_versioning_in_memory(memory_handler):
+    memory_handler.enable_versioning()
+    memory_handler.disable_versioning()
+    assert memory_handler.backend.versioning_enabled == False
+
+
+def test_upload_string_in_memory(memory_handler):
+    test_str = "test"
+    test_path = "path/to/test.txt"
+    memory_handler.upload_string(test_str, test_path)
+    assert read(memory_handler, test_path) == test_str
+
+
+def test_download_string_without_version_in_memory(memory_handler):
+    test_path = "path/to/test.txt"
+    memory_handler.upload_string("first", test_path)
+    memory_handler.upload_string("second", test_path)
+    assert memory_handler.download_string(test_path) == "second"
+
+
+def test_download_string_with_version_in_memory(memory_handler):
+    memory_handler.enable_versioning()
+    test_path = "path/to/test.txt"
+    memory_handler.upload_string("first", test_path)
+    version = memory_handler.backend.generation(test_path)
+    memory_handler.upload_string("second", test_path)
+    assert memory_handler.download_string(test_path, version) == "first"
+
+
+def test_download_dataframe_chunks(memory_handler):
+    memory_handler.upload_string(
+        'article,section\n"multi\nline",a\nb,c\nd,e\n', "path/to/test.csv"
+    )
+    chunks = list(
+        memory_handler.download_dataframe_chunks("path/to/test.csv", chunksize=2)
+    )
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert chunks[0]["article"].tolist() == ["multi\nline", "b"]
+
+
+def test_download_dataframe(memory_handler):
+    memory_handler.enable_versioning()
+    memory_handler.upload_string("article,section\na,b\nc,d\ne,f\n", "path/to/test.csv")
+    version = memory_handler.backend.generation("path/to/test.csv")
+    memory_handler.upload_string("article,section\n", "path/to/test.csv")
+    df = memory_handler.download_dataframe(
+        "path/to/test.csv", chunksize=1, version=version
+    )
+    assert df.shape == (3, 2)
+    assert df.index.tolist() == [0, 1, 2]
+
+
+def test_download_all_training_data_chunks(memory_handler):
+    for i in range(2):
+        memory_handler.upload_training_data("article\na\nb\n", str(i))
+    chunks = list(memory_handler.download_all_training_data_chunks(chunksize=1))
+    assert [data_hash for data_hash, _ in chunks] == ["0", "0", "1", "1"]
+
+
+def test_move_file_string_in_memory(memory_handler):
+    src_path = "path/to/source.txt"
+    dest_path = "path/to/dest.txt"
+    memory_handler.upload_string("test", src_path)
+    memory_handler.move_file_string(src_path, dest_path)
+    assert read(memory_handler, dest_path) == "test"
+    with pytest.raises(ObjectNotFoundError):
+        read(memory_handler, src_path)
+
+
+def test_upload_original_data_in_memory(memory_handler):
+    memory_handler.upload_original_data("path/on/disk.csv")
+    assert (
+        read(memory_handler, "data/original_data/tldr_articles.csv")
+        == "path/on/disk.csv"
+    )
+
+
+def test_download_original_data_in_memory(memory_handler):
+    memory_handler.upload_string("article\na\n", "data/original_data/tldr_articles.csv")
+    assert memory_handler.download_original_data() == "article\na\n"
+    chunks = list(memory_handler.download_original_data_chunks())
+    assert chunks[0]["article"].tolist() == ["a"]
+
+
+def test_upload_unlabelled_data_in_memory(memory_handler):
+    csv_string = "test_csv"
+    data_hash = "test_hash"
+    memory_handler.upload_unlabelled_data(csv_string, data_hash)
+    assert (
+        read(memory_handler, f"data/unlabelled_data/tldr_articles_{data_hash}.csv")
+        == csv_string
+    )
+
+
+def test_download_unlabelled_data_in_memory(memory_handler):
+    data_hash = "test_hash"
+    memory_handler.upload_unlabelled_data("test_csv", data_hash)
+    assert memory_handler.download_unlabelled_data(data_hash) == "test_csv"
+
+
+def test_upload_predicted_data_in_memory(memory_handler):
+    csv_string = "test_csv"
+    data_hash = "test_hash"
+    folder = "test_folder"
+    memory_handler.upload_predicted_data(csv_string, data_hash, folder)
+    assert (
+        read(
+            memory_handler, f"data/predicted_data/{folder}tldr_articles_{data_hash}.csv"
+        )
+        == csv_string
+    )
+
+
+def test_download_predicted_data_in_memory(memory_handler):
+    data_hash = "test_hash"
+    memory_handler.upload_predicted_data("test_csv", data_hash, "new/")
+    assert memory_handler.download_predicted_data(data_hash) == "test_csv"
+
+
+def test_move_predicted_data_to_old_in_memory(memory_handler):
+    data_hash = "test_hash"
+    memory_handler.upload_predicted_data("test_csv", data_hash, "new/")
+    memory_handler.move_predicted_data_to_old(data_hash)
+    assert (
+        read(memory_handler, f"data/predicted_data/old/tldr_articles_{data_hash}.csv")
+        == "test_csv"
+    )
+    with pytest.raises(ObjectNotFoundError):
+        memory_handler.download_predicted_data(data_hash)
+
+
+def test_upload_training_data_in_memory(memory_handler):
+    csv_string = "test_csv"
+    data_hash = "test_hash"
+    memory_handler.upload_training_data(csv_string, data_hash)
+    assert (
+        read(memory_handler, f"data/training_data/tldr_articles_{data_hash}.csv")
+        == csv_string
+    )
+
+
+def test_download_training_data_in_memory(memory_handler):
+    data_hash = "test_hash"
+    memory_handler.upload_training_data("test_csv", data_hash)
+    assert memory_handler.download_training_data(data_hash) == "test_csv"
+
+
+def test_download_all_training_data_in_memory(memory_handler):
+    put_shards(memory_handler, "data/training_data/", 5)
+    put_shards(memory_handler, "data/predicted_data/new/", 2)
+    with patch.object(memory_handler.backend, "list_objects") as mock_list_objects:
+        result = memory_handler.download_all_training_data()
+    assert len(result) == 5
+    assert set(result) == {str(i) for i in range(5)}
+    mock_list_objects.assert_not_called()
+
+
+def test_download_new_predicted_data_in_memory(memory_handler):
+    put_shards(memory_handler, "data/predicted_data/new/", 5)
+    put_shards(memory_handler, "data/predicted_data/old/", 2)
+    with patch.object(memory_handler.backend, "list_objects") as mock_list_objects:
+        result = memory_handler.download_new_predicted_data()
+    assert len(result) == 5
+    mock_list_objects.assert_not_called()
+
+
+def test_get_training_data_shards(memory_handler):
+    put_shards(memory_handler, "data/training_data/", 3)
+    shards = memory_handler.get_training_data_shards()
+    assert [shard["data_hash"] for shard in shards] == ["0", "1", "2"]
+    assert all(shard["rows"] == 1 for shard in shards)
+    assert all(shard["schema"] == ["article"] for shard in shards)
+
+
+def test_upload_dataset_updates_manifest(memory_handler):
+    memory_handler.upload_training_data("article,section\na,b\nc,d\n", "test_hash")
+    manifest = stored_manifest(memory_handler)
+    entry = manifest.shards["data/training_data/tldr_articles_test_hash.csv"]
+    assert entry["data_hash"] == "test_hash"
+    assert entry["rows"] == 2
+    assert entry["schema"] == ["article", "section"]
+
+
+def test_upload_non_dataset_does_not_update_manifest(memory_handler):
+    memory_handler.upload_string("test", "path/to/test.txt")
+    assert memory_handler.backend.generation(MANIFEST_PATH) == 0
+
+
+def test_move_predicted_data_updates_manifest(memory_handler):
+    put_shards(memory_handler, "data/predicted_data/new/", 1)
+    memory_handler.move_predicted_data_to_old("0")
+    manifest = stored_manifest(memory_handler)
+    assert "data/predicted_data/new/tldr_articles_0.csv" not in manifest
+    assert "data/predicted_data/old/tldr_articles_0.csv" in manifest
+
+
+def test_delete_predicted_file_updates_manifest(memory_handler):
+    put_shards(memory_handler, "data/predicted_data/new/", 2)
+    memory_handler.delete_predicted_file("0")
+    manifest = stored_manifest(memory_handler)
+    assert len(manifest) == 1
+    assert "data/predicted_data/new/tldr_articles_1.csv" in manifest
+
+
+def test_update_manifest_retries_on_conflict(memory_handler):
+    other_handler = GCSVersionedDataHandler("memory://test-bucket")
+    write_manifest = memory_handler.write_manifest
+    calls = []
+
+    def concurrent_write(manifest):
+        calls.append(manifest)
+        if len(calls) == 1:
+            # Another writer updates the manifest between our read and write.
+            other_handler.upload_training_data("article\nb\n", "other_hash")
+        return write_manifest(manifest)
+
+    with patch.object(memory_handler, "write_manifest", side_effect=concurrent_write):
+        memory_handler.upload_training_data("article\na\n", "test_hash")
+
+    assert len(calls) == 2
+    manifest = stored_manifest(memory_handler)
+    assert "data/training_data/tldr_articles_test_hash.csv" in manifest
+    assert "data/training_data/tldr_articles_other_hash.csv" in manifest
+
+
+def test_update_manifest_conflicting_writer(memory_handler):
+    put_shards(memory_handler, "data/training_data/", 1)
+    stale_manifest = memory_handler.load_manifest()
+    put_shards(memory_handler, "data/training_data/", 2)
+    with pytest.raises(PreconditionFailedError):
+        memory_handler.write_manifest(stale_manifest)
+
+
+def test_update_manifest_gives_up(memory_handler):
+    with patch.object(
+        memory_handler,
+        "write_manifest",
+        side_effect=PreconditionFailedError("conflict"),
+    ):
+        with pytest.raises(RuntimeError):
+            memory_handler.update_manifest(lambda manifest: None)
+
+
+def test_datasets_are_stored_compressed(memory_handler):
+    csv_string = "article\n" + "test\n" * 100
+    memory_handler.upload_training_data(csv_string, "test_hash")
+    path = "data/training_data/tldr_articles_test_hash.csv"
+    data = memory_handler.backend.download(path)[0]
+    assert data[:2] == b"\x1f\x8b"
+    assert memory_handler.download_training_data("test_hash") == csv_string
+    assert memory_handler.download_dataframe(path).shape == (100, 1)
+    entry = stored_manifest(memory_handler).shards[path]
+    assert entry["stored_bytes"] == len(data)
+    assert entry["stored_bytes"] < entry["bytes"]
+
+
+def test_non_datasets_are_stored_plain(memory_handler):
+    memory_handler.upload_string("test", "path/to/test.txt")
+    assert memory_handler.backend.download("path/to/test.txt")[0] == b"test"
+
+
+def test_read_uncompressed_dataset(memory_handler):
+    path = "data/training_data/tldr_articles_legacy.csv"
+    memory_handler.backend.upload(path, b"article\na\nb\n")
+    assert memory_handler.download_training_data("legacy") == "article\na\nb\n"
+    assert memory_handler.download_dataframe(path)["article"].tolist() == ["a", "b"]
+
+
+def test_batch(memory_handler):
+    put_shards(memory_handler, "data/predicted_data/new/", 3)
+    memory_handler.upload_training_data("article\na\n", "test_hash")
+    manifest_generation = memory_handler.backend.generation(MANIFEST_PATH)
+    with patch.object(
+        memory_handler, "update_manifest", wraps=memory_handler.update_manifest
+    ) as mock_update_manifest:
+        with memory_handler.batch():
+            memory_handler.upload_training_data("article\nb\n", "other_hash")
+            memory_handler.copy_training_data_to_predicted("test_hash", "old/")
+            memory_handler.move_predicted_data_to_old("0")
+            memory_handler.delete_predicted_file("1")
+            with memory_handler.batch():
+                memory_handler.delete_predicted_file("2")
+            # Nothing but the upload happens until the batch exits.
+            assert read(memory_handler, "data/predicted_data/new/tldr_articles_1.csv")
+            assert (
+                memory_handler.backend.generation(MANIFEST_PATH) == manifest_generation
+            )
+    mock_update_manifest.assert_called_once()
+
+    manifest = stored_manifest(memory_handler)
+    assert sorted(manifest.shards) == [
+        "data/predicted_data/old/tldr_articles_0.csv",
+        "data/predicted_data/old/tldr_articles_test_hash.csv",
+        "data/training_data/tldr_articles_other_hash.csv",
+        "data/training_data/tldr_articles_test_hash.csv",
+    ]
+    stored_objects = memory_handler.backend.list_objects("data/")
+    assert [
+        stored_object.name
+        for stored_object in stored_objects
+        if stored_object.name != MANIFEST_PATH
+    ] == sorted(manifest.shards)
+    assert (
+        memory_handler.download_string(
+            "data/predicted_data/old/tldr_articles_test_hash.csv"
+        )
+        == "article\na\n"
+    )
+
+
+def test_batch_uses_backend_batches(memory_handler):
+    put_shards(memory_handler, "data/predicted_data/new/", 150)
+    with patch.object(
+        memory_handler.backend, "batch", wraps=memory_handler.backend.batch
+    ) as mock_batch:
+        with memory_handler.batch():
+            for i in range(150):
+                memory_handler.move_predicted_data_to_old(str(i))
+    # Copies in two batches of at most 100, then the deletes of the sources.
+    assert mock_batch.call_count == 4
+    assert len(memory_handler.get_new_predicted_data_shards()) == 0
+
+
+def test_batch_discarded_on_error(memory_handler):
+    put_shards(memory_handler, "data/predicted_data/new/", 1)
+    with pytest.raises(ValueError):
+        with memory_handler.batch():
+            memory_handler.delete_predicted_file("0")
+            raise ValueError
+    assert memory_handler.download_predicted_data("0") == "article\ntest\n"
+    assert memory_handler.pending_batch is None
+
+
+def test_load_manifest_rebuilds_when_missing(memory_handler):
+    memory_handler.backend.upload(
+        "data/training_data/tldr_articles_abc.csv", b"article\na\n"
+    )
+    memory_handler.backend.upload("data/training_data/readme.txt", b"ignored")
+
+    manifest = memory_handler.load_manifest()
+
+    assert len(manifest) == 1
+    assert manifest.get_shards()[0]["data_hash"] == "abc"
+    assert memory_handler.backend.generation(MANIFEST_PATH) == manifest.generation
+
+
+def test_delete_predicted_file_in_memory(memory_handler):
+    data_hash = "test_hash"
+    memory_handler.upload_predicted_data("test_csv", data_hash, "new/")
+    memory_handler.delete_predicted_file(data_hash)
+    with pytest.raises(ObjectNotFoundError):
+        memory_handler.download_predicted_data(data_hash)
+
+
+def test_read_token_from_gcs_in_memory(memory_handler):
+    token = "token"
+    memory_handler.backend.upload("blob-name", pickle.dumps(token))
+    result = memory_handler.read_token_from_gcs("memory://test-bucket", "blob-name")
+    assert result == token
+
+
+def test_write_token_to_gcs_in_memory(memory_handler):
+    test_creds = "credentials"
+    memory_handler.write_token_to_gcs(test_creds, "memory://test-bucket", "blob-name")
+    assert memory_handler.backend.download("blob-name")[0] == pickle.dumps(test_creds)
+
+
+def test_token_in_other_bucket(memory_handler):
+    memory_handler.write_token_to_gcs("credentials", "other-bucket", "blob-name")
+    assert (
+        memory_handler.read_token_from_gcs("other-bucket", "blob-name") == "credentials"
+    )
+    with pytest.raises(ObjectNotFoundError):
+        memory_handler.backend.download("blob-name")
+
+
+def test_read_client_secret_from_gcs_in_memory(memory_handler):
+    client_secrets_json = {"test": "test"}
+    memory_handler.backend.upload("blob-name", json.dumps(client_secrets_json).encode())
+    result = memory_handler.read_client_secrets_from_gcs(
+        "memory://test-bucket", "blob-name"
+    )
+    assert result == client_secrets_json
@@ -0,0 +1,262 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+from email_discriminator.core.data_versioning import (
+    GCSStorageBackend,
+    InMemoryStorageBackend,
+    LocalStorageBackend,
+    ObjectNotFoundError,
+    PreconditionFailedError,
+    storage_backend_from_uri,
+)
+
+# Mocked objects for the GCS backend tests
+mock_bucket = MagicMock()
+mock_blob = MagicMock()
+
+
+@pytest.fixture
+def gcs_backend():
+    with patch(
+        "email_discriminator.core.data_versioning.storage_backend.storage.Client"
+    ) as MockClient:
+        MockClient.return_value.get_bucket.return_value = mock_bucket
+        MockClient.return_value.bucket.return_value = mock_bucket
+        mock_bucket.blob.return_value = mock_blob
+        yield GCSStorageBackend("test-bucket")
+        mock_bucket.reset_mock()
+        mock_blob.reset_mock()
+        mock_blob.upload_from_string.side_effect = None
+        mock_blob.download_as_bytes.side_effect = None
+
+
+@pytest.fixture(params=["local", "memory"])
+def backend(request, tmp_path):
+    if request.param == "local":
+        yield LocalStorageBackend(str(tmp_path / "test-bucket"))
+    else:
+        yield InMemoryStorageBackend("test-bucket")
+        InMemoryStorageBackend.clear()
+
+
+def test_gcs_set_versioning(gcs_backend):
+    gcs_backend.set_versioning(True)
+    assert mock_bucket.versioning_enabled == True
+    mock_bucket.patch.assert_called_once()
+
+
+def test_gcs_upload(gcs_backend):
+    mock_blob.generation = 42
+    generation = gcs_backend.upload("path/to/test.txt", b"test", if_generation_match=0)
+    mock_bucket.blob.assert_called_with("path/to/test.txt")
+    mock_blob.upload_from_string.assert_called_with(
+        b"test", content_type=None, if_generation_match=0
+    )
+    assert generation == 42
+
+
+def test_gcs_upload_compressed(gcs_backend):
+    gcs_backend.upload("path/to/test.csv", b"\x1f\x8b", content_encoding="gzip")
+    assert mock_blob.content_encoding == "gzip"
+
+
+def test_gcs_upload_precondition_failed(gcs_backend):
+    mock_blob.upload_from_string.side_effect = PreconditionFailed("conflict")
+    with pytest.raises(PreconditionFailedError):
+        gcs_backend.upload("path/to/test.txt", b"test", if_generation_match=1)
+
+
+def test_gcs_download_with_version(gcs_backend):
+    mock_blob.download_as_bytes.return_value = b"test"
+    data, _ = gcs_backend.download("path/to/test.txt", 1234)
+    mock_bucket.blob.assert_called_with("path/to/test.txt", generation=1234)
+    assert data == b"test"
+
+
+def test_gcs_download_not_found(gcs_backend):
+    mock_blob.download_as_bytes.side_effect = NotFound("missing")
+    with pytest.raises(ObjectNotFoundError):
+        gcs_backend.download("path/to/test.txt")
+
+
+def test_gcs_open(gcs_backend):
+    gcs_backend.open("path/to/test.csv")
+    assert mock_blob.open.call_args.args == ("rb",)
+
+
+def test_gcs_download_raw(gcs_backend):
+    mock_blob.download_as_bytes.return_value = b"\x1f\x8b"
+    gcs_backend.download("path/to/test.csv")
+    assert mock_blob.download_as_bytes.call_args.kwargs["raw_download"] == True
+
+
+def test_gcs_batch(gcs_backend):
+    gcs_batch = gcs_backend.storage_client.batch.return_value
+    with gcs_backend.batch():
+        gcs_batch.__enter__.assert_called_once()
+    gcs_batch.__exit__.assert_called_once()
+
+
+def test_gcs_batch_errors(gcs_backend):
+    gcs_batch = gcs_backend.storage_client.batch.return_value
+    # The batch sends its operations and raises their errors on exit
+    gcs_batch.__exit__.side_effect = NotFound("Not Found")
+    with pytest.raises(ObjectNotFoundError):
+        with gcs_backend.batch():
+            gcs_backend.delete("path/to/test.txt")
+    gcs_batch.__exit__.side_effect = PreconditionFailed("Precondition Failed")
+    with pytest.raises(PreconditionFailedError):
+        with gcs_backend.batch():
+            gcs_backend.copy("path/to/test.txt", "path/to/new.txt")
+
+
+def test_gcs_move(gcs_backend):
+    gcs_backend.move("path/to/source.txt", "path/to/dest.txt")
+    mock_bucket.rename_blob.assert_called_once_with(mock_blob, "path/to/dest.txt")
+
+
+def test_gcs_delete(gcs_backend):
+    gcs_backend.delete("path/to/test.txt")
+    mock_bucket.delete_blob.assert_called_once_with("path/to/test.txt")
+
+
+def test_gcs_list_objects(gcs_backend):
+    blobs = [MagicMock(generation=i, size=10, time_created=None) for i in range(3)]
+    for i, blob in enumerate(blobs):
+        blob.name = f"data/training_data/tldr_articles_{i}.csv"
+    gcs_backend.storage_client.list_blobs.return_value = blobs
+    objects = gcs_backend.list_objects("data/")
+    assert [stored_object.generation for stored_object in objects] == [0, 1, 2]
+
+
+def test_gcs_generation(gcs_backend):
+    mock_bucket.get_blob.return_value = None
+    assert gcs_backend.generation("path/to/test.txt") == 0
+
+
+def test_storage_backend_from_uri(tmp_path):
+    assert isinstance(
+        storage_backend_from_uri(f"file://{tmp_path}"), LocalStorageBackend
+    )
+    assert isinstance(storage_backend_from_uri("memory://test"), InMemoryStorageBackend)
+    with patch(
+        "email_discriminator.core.data_versioning.storage_backend.storage.Client"
+    ):
+        assert isinstance(storage_backend_from_uri("gs://test"), GCSStorageBackend)
+        assert storage_backend_from_uri("gs://test").bucket_name == "test"
+
+
+def test_upload_download(backend):
+    generation = backend.upload("path/to/test.txt", b"test")
+    assert generation > 0
+    assert backend.download("path/to/test.txt") == (b"test", generation)
+    assert backend.generation("path/to/test.txt") == generation
+
+
+def test_generations_increase(backend):
+    first = backend.upload("path/to/test.txt", b"first")
+    second = backend.upload("path/to/test.txt", b"second")
+    assert second > first
+
+
+def test_download_missing(backend):
+    with pytest.raises(ObjectNotFoundError):
+        backend.download("path/to/missing.txt")
+    assert backend.generation("path/to/missing.txt") == 0
+
+
+def test_if_generation_match(backend):
+    with pytest.raises(PreconditionFailedError):
+        backend.upload("path/to/test.txt", b"test", if_generation_match=1)
+    generation = backend.upload("path/to/test.txt", b"test", if_generation_match=0)
+    with pytest.raises(PreconditionFailedError):
+        backend.upload("path/to/test.txt", b"again", if_generation_match=0)
+    backend.upload("path/to/test.txt", b"again", if_generation_match=generation)
+    assert backend.download("path/to/test.txt")[0] == b"again"
+
+
+def test_versioning(backend):
+    backend.set_versioning(True)
+    first = backend.upload("path/to/test.txt", b"first")
+    backend.upload("path/to/test.txt", b"second")
+    assert backend.download("path/to/test.txt", first)[0] == b"first"
+
+    backend.delete("path/to/test.txt")
+    assert backend.download("path/to/test.txt", first)[0] == b"first"
+    with pytest.raises(ObjectNotFoundError):
+        backend.download("path/to/test.txt")
+
+
+def test_no_versioning(backend):
+    first = backend.upload("path/to/test.txt", b"first")
+    backend.upload("path/to/test.txt", b"second")
+    with pytest.raises(ObjectNotFoundError):
+        backend.download("path/to/test.txt", first)
+
+
+def test_open(backend):
+    backend.upload("path/to/test.csv", b"a,b\n1,2\n")
+    with backend.open("path/to/test.csv") as stream:
+        assert stream.read() == b"a,b\n1,2\n"
+
+
+def test_copy_move_delete(backend):
+    backend.upload("path/to/source.txt", b"test")
+    backend.copy("path/to/source.txt", "path/to/copy.txt")
+    backend.move("path/to/source.txt", "path/to/dest.txt")
+    assert backend.download("path/to/copy.txt")[0] == b"test"
+    assert backend.download("path/to/dest.txt")[0] == b"test"
+    with pytest.raises(ObjectNotFoundError):
+        backend.download("path/to/source.txt")
+    backend.delete("path/to/dest.txt")
+    with pytest.raises(ObjectNotFoundError):
+        backend.delete("path/to/dest.txt")
+
+
+def test_batch(backend):
+    backend.upload("path/to/source.txt", b"test")
+    with backend.batch():
+        backend.copy("path/to/source.txt", "path/to/copy.txt")
+    assert backend.download("path/to/copy.txt")[0] == b"test"
+
+
+def test_list_objects(backend):
+    backend.upload("data/b.csv", b"bb")
+    backend.upload("data/a.csv", b"a")
+    backend.upload("other/c.csv", b"c")
+    backend.upload("data/deleted.csv", b"d")
+    backend.delete("data/deleted.csv")
+    objects = backend.list_objects("data/")
+    assert [stored_object.name for stored_object in objects] == [
+        "data/a.csv",
+        "data/b.csv",
+    ]
+    assert objects[1].size == 2
+
+
+def test_for_bucket(backend):
+    backend.upload("path/to/test.txt", b"test")
+    other_backend = backend.for_bucket("other-bucket")
+    with pytest.raises(ObjectNotFoundError):
+        other_backend.download("path/to/test.txt")
+
+
+def test_local_backend_layout(tmp_path):
+    backend = LocalStorageBackend(str(tmp_path / "test-bucket"))
+    backend.upload("data/training_data/test.csv", b"a\n1\n")
+    assert (
+        tmp_path / "test-bucket" / "data" / "training_data" / "test.csv"
+    ).read_bytes() == b"a\n1\n"
+    # A new instance on the same directory sees the same objects and generations.
+    reopened = LocalStorageBackend(str(tmp_path / "test-bucket"))
+    assert reopened.generation("data/training_data/test.csv") == backend.generation(
+        "data/training_data/test.csv"
+    )
+
+
+def test_in_memory_backends_share_buckets():
+    InMemoryStorageBackend("shared").upload("path/to/test.txt", b"test")
+    assert InMemoryStorageBackend("shared").download("path/to/test.txt")[0] == b"test"
+    InMemoryStorageBackend.clear()
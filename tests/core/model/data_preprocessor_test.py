@@ -1,9 +1,23 @@
+import pickle
 from unittest.mock import patch
 
+import numpy as np
 import pandas as pd
 import pytest
+from imblearn.over_sampling import RandomOverSampler
+from imblearn.pipeline import Pipeline as ImbPipeline
+from joblib import Parallel
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.pipeline import FeatureUnion, Pipeline
 
-from email_discriminator.core.model import DataProcessor, TextSelector
+from email_discriminator.core.model import (
+    CustomLabelEncoder,
+    DataProcessor,
+    Model,
+    TextSelector,
+)
 
 
 def test_text_selector():
@@ -101,3 +115,305 @@ def test_data_processor_individual_component():
     assert (
         section_transformed.shape[0] == 1
     ), "'section' pipeline output shape is incorrect."
+
+
+def test_data_processor_hashing():
+    data_processor = DataProcessor(
+        vectorizer="hashing", n_features=2**10, normalize=False
+    )
+    df = pd.DataFrame(
+        {
+            "article": ["This is a test", "Another test", "Final test"],
+            "section": ["cat", "dog", "bird"],
+        }
+    )
+    transformed = data_processor.fit_transform(df)
+    assert transformed.shape == (3, 2**10 + 1)
+    assert "idf" in data_processor.text.named_steps
+
+    # Chunks are vectorized independently of each other
+    chunks = [data_processor.transform(df.iloc[[i]]) for i in range(3)]
+    assert all(
+        (chunk != transformed[i]).nnz == 0 for i, chunk in enumerate(chunks)
+    ), "Chunked transform differs from the full transform."
+
+
+def test_data_processor_hashing_without_idf():
+    data_processor = DataProcessor(
+        vectorizer="hashing", n_features=2**10, use_idf=False, normalize=False
+    )
+    df = pd.DataFrame({"article": ["This is a test", "Another test"], "section": "a"})
+    transformed = data_processor.fit_transform(df)
+    assert "idf" not in data_processor.text.named_steps
+    text_norms = np.sqrt(transformed[:, :-1].multiply(transformed[:, :-1]).sum(axis=1))
+    assert np.allclose(text_norms, 1)
+
+
+def test_data_processor_hashing_size_is_bounded():
+    def pickled_size(n_articles):
+        df = pd.DataFrame(
+            {
+                "article": [f"article number{i} word{i}" for i in range(n_articles)],
+                "section": "cat",
+            }
+        )
+        tfidf = DataProcessor().fit(df)
+        hashing = DataProcessor(vectorizer="hashing", n_features=2**10).fit(df)
+        return len(pickle.dumps(tfidf)), len(pickle.dumps(hashing))
+
+    small_tfidf, small_hashing = pickled_size(10)
+    large_tfidf, large_hashing = pickled_size(1000)
+    assert large_tfidf > 10 * small_tfidf
+    assert large_hashing == small_hashing
+
+
+def test_data_processor_clone():
+    data_processor = clone(DataProcessor(vectorizer="hashing", n_features=2**10))
+    assert data_processor.get_params() == {
+        "vectorizer": "hashing",
+        "n_features": 2**10,
+        "use_idf": True,
+        "dtype": np.float32,
+        "feature_store": None,
+        "n_jobs": None,
+        "chunk_size": 10_000,
+        "normalize": False,
+        "min_df": 1,
+        "max_df": 1.0,
+        "max_features": None,
+        "vocabulary": None,
+        "one_hot_section": False,
+    }
+    assert data_processor.text.named_steps["hashing"].n_features == 2**10
+
+
+@pytest.mark.parametrize("vectorizer", ["tfidf", "hashing"])
+def test_data_processor_float32_csr(vectorizer):
+    df = pd.DataFrame(
+        {
+            "article": ["This is a test", "Another test", "Final test"],
+            "section": ["cat", "dog", "bird"],
+        }
+    )
+    transformed = DataProcessor(
+        vectorizer=vectorizer, n_features=2**10, normalize=False
+    ).fit_transform(df)
+    assert sparse.isspmatrix_csr(transformed)
+    assert transformed.dtype == np.float32
+    assert transformed[:, -1].toarray().ravel().tolist() == [1, 2, 0]
+
+    transformed_64 = DataProcessor(
+        vectorizer=vectorizer, n_features=2**10, dtype=np.float64, normalize=False
+    ).fit_transform(df)
+    assert transformed_64.dtype == np.float64
+    assert np.allclose(transformed.toarray(), transformed_64.toarray())
+
+
+@pytest.mark.parametrize("vectorizer", ["tfidf", "hashing"])
+def test_data_processor_parallel_transform(vectorizer):
+    df = pd.DataFrame(
+        {
+            "article": [f"article {i} about test number{i % 3}" for i in range(7)],
+            "section": ["cat", "dog", "bird", "cat", "dog", "bird", "cat"],
+        }
+    )
+    serial = DataProcessor(vectorizer=vectorizer, n_features=2**10).fit(df)
+    parallel = DataProcessor(
+        vectorizer=vectorizer, n_features=2**10, n_jobs=2, chunk_size=3
+    ).fit(df)
+    with patch(
+        "email_discriminator.core.model.data_processor.Parallel",
+        wraps=Parallel,
+    ) as mock_parallel:
+        transformed = parallel.transform(df)
+    mock_parallel.assert_called_once()
+    expected = serial.transform(df)
+    assert transformed.dtype == expected.dtype
+    assert transformed.shape == expected.shape
+    assert (transformed != expected).nnz == 0
+
+
+def test_data_processor_normalize():
+    df = pd.DataFrame(
+        {
+            "article": [
+                f"TITLE {i} (3 MINUTE READ)\r\n[https://www.site{i % 2}.com/a]\r\n\r\n"
+                "Some text."
+                for i in range(12)
+            ],
+            "section": "cat",
+        }
+    )
+    data_processor = DataProcessor(normalize=True).fit(df)
+    vocabulary = data_processor.text.named_steps["tfidf"].vocabulary_
+    assert not {"https", "www", "com", "minute", "read"} & set(vocabulary)
+
+    raw_vocabulary = DataProcessor().fit(df).text.named_steps["tfidf"].vocabulary_
+    assert len(vocabulary) < len(raw_vocabulary)
+
+    # Text, section, read minutes and one column per frequent link domain
+    transformed = data_processor.transform(df)
+    assert transformed.shape[1] == len(vocabulary) + 1 + 1 + 2
+    assert transformed[:, len(vocabulary) + 1].toarray().ravel().tolist() == [3] * 12
+
+    # Unseen link domains are encoded as zeros
+    unseen = df.iloc[:1].assign(article="Text [https://other.org]")
+    assert data_processor.transform(unseen)[:, -2:].nnz == 0
+
+
+def test_data_processor_invalid_vectorizer():
+    with pytest.raises(ValueError) as e:
+        DataProcessor(vectorizer="count")
+    assert "Unknown vectorizer `count`!" in str(e.value)
+
+
+def test_data_processor_vocabulary_budget():
+    df = pd.DataFrame(
+        {
+            "article": ["common word one", "common word two", "common rare three"],
+            "section": "cat",
+        }
+    )
+    vocabulary = DataProcessor(min_df=2).fit(df).text.named_steps["tfidf"].vocabulary_
+    assert set(vocabulary) == {"common", "word"}
+
+    data_processor = DataProcessor(max_features=1).fit(df)
+    tfidf = data_processor.text.named_steps["tfidf"]
+    assert set(tfidf.vocabulary_) == {"common"}
+    # The cut terms are not stored with the fitted processor
+    assert not hasattr(tfidf, "stop_words_")
+
+
+def test_data_processor_used_vocabulary():
+    df = pd.DataFrame(
+        {"article": ["alpha beta", "gamma delta", "beta gamma"], "section": "cat"}
+    )
+    data_processor = DataProcessor().fit(df)
+    # The article columns come first, the other features after them
+    assert data_processor.used_vocabulary([4, 1, 3, 1]) == ["beta", "gamma"]
+    assert DataProcessor(vectorizer="hashing").fit(df).used_vocabulary([1]) is None
+
+    pruned = clone(data_processor).set_params(vocabulary=["beta", "gamma"]).fit(df)
+    assert pruned.text.named_steps["tfidf"].vocabulary_ == {"beta": 0, "gamma": 1}
+    assert pruned.transform(df).shape[1] == data_processor.transform(df).shape[1] - 2
+
+
+@pytest.mark.parametrize("one_hot_section", [False, True])
+def test_data_processor_unseen_section(one_hot_section):
+    df = pd.DataFrame(
+        {"article": ["This is a test", "Another test"], "section": ["cat", "dog"]}
+    )
+    data_processor = DataProcessor(
+        normalize=False, one_hot_section=one_hot_section
+    ).fit(df)
+    unseen = df.assign(section=["bird", "dog"])
+    transformed = data_processor.transform(unseen)
+    assert sparse.isspmatrix_csr(transformed)
+    n_terms = len(data_processor.text.named_steps["tfidf"].vocabulary_)
+    sections = transformed[:, n_terms:].toarray().tolist()
+    if one_hot_section:
+        assert sections == [[0, 0, 1], [0, 1, 0]]
+    else:
+        assert sections == [[2], [1]]
+
+
+def test_data_processor_out_of_vocabulary_rate():
+    df = pd.DataFrame(
+        {"article": ["alpha beta", "gamma delta", "beta gamma"], "section": "cat"}
+    )
+    data_processor = DataProcessor().fit(df)
+    assert data_processor.out_of_vocabulary_rate(df) == 0
+    # Stop words are not counted
+    new = pd.DataFrame({"article": ["alpha omega the", "Beta psi"], "section": "cat"})
+    assert data_processor.out_of_vocabulary_rate(new) == 0.5
+
+    hashing = DataProcessor(vectorizer="hashing").fit(df)
+    assert hashing.out_of_vocabulary_rate(new) == 0
+
+
+def test_data_processor_partial_fit():
+    df = pd.DataFrame(
+        {
+            "article": [
+                "alpha beta [https://a.com/x]",
+                "gamma delta",
+                "beta gamma (2 MINUTE READ)",
+                "alpha omega [https://b.com/y]",
+            ],
+            "section": ["cat", "dog", "cat", "bird"],
+        }
+    )
+    expected = DataProcessor(vectorizer="hashing", n_features=2**10).fit(df)
+
+    data_processor = DataProcessor(vectorizer="hashing", n_features=2**10)
+    data_processor.partial_fit(df.iloc[:2]).partial_fit(df.iloc[2:])
+    assert data_processor.streamed_counts_["documents"] == 4
+    transformed = data_processor.transform(df)
+    assert transformed.shape == expected.transform(df).shape
+    assert np.allclose(transformed.toarray(), expected.transform(df).toarray())
+
+    # A full fit starts over
+    data_processor.fit(df.iloc[:2])
+    assert data_processor.streamed_counts_ is None
+
+
+def test_data_processor_partial_fit_tfidf():
+    with pytest.raises(ValueError) as e:
+        DataProcessor().partial_fit(pd.DataFrame({"article": ["a"], "section": ["b"]}))
+    assert "Streaming fit needs the `hashing` vectorizer, got `tfidf`!" in str(e.value)
+
+
+def baseline_data_processor() -> DataProcessor:
+    """
+    A processor with the state of the ones pickled before DataProcessor had
+    parameters: only its unfitted transformers.
+    """
+    data_processor = DataProcessor.__new__(DataProcessor)
+    encoder = CustomLabelEncoder.__new__(CustomLabelEncoder)
+    encoder.__dict__ = {"encoder": CustomLabelEncoder().encoder}
+    data_processor.text = Pipeline(
+        [
+            ("selector", TextSelector(key="article")),
+            ("tfidf", TfidfVectorizer(stop_words="english")),
+        ]
+    )
+    data_processor.section = Pipeline(
+        [("selector", TextSelector(key="section")), ("encoder", encoder)]
+    )
+    data_processor.features = FeatureUnion(
+        [("article", data_processor.text), ("section", data_processor.section)]
+    )
+    return data_processor
+
+
+def test_data_processor_unpickle_baseline():
+    df = pd.DataFrame(
+        {
+            "article": ["This is a test", "Another test", "Final test", "More"] * 5,
+            "section": ["cat", "dog", "bird", "cat"] * 5,
+            "is_relevant": [0, 1, 0, 1] * 5,
+        }
+    )
+    X, y = df[["article", "section"]], df["is_relevant"]
+    data_processor = baseline_data_processor()
+    data_processor.features.fit(X)
+    expected = data_processor.features.transform(X)
+    model = Model()
+    model.set_params(n_estimators=5)
+    model.fit(expected, y)
+
+    pipeline = pickle.loads(
+        pickle.dumps(
+            ImbPipeline(
+                [
+                    ("features", data_processor),
+                    ("sampling", RandomOverSampler(random_state=0)),
+                    ("model", model),
+                ]
+            )
+        )
+    )
+    unpickled = pipeline.named_steps["features"]
+    assert unpickled.get_params()["normalize"] is False
+    assert np.allclose(unpickled.transform(X).toarray(), expected.toarray())
+    assert pipeline.predict(X).tolist() == model.predict(expected).tolist()
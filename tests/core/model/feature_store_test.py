@@ -0,0 +1,140 @@
+import os
+import pickle
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+
+from email_discriminator.core.data_versioning import InMemoryStorageBackend
+from email_discriminator.core.model import DataProcessor, FeatureStore
+
+KEYS = np.array([10, 20, 30], dtype=np.uint64)
+MATRIX = sparse.csr_matrix(
+    np.array([[1, 0, 2], [0, 0, 0], [0, 3, 0]], dtype=np.float32)
+)
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame(
+        {
+            "article": ["This is a test", "Another test", "Final test", "Other"],
+            "section": ["cat", "dog", "bird", "cat"],
+        }
+    )
+
+
+def test_save_lookup(tmp_path):
+    store = FeatureStore(str(tmp_path))
+    store.save("fingerprint", KEYS, MATRIX)
+
+    found, matrix = store.lookup("fingerprint", np.array([30, 40, 10], np.uint64))
+    assert found.tolist() == [True, False, True]
+    assert matrix.dtype == np.float32
+    assert matrix.toarray().tolist() == [[0, 3, 0], [1, 0, 2]]
+
+    found, matrix = store.lookup("other", KEYS)
+    assert not found.any() and matrix is None
+
+
+def test_lookup_across_segments(tmp_path):
+    store = FeatureStore(str(tmp_path))
+    store.save("fingerprint", KEYS[:2], MATRIX[:2])
+    store.save("fingerprint", KEYS[2:], MATRIX[2:])
+    found, matrix = store.lookup("fingerprint", KEYS[::-1])
+    assert found.all()
+    assert (matrix != MATRIX[::-1]).nnz == 0
+
+
+def test_segments_are_memory_mapped(tmp_path):
+    store = FeatureStore(str(tmp_path))
+    store.save("fingerprint", KEYS, MATRIX)
+    store.lookup("fingerprint", KEYS)
+    (segment,) = store._segments["fingerprint"].values()
+    assert isinstance(segment.keys, np.memmap)
+    # The CSR arrays are views of the read-only memory maps, not copies.
+    assert not segment.matrix.data.flags.writeable
+    assert not segment.matrix.indices.flags.writeable
+    # A new store on the same directory reads the saved segments.
+    found, _ = FeatureStore(str(tmp_path)).lookup("fingerprint", KEYS)
+    assert found.all()
+
+
+def test_bucket_backed_store(tmp_path):
+    store = FeatureStore.from_uri("memory://features", cache_dir=str(tmp_path / "a"))
+    segment = store.save("fingerprint", KEYS, MATRIX)
+    assert store.backend.download(f"features/fingerprint/{segment}/keys.npy")
+
+    other_store = FeatureStore.from_uri(
+        "memory://features", cache_dir=str(tmp_path / "b")
+    )
+    found, matrix = other_store.lookup("fingerprint", KEYS)
+    assert found.all()
+    assert (matrix != MATRIX).nnz == 0
+    assert os.path.exists(tmp_path / "b" / "features" / "fingerprint" / segment)
+    InMemoryStorageBackend.clear()
+
+
+def test_bucket_listed_once_per_fingerprint(tmp_path):
+    store = FeatureStore.from_uri("memory://features", cache_dir=str(tmp_path))
+    with patch.object(
+        store.backend, "list_objects", wraps=store.backend.list_objects
+    ) as mock_list_objects:
+        store.lookup("fingerprint", KEYS)
+        store.save("fingerprint", KEYS, MATRIX)
+        found, _ = store.lookup("fingerprint", KEYS)
+        store.lookup("other_fingerprint", KEYS)
+    assert found.all()
+    assert [call.args[0] for call in mock_list_objects.call_args_list] == [
+        "features/fingerprint/",
+        "features/other_fingerprint/",
+    ]
+    InMemoryStorageBackend.clear()
+
+
+def test_from_uri_local(tmp_path):
+    assert FeatureStore.from_uri(f"file://{tmp_path}").root == str(tmp_path)
+    assert FeatureStore.from_uri(str(tmp_path)).backend is None
+
+
+def test_data_processor_feature_store(tmp_path, df):
+    data_processor = DataProcessor(feature_store=str(tmp_path)).fit(df)
+    expected = DataProcessor().fit(df).transform(df)
+
+    first = data_processor.transform(df.iloc[:2])
+    assert (first != expected[:2]).nnz == 0
+
+    # Stored rows are loaded, only the new ones are computed
+    with patch.object(
+        data_processor.features,
+        "transform",
+        wraps=data_processor.features.transform,
+    ) as mock_transform:
+        transformed = data_processor.transform(df.iloc[[2, 0, 3, 1]])
+    assert len(mock_transform.call_args.args[0]) == 2
+    assert (transformed != expected[[2, 0, 3, 1]]).nnz == 0
+
+    with patch.object(data_processor.features, "transform") as mock_transform:
+        transformed = data_processor.transform(df)
+    mock_transform.assert_not_called()
+    assert (transformed != expected).nnz == 0
+
+
+def test_data_processor_feature_store_fingerprint(tmp_path, df):
+    first = DataProcessor(feature_store=str(tmp_path)).fit(df)
+    second = DataProcessor(feature_store=str(tmp_path)).fit(df)
+    refitted = DataProcessor(feature_store=str(tmp_path)).fit(df.iloc[:2])
+    for data_processor in [first, second, refitted]:
+        data_processor.transform(df.iloc[:2])
+    assert first.fingerprint_ == second.fingerprint_
+    assert first.fingerprint_ != refitted.fingerprint_
+
+
+def test_data_processor_feature_store_pickle(tmp_path, df):
+    data_processor = DataProcessor(feature_store=str(tmp_path)).fit(df)
+    data_processor.transform(df)
+    restored = pickle.loads(pickle.dumps(data_processor))
+    assert "_feature_store_instance" not in vars(restored)
+    assert (restored.transform(df) != data_processor.transform(df)).nnz == 0
@@ -0,0 +1,105 @@
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+from imblearn.over_sampling import RandomOverSampler
+from imblearn.pipeline import Pipeline
+
+from email_discriminator.core.model import DataProcessor, Model, warm_start_pipeline
+
+WORDS = np.array(["alpha", "beta", "gamma", "delta", "epsilon", "zeta"])
+
+
+def make_data(n_rows: int, seed: int, sections=("cat", "dog")) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "article": [" ".join(rng.choice(WORDS, size=5)) for _ in range(n_rows)],
+            "section": rng.choice(sections, size=n_rows),
+            "is_relevant": rng.choice([0, 1], size=n_rows),
+        }
+    )
+
+
+def fit_pipeline(df: pd.DataFrame, **model_params) -> Pipeline:
+    pipeline = Pipeline(
+        [
+            ("features", DataProcessor()),
+            ("sampling", RandomOverSampler(random_state=0)),
+            ("model", Model(**model_params)),
+        ]
+    )
+    return pipeline.fit(df[["article", "section"]], df["is_relevant"])
+
+
+def test_warm_start_pipeline():
+    pipeline = fit_pipeline(make_data(100, 0), early_stopping_rounds=2)
+    model = pipeline.named_steps["model"]
+    _, best_trees = model.iteration_range
+    n_trees = model.model.get_booster().num_boosted_rounds()
+
+    new_df = make_data(20, 1, sections=("cat", "bird"))
+    warm = warm_start_pipeline(
+        pipeline, new_df[["article", "section"]], new_df["is_relevant"], 5
+    )
+    warm_model = warm.named_steps["model"]
+
+    # The trees past the best iteration are dropped and all the new ones are used
+    assert warm_model.model.get_booster().num_boosted_rounds() == best_trees + 5
+    assert warm_model.iteration_range == (0, best_trees + 5)
+    assert warm_model.threshold == model.threshold
+    # The vocabulary is frozen and the original pipeline is left untouched
+    assert (
+        warm.named_steps["features"].text.named_steps["tfidf"].vocabulary_
+        == pipeline.named_steps["features"].text.named_steps["tfidf"].vocabulary_
+    )
+    assert model.model.get_booster().num_boosted_rounds() == n_trees
+    assert len(warm.predict(new_df[["article", "section"]])) == 20
+
+
+def test_warm_start_pipeline_calibration():
+    pipeline = fit_pipeline(make_data(100, 0), early_stopping_rounds=2)
+    new_df = make_data(20, 1)
+    calibration_df = make_data(30, 2)
+
+    with patch(
+        "email_discriminator.core.model.model.train_test_split"
+    ) as mock_split, patch.object(
+        Model, "_tune_threshold", autospec=True
+    ) as mock_tune_threshold:
+        warm = warm_start_pipeline(
+            pipeline,
+            new_df[["article", "section"]],
+            new_df["is_relevant"],
+            5,
+            calibration_df[["article", "section"]],
+            calibration_df["is_relevant"],
+        )
+    # All the new rows are trained on, and only the calibration rows tune the
+    # threshold, among the candidate thresholds of the pipeline
+    mock_split.assert_not_called()
+    mock_tune_threshold.assert_called_once()
+    _, y, y_proba_pos = mock_tune_threshold.call_args.args
+    assert len(y) == len(y_proba_pos) == 30
+    assert warm.named_steps["model"].thresholds is None
+
+
+def test_warm_start_pipeline_linear_model():
+    df = make_data(60, 0)
+    pipeline = fit_pipeline(df, backend="logistic")
+    with pytest.raises(ValueError) as e:
+        warm_start_pipeline(pipeline, df[["article", "section"]], df["is_relevant"], 5)
+    assert "Warm start needs an XGBoost model, got `LogisticRegression`!" in str(
+        e.value
+    )
+
+
+def test_warm_start_pipeline_missing_class():
+    pipeline = fit_pipeline(make_data(60, 0))
+    new_df = make_data(10, 1).assign(is_relevant=0)
+    with pytest.raises(ValueError) as e:
+        warm_start_pipeline(
+            pipeline, new_df[["article", "section"]], new_df["is_relevant"], 5
+        )
+    assert "Warm start needs rows of every class! Classes: 0, 1, got: 0" in str(e.value)
@@ -0,0 +1,91 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from imblearn.over_sampling import RandomOverSampler
+from imblearn.pipeline import Pipeline
+from sklearn.tree import DecisionTreeClassifier
+
+from email_discriminator.core.model import DataProcessor, InferenceBundle, Model
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(0)
+    words = np.array(["alpha", "beta", "gamma", "delta", "epsilon", "zeta"])
+    return pd.DataFrame(
+        {
+            "article": [" ".join(rng.choice(words, size=5)) for _ in range(60)],
+            "section": rng.choice(["cat", "dog"], size=60),
+            "is_relevant": rng.choice([0, 1], size=60),
+        }
+    )
+
+
+def make_pipeline(**model_params) -> Pipeline:
+    return Pipeline(
+        [
+            ("features", DataProcessor()),
+            ("sampling", RandomOverSampler(random_state=0)),
+            ("model", Model(**model_params)),
+        ]
+    )
+
+
+@pytest.mark.parametrize("early_stopping_rounds", [None, 2])
+def test_inference_bundle_save_load(tmp_path, df, early_stopping_rounds):
+    X, y = df[["article", "section"]], df["is_relevant"]
+    pipeline = make_pipeline(early_stopping_rounds=early_stopping_rounds)
+    pipeline.set_params(model__n_estimators=50).fit(X, y)
+
+    InferenceBundle.from_pipeline(pipeline).save(str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == [
+        "booster.ubj",
+        "bundle.json",
+        "features.pkl",
+    ]
+    bundle = InferenceBundle.load(str(tmp_path))
+
+    assert bundle.threshold == pipeline.named_steps["model"].threshold
+    assert bundle.classes == [0, 1]
+    assert np.allclose(bundle.predict_proba(X), pipeline.predict_proba(X))
+    assert bundle.predict(X).tolist() == pipeline.predict(X).tolist()
+
+
+@pytest.mark.parametrize("backend", ["logistic", "sgd"])
+def test_inference_bundle_linear(tmp_path, df, backend):
+    X, y = df[["article", "section"]], df["is_relevant"]
+    pipeline = make_pipeline(backend=backend).fit(X, y)
+
+    InferenceBundle.from_pipeline(pipeline).save(str(tmp_path))
+    assert "linear.npz" in os.listdir(tmp_path)
+    bundle = InferenceBundle.load(str(tmp_path))
+
+    assert bundle.booster is None
+    assert np.allclose(bundle.predict_proba(X), pipeline.predict_proba(X))
+    assert bundle.predict(X).tolist() == pipeline.predict(X).tolist()
+
+
+def test_inference_bundle_unsupported_model(df):
+    pipeline = make_pipeline(model=DecisionTreeClassifier())
+    pipeline.fit(df[["article", "section"]], df["is_relevant"])
+    with pytest.raises(ValueError) as e:
+        InferenceBundle.from_pipeline(pipeline)
+    assert (
+        "Inference bundles need an XGBoost or logistic model, "
+        "got `DecisionTreeClassifier`!" in str(e.value)
+    )
+
+
+def test_inference_bundle_format_version(tmp_path, df):
+    pipeline = make_pipeline().fit(df[["article", "section"]], df["is_relevant"])
+    InferenceBundle.from_pipeline(pipeline).save(str(tmp_path))
+    with open(tmp_path / "bundle.json") as f:
+        metadata = json.load(f)
+    with open(tmp_path / "bundle.json", "w") as f:
+        json.dump({**metadata, "format_version": 0}, f)
+    with pytest.raises(ValueError) as e:
+        InferenceBundle.load(str(tmp_path))
+    assert "Unsupported inference bundle format `0`!" in str(e.value)
@@ -1,4 +1,5 @@
 import numpy as np
+from scipy import sparse
 from sklearn.pipeline import Pipeline
 
 from email_discriminator.core.model import CustomLabelEncoder
@@ -89,3 +90,25 @@ def test_custom_label_encoder_fit_error():
     assert (
         str(e.value) == "y should be a 1d array, got an array of shape (2, 2) instead."
     ), "CustomLabelEncoder does not raise an exception or has a different error message when fitting invalid data."
+
+
+def test_custom_label_encoder_unseen_labels():
+    encoder = CustomLabelEncoder()
+    encoder.fit(np.array(["cat", "dog", "bird"]))
+    transformed = encoder.transform(np.array(["dog", "fish", "bird", "fish"]))
+    assert transformed.ravel().tolist() == [2, 3, 0, 3]
+
+
+def test_custom_label_encoder_one_hot():
+    encoder = CustomLabelEncoder(one_hot=True)
+    encoder.fit(np.array(["cat", "dog", "bird"]))
+    transformed = encoder.transform(np.array(["dog", "fish", "bird"]))
+
+    assert sparse.isspmatrix_csr(transformed)
+    assert transformed.dtype == np.float32
+    # One column per class and a last one for the unknown labels
+    assert transformed.toarray().tolist() == [
+        [0, 0, 1, 0],
+        [0, 0, 0, 1],
+        [1, 0, 0, 0],
+    ]
@@ -0,0 +1,211 @@
+import os
+
+import mlflow
+import numpy as np
+import pandas as pd
+import pytest
+from mlflow.pyfunc import PythonModel
+from sklearn.pipeline import Pipeline
+
+from email_discriminator.core.model import (
+    DataProcessor,
+    InferenceBundle,
+    Model,
+    ModelCache,
+)
+from email_discriminator.core.model.inference_bundle import INFERENCE_BUNDLE_ARTIFACT
+
+MODEL_NAME = "email_discriminator"
+
+
+class ConstantModel(PythonModel):
+    def predict(self, context, model_input):
+        return np.ones(len(model_input), dtype=int)
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(0)
+    words = np.array(["alpha", "beta", "gamma", "delta", "epsilon", "zeta"])
+    return pd.DataFrame(
+        {
+            "article": [" ".join(rng.choice(words, size=5)) for _ in range(60)],
+            "section": rng.choice(["cat", "dog"], size=60),
+            "is_relevant": rng.choice([0, 1], size=60),
+        }
+    )
+
+
+@pytest.fixture
+def tracking_uri(tmp_path):
+    return f"file://{tmp_path}/mlruns"
+
+
+@pytest.fixture
+def client(tracking_uri):
+    client = mlflow.tracking.MlflowClient(tracking_uri, tracking_uri)
+    client.create_registered_model(MODEL_NAME)
+    return client
+
+
+@pytest.fixture
+def cache(tmp_path, tracking_uri):
+    return ModelCache(str(tmp_path / "cache"), tracking_uri=tracking_uri)
+
+
+def register_bundle(client, tmp_path, df, n_estimators=5) -> str:
+    """
+    Logs the bundle of a pipeline in a run, registers it and promotes it to
+    Production, and returns its version.
+    """
+    X, y = df[["article", "section"]], df["is_relevant"]
+    pipeline = Pipeline([("features", DataProcessor()), ("model", Model())])
+    pipeline.set_params(model__n_estimators=n_estimators).fit(X, y)
+    bundle_path = str(tmp_path / f"bundle_{n_estimators}")
+    InferenceBundle.from_pipeline(pipeline).save(bundle_path)
+    return register_artifacts(client, bundle_path, INFERENCE_BUNDLE_ARTIFACT)
+
+
+def register_artifacts(client, local_dir: str, artifact_path: str) -> str:
+    # The file store creates the default experiment, with id 0
+    run = client.create_run("0")
+    client.log_artifacts(run.info.run_id, local_dir, artifact_path)
+    model_version = client.create_model_version(
+        MODEL_NAME,
+        f"{run.info.artifact_uri}/{artifact_path}",
+        run.info.run_id,
+    )
+    client.transition_model_version_stage(
+        MODEL_NAME,
+        model_version.version,
+        "Production",
+        archive_existing_versions=True,
+    )
+    return str(model_version.version)
+
+
+def test_load(cache, client, tmp_path, df, monkeypatch):
+    version = register_bundle(client, tmp_path, df)
+    model, loaded_version = cache.load(MODEL_NAME)
+    assert isinstance(model, InferenceBundle)
+    assert loaded_version == version
+    assert cache.cached_versions() == [(MODEL_NAME, version)]
+
+    def download_artifacts(*args, **kwargs):
+        raise AssertionError("Downloaded a cached version")
+
+    monkeypatch.setattr(mlflow.artifacts, "download_artifacts", download_artifacts)
+    # The same process reuses the deserialized model
+    assert cache.load(MODEL_NAME) == (model, version)
+    # Another process deserializes the downloaded version
+    other_model, _ = ModelCache(cache.root, tracking_uri=cache.tracking_uri).load(
+        MODEL_NAME
+    )
+    assert other_model is not model
+    X = df[["article", "section"]]
+    assert np.array_equal(other_model.predict(X), model.predict(X))
+
+
+def test_load_new_version(cache, client, tmp_path, df):
+    first_version = register_bundle(client, tmp_path, df)
+    first_model, _ = cache.load(MODEL_NAME)
+    second_version = register_bundle(client, tmp_path, df, n_estimators=6)
+    second_model, version = cache.load(MODEL_NAME)
+    assert version == second_version
+    assert second_model is not first_model
+    assert second_model.booster.num_boosted_rounds() == 6
+    assert cache.cached_versions() == [
+        (MODEL_NAME, first_version),
+        (MODEL_NAME, second_version),
+    ]
+
+
+def test_evict_max_versions(tmp_path, tracking_uri, client, df):
+    cache = ModelCache(
+        str(tmp_path / "cache"), max_versions=1, tracking_uri=tracking_uri
+    )
+    register_bundle(client, tmp_path, df)
+    cache.load(MODEL_NAME)
+    version = register_bundle(client, tmp_path, df, n_estimators=6)
+    cache.load(MODEL_NAME)
+    assert cache.cached_versions() == [(MODEL_NAME, version)]
+    assert list(cache._models) == [(MODEL_NAME, version)]
+
+
+def test_evict_max_bytes(tmp_path, tracking_uri, client, df):
+    cache = ModelCache(
+        str(tmp_path / "cache"), max_versions=3, max_bytes=1, tracking_uri=tracking_uri
+    )
+    register_bundle(client, tmp_path, df)
+    cache.load(MODEL_NAME)
+    version = register_bundle(client, tmp_path, df, n_estimators=6)
+    # The loaded version is kept even above the size limit
+    model, _ = cache.load(MODEL_NAME)
+    assert cache.cached_versions() == [(MODEL_NAME, version)]
+    assert model.booster.num_boosted_rounds() == 6
+
+
+def test_load_pyfunc(cache, client, tmp_path, df, monkeypatch):
+    model_path = str(tmp_path / "model")
+    mlflow.pyfunc.save_model(
+        model_path, python_model=ConstantModel(), pip_requirements=[]
+    )
+    version = register_artifacts(client, model_path, "model")
+    model, loaded_version = cache.load(MODEL_NAME)
+    assert loaded_version == version
+    assert model.predict(pd.DataFrame({"article": ["a", "b"]})).tolist() == [1, 1]
+    version_path = os.path.join(cache.root, MODEL_NAME, version)
+    assert os.path.isdir(os.path.join(version_path, "pyfunc"))
+    assert cache.cached_versions() == [(MODEL_NAME, version)]
+
+    download_artifacts = mlflow.artifacts.download_artifacts
+
+    def no_download_artifacts(*args, **kwargs):
+        raise AssertionError("Downloaded a cached version")
+
+    monkeypatch.setattr(mlflow.artifacts, "download_artifacts", no_download_artifacts)
+    # The pyfunc model is cached in memory and on disk like a bundle
+    assert cache.load(MODEL_NAME) == (model, version)
+    other_model, _ = ModelCache(cache.root, tracking_uri=cache.tracking_uri).load(
+        MODEL_NAME
+    )
+    assert other_model is not model
+    monkeypatch.setattr(mlflow.artifacts, "download_artifacts", download_artifacts)
+
+    # Once the version has a bundle, it replaces the cached pyfunc model
+    X, y = df[["article", "section"]], df["is_relevant"]
+    pipeline = Pipeline([("features", DataProcessor()), ("model", Model())]).fit(X, y)
+    bundle_path = str(tmp_path / "bundle")
+    InferenceBundle.from_pipeline(pipeline).save(bundle_path)
+    run_id = client.get_model_version(MODEL_NAME, version).run_id
+    client.log_artifacts(run_id, bundle_path, INFERENCE_BUNDLE_ARTIFACT)
+    model, _ = cache.load(MODEL_NAME)
+    assert isinstance(model, InferenceBundle)
+    assert os.listdir(version_path) == ["bundle"]
+
+
+def test_load_download_error(cache, client, tmp_path, df, monkeypatch):
+    register_bundle(client, tmp_path, df)
+
+    download_artifacts = mlflow.artifacts.download_artifacts
+
+    def flaky_download_artifacts(*args, **kwargs):
+        if kwargs.get("artifact_path") == INFERENCE_BUNDLE_ARTIFACT:
+            raise OSError("Connection reset")
+        return download_artifacts(*args, **kwargs)
+
+    monkeypatch.setattr(
+        mlflow.artifacts, "download_artifacts", flaky_download_artifacts
+    )
+    # Errors other than a missing bundle don't fall back to the pyfunc model
+    with pytest.raises(OSError, match="Connection reset"):
+        cache.load(MODEL_NAME)
+    assert cache.cached_versions() == []
+
+
+def test_load_no_production_version(cache, client):
+    with pytest.raises(ValueError) as e:
+        cache.load(MODEL_NAME)
+    assert "Model `email_discriminator` has no version in stage Production!" in str(
+        e.value
+    )
@@ -2,10 +2,14 @@ from unittest.mock import patch
 
 import numpy as np
 import pytest
+from imblearn.over_sampling import RandomOverSampler
+from scipy import sparse
+from sklearn.base import clone
 from sklearn.exceptions import NotFittedError
 from sklearn.metrics import f1_score, recall_score
 
 from email_discriminator.core.model import Model
+from email_discriminator.core.model.model import PICKLED_DEFAULTS, threshold_scores
 
 
 def test_fit_predict():
@@ -28,6 +32,21 @@ def test_fit_predict():
     ), "Model prediction not consistent with threshold."
 
 
+@pytest.mark.parametrize("early_stopping_rounds", [None, 2])
+def test_predict_inplace(early_stopping_rounds):
+    model = Model(early_stopping_rounds=early_stopping_rounds)
+    X = sparse.random(200, 10, density=0.5, format="csr", dtype=np.float32)
+    y = np.random.choice([0, 1], size=200)
+    model.fit(X, y)
+
+    expected = (model.predict_proba(X)[:, 1] >= model.threshold).astype(int)
+    assert np.array_equal(model.predict(X), expected)
+
+    out = np.full(200, -1)
+    assert model.predict(X, out=out) is out
+    assert np.array_equal(out, expected)
+
+
 def test_notfittederror_prediction():
     model = Model()
     X = np.random.normal(size=(100, 10))
@@ -97,6 +116,82 @@ def test_set_params():
     ), "set_params should correctly set the 'threshold' attribute."
 
 
+def test_set_params_forwards_model_params():
+    model = Model()
+    model.set_params(n_estimators=7, learning_rate=0.3, threshold=0.6)
+
+    assert model.threshold == 0.6
+    assert model.model.n_estimators == 7
+    assert model.model.learning_rate == 0.3
+    assert clone(model).model.n_estimators == 7
+
+
+def test_engine_params():
+    model = Model(tree_method="hist", n_jobs=1)
+    params = model.get_params()
+    assert params["tree_method"] == "hist"
+    assert params["n_jobs"] == 1
+    assert params["model__n_estimators"] == 100
+
+    X = np.random.normal(size=(100, 10))
+    y = np.random.choice([0, 1], size=100)
+    model.fit(X, y)
+    assert model.model.get_params()["tree_method"] == "hist"
+    assert model.model.get_params()["n_jobs"] == 1
+
+
+def test_early_stopping():
+    model = Model(early_stopping_rounds=2, validation_fraction=0.2)
+    model.set_params(n_estimators=500)
+    X = np.random.normal(size=(200, 10))
+    y = np.random.choice([0, 1], size=200)
+
+    with patch.object(model.model, "fit", wraps=model.model.fit) as mock_fit:
+        model.fit(X, y)
+    ((X_val, y_val),) = mock_fit.call_args.kwargs["eval_set"]
+    assert len(y_val) == 40
+    assert len(mock_fit.call_args.args[1]) == 160
+    # Noise labels stop improving long before the cap
+    assert model.model.best_iteration < 499
+    assert len(model.predict(X)) == 200
+
+
+def test_sampler_after_holdout():
+    model = Model(
+        early_stopping_rounds=2,
+        validation_fraction=0.2,
+        sampler=RandomOverSampler(random_state=0),
+    )
+    X = np.arange(200, dtype=float).reshape(-1, 1)
+    y = (np.arange(200) % 4 == 0).astype(int)
+
+    with patch.object(model.model, "fit", wraps=model.model.fit) as mock_fit:
+        model.fit(X, y)
+    X_fit, y_fit = mock_fit.call_args.args
+    ((X_val, y_val),) = mock_fit.call_args.kwargs["eval_set"]
+    # The validation rows are held out of the rows before oversampling
+    assert len(y_val) == 40
+    assert y_val.sum() == 10
+    assert np.bincount(y_fit).tolist() == [120, 120]
+    assert not np.isin(X_val, X_fit).any()
+
+
+def test_unpickle_model_without_new_parameters():
+    model = Model()
+    state = model.__getstate__()
+    for name in PICKLED_DEFAULTS:
+        del state[name]
+    unpickled = Model.__new__(Model)
+    unpickled.__setstate__(state)
+    assert unpickled.calibration == "train"
+    assert unpickled.sampler is None
+
+    X = np.random.normal(size=(100, 10))
+    y = np.random.choice([0, 1], size=100)
+    unpickled.fit(X, y)
+    assert len(unpickled.predict(X)) == 100
+
+
 def test_classes_():
     model = Model()
     X = np.random.normal(size=(100, 10))
@@ -133,7 +228,9 @@ def test_predict_exception():
     model.fit(X, y)  # Fit the model first
 
     with patch.object(
-        model.model, "predict_proba", side_effect=Exception("Error predicting")
+        model.model.get_booster(),
+        "inplace_predict",
+        side_effect=Exception("Error predicting"),
     ):
         with pytest.raises(Exception) as e:
             model.predict(X)
@@ -166,3 +263,206 @@ def test_fit_single_threshold():
 
     assert model.fitted == True, "Model should be fitted."
     assert model.threshold == 0.5, "Threshold should remain 0.5 as it is not updated."
+
+
+def test_used_features():
+    model = Model()
+    X = np.random.normal(size=(100, 10))
+    y = (X[:, 3] > 0).astype(int)
+
+    with pytest.raises(NotFittedError):
+        model.used_features()
+
+    model.fit(X, y)
+    used_features = model.used_features()
+    assert 3 in used_features
+    assert used_features.tolist() == sorted(set(used_features.tolist()))
+    assert all(0 <= i < 10 for i in used_features)
+
+
+@pytest.mark.parametrize(
+    "y",
+    [
+        np.random.choice([0, 1], size=200),
+        np.ones(20, dtype=int),
+        np.zeros(20, dtype=int),
+    ],
+)
+def test_threshold_scores_match_sklearn(y):
+    y_proba_pos = np.round(np.random.uniform(size=len(y)), 2)
+    thresholds = np.arange(0, 1, 0.01)
+    recall, min_f1 = threshold_scores(y, y_proba_pos, thresholds)
+    for i, threshold in enumerate(thresholds):
+        y_pred = (y_proba_pos >= threshold).astype(int)
+        assert recall[i] == recall_score(y, y_pred, pos_label=1, zero_division=0)
+        assert min_f1[i] == min(f1_score(y, y_pred, average=None, zero_division=0))
+
+
+def test_validation_calibration():
+    model = Model(
+        calibration="validation",
+        validation_fraction=0.2,
+        sampler=RandomOverSampler(random_state=0),
+    )
+    X = np.random.normal(size=(100, 10))
+    y = (np.arange(100) % 4 == 0).astype(int)
+
+    with patch.object(
+        model.model, "predict_proba", wraps=model.model.predict_proba
+    ) as mock_predict_proba:
+        model.fit(X, y)
+    # Only the held-out rows are scored, before oversampling, and only once
+    mock_predict_proba.assert_called_once()
+    assert len(mock_predict_proba.call_args.args[0]) == 20
+    assert model.model.n_features_in_ == 10
+    assert model.fitted
+
+
+def test_validation_calibration_few_rows():
+    model = Model(calibration="validation", early_stopping_rounds=2)
+    X = np.random.normal(size=(12, 10))
+    y = np.array([0] * 11 + [1])
+
+    with patch.object(
+        model.model, "predict_proba", wraps=model.model.predict_proba
+    ) as mock_predict_proba:
+        model.fit(X, y)
+    # A single relevant row can't be stratified, all the rows are used instead
+    assert len(mock_predict_proba.call_args.args[0]) == 12
+    assert model.model.get_params()["early_stopping_rounds"] is None
+    assert model.fitted
+
+
+def test_train_calibration():
+    # The default calibration
+    model = Model()
+    X = np.random.normal(size=(100, 10))
+    y = np.random.choice([0, 1], size=100)
+
+    with patch.object(
+        model.model, "predict_proba", wraps=model.model.predict_proba
+    ) as mock_predict_proba:
+        model.fit(X, y)
+    assert len(mock_predict_proba.call_args.args[0]) == 100
+
+
+def test_calibrate():
+    model = Model(thresholds=[0.5])
+    X = np.random.normal(size=(100, 10))
+    y = (X[:, 0] > 0).astype(int)
+
+    with pytest.raises(NotFittedError):
+        model.calibrate(X, y)
+    model.fit(X, y)
+    model.set_params(thresholds=None, threshold=0.99)
+    assert model.calibrate(X, y) is model
+    assert model.threshold < 0.99
+
+
+def test_invalid_calibration():
+    with pytest.raises(ValueError) as e:
+        Model(calibration="test")
+    assert "Unknown calibration `test`!" in str(e.value)
+
+
+@pytest.mark.parametrize("backend", ["logistic", "sgd"])
+def test_linear_backend(backend):
+    model = Model(backend=backend)
+    assert model.get_params()["backend"] == backend
+    X = sparse.random(200, 10, density=0.5, format="csr", dtype=np.float32)
+    y = (X[:, 3].toarray().ravel() > 0.5).astype(int)
+    model.fit(X, y)
+
+    y_proba_pos = model.predict_proba(X)[:, 1]
+    expected = (y_proba_pos >= model.threshold).astype(int)
+    assert np.array_equal(model.predict(X), expected)
+    assert 3 in model.used_features()
+    assert clone(model).model.get_params() == model.model.get_params()
+
+
+def test_repr():
+    assert repr(Model(backend="logistic")).startswith("Model(")
+
+
+def test_invalid_backend():
+    with pytest.raises(ValueError) as e:
+        Model(backend="forest")
+    assert "Unknown backend `forest`!" in str(e.value)
+
+
+def test_warm_start_booster():
+    model = Model(early_stopping_rounds=2)
+    X = np.random.normal(size=(200, 10))
+    y = np.random.choice([0, 1], size=200)
+
+    with pytest.raises(NotFittedError):
+        model.warm_start_booster()
+
+    model.fit(X, y)
+    _, best_trees = model.iteration_range
+    booster = model.warm_start_booster()
+    assert booster.num_boosted_rounds() == best_trees
+    assert "best_iteration" not in booster.attributes()
+
+    warm = Model(thresholds=[model.threshold])
+    warm.set_params(n_estimators=3)
+    warm.fit(X, y, xgb_model=booster)
+    assert warm.model.get_booster().num_boosted_rounds() == best_trees + 3
+    assert warm.iteration_range == (0, best_trees + 3)
+
+
+def test_fit_batches(tmp_path):
+    X = np.random.normal(size=(300, 10)).astype(np.float32)
+    y = np.random.choice([0, 1], size=300)
+
+    def batches():
+        for start in range(0, 300, 100):
+            yield sparse.csr_matrix(X[start : start + 100]), y[start : start + 100]
+
+    model = Model(thresholds=[0.3, 0.5])
+    model.set_params(n_estimators=5)
+    model.fit_batches(batches, str(tmp_path / "cache"))
+    assert model.model.get_booster().num_boosted_rounds() == 5
+    assert model.model.get_params()["tree_method"] == "hist"
+    assert model.threshold in [0.3, 0.5]
+    assert list(model.classes_) == [0, 1]
+    assert model.predict_proba(X).shape == (300, 2)
+    assert np.array_equal(
+        model.predict(X), (model.predict_proba(X)[:, 1] >= model.threshold)
+    )
+
+
+def test_fit_batches_validation(tmp_path):
+    X = np.random.normal(size=(400, 10)).astype(np.float32)
+    y = np.random.choice([0, 1], size=400)
+
+    def batches(start: int, stop: int):
+        return lambda: (
+            (sparse.csr_matrix(X[i : i + 100]), y[i : i + 100])
+            for i in range(start, stop, 100)
+        )
+
+    model = Model(calibration="validation", early_stopping_rounds=2)
+    model.set_params(n_estimators=500)
+    with patch.object(Model, "_tune_threshold", autospec=True) as mock_tune_threshold:
+        model.fit_batches(batches(0, 300), str(tmp_path / "cache"), batches(300, 400))
+    # Noise labels stop improving on the validation batches long before the cap
+    assert model.model.best_iteration < 499
+    _, y_calibration, _ = mock_tune_threshold.call_args.args
+    assert np.array_equal(y_calibration, y[300:])
+
+
+def test_fit_batches_sampler(tmp_path):
+    model = Model(sampler=RandomOverSampler())
+    with pytest.raises(ValueError) as e:
+        model.fit_batches(lambda: [], str(tmp_path))
+    assert "Out-of-core training can't resample the rows" in str(e.value)
+
+
+def test_fit_batches_linear_model(tmp_path):
+    with pytest.raises(ValueError) as e:
+        Model(backend="logistic").fit_batches(lambda: [], str(tmp_path))
+    assert (
+        "Out-of-core training needs an XGBoost model, got `LogisticRegression`!"
+        in str(e.value)
+    )
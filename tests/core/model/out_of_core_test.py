@@ -0,0 +1,101 @@
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from email_discriminator.core.model import DataProcessor, Model, fit_out_of_core
+from email_discriminator.core.model.out_of_core import (
+    in_test_split,
+    in_validation_split,
+    predict_chunks,
+)
+
+WORDS = np.array(["alpha", "beta", "gamma", "delta", "epsilon", "zeta"])
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            "article": [" ".join(rng.choice(WORDS, size=5)) for _ in range(200)],
+            "section": rng.choice(["cat", "dog", "bird"], size=200),
+            "is_relevant": rng.choice([0, 1], size=200, p=[0.7, 0.3]),
+        }
+    )
+
+
+def test_in_test_split(df):
+    mask = in_test_split(df)
+    assert 0.1 < mask.mean() < 0.3
+    # Chunks are split the same way as the whole data
+    chunked = np.concatenate(
+        [in_test_split(df.iloc[i : i + 50]) for i in range(0, 200, 50)]
+    )
+    assert np.array_equal(mask, chunked)
+    assert not in_test_split(df, test_size=0).any()
+
+
+def test_fit_out_of_core(df, tmp_path):
+    def chunks():
+        return (df.iloc[i : i + 50] for i in range(0, 200, 50))
+
+    model = Model()
+    model.set_params(n_estimators=5)
+    pipeline, stages = fit_out_of_core(
+        DataProcessor(vectorizer="hashing", n_features=2**10),
+        model,
+        chunks,
+        str(tmp_path),
+    )
+    assert set(stages) == {"feature_fit", "model_fit"}
+    assert all(usage.peak_bytes > 0 for usage in stages.values())
+
+    n_positives = (df["is_relevant"] == 1).sum()
+    assert model.model.get_params()["scale_pos_weight"] == pytest.approx(
+        (200 - n_positives) / n_positives
+    )
+    assert model.model.get_booster().num_boosted_rounds() == 5
+    # The streamed processor transforms like one fitted on all the rows
+    expected = DataProcessor(vectorizer="hashing", n_features=2**10).fit(df)
+    assert np.allclose(
+        pipeline.named_steps["features"].transform(df).toarray(),
+        expected.transform(df).toarray(),
+    )
+
+    y, y_pred = predict_chunks(pipeline, chunks())
+    assert np.array_equal(y, df["is_relevant"])
+    assert np.array_equal(y_pred, pipeline.predict(df))
+
+
+def test_fit_out_of_core_validation(df, tmp_path):
+    model = Model(calibration="validation", early_stopping_rounds=2)
+    model.set_params(n_estimators=50)
+    with patch.object(Model, "_tune_threshold", autospec=True) as mock_tune_threshold:
+        pipeline, _ = fit_out_of_core(
+            DataProcessor(vectorizer="hashing", n_features=2**10),
+            model,
+            lambda: (df.iloc[i : i + 50] for i in range(0, 200, 50)),
+            str(tmp_path),
+        )
+    # The validation rows are held out of the features and the model fit
+    in_validation = in_validation_split(df, model.validation_fraction)
+    assert 0 < in_validation.sum() < 50
+    assert not (in_validation & in_test_split(df)).any()
+    assert (
+        pipeline.named_steps["features"].streamed_counts_["documents"]
+        == (~in_validation).sum()
+    )
+    _, y_calibration, _ = mock_tune_threshold.call_args.args
+    assert np.array_equal(y_calibration, df["is_relevant"][in_validation])
+
+
+def test_fit_out_of_core_tfidf(df, tmp_path):
+    with pytest.raises(ValueError):
+        fit_out_of_core(DataProcessor(), Model(), lambda: [df], str(tmp_path))
+
+
+def test_predict_chunks_empty():
+    y, y_pred = predict_chunks(None, [])
+    assert len(y) == len(y_pred) == 0
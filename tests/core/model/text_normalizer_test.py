@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+
+from email_discriminator.core.model import TextNormalizer
+
+
+def test_text_normalizer():
+    df = pd.DataFrame(
+        {
+            "article": [
+                "GITHUB’S COPILOT CHAT IS NOW AVAILABLE (1 MINUTE\r\nREAD)\r\n"
+                "[https://www.theverge.com/2023/7/20/copilot?utm_source=tldrai]\r\n\r\n"
+                "GitHub has announced\r\nits new feature. ",
+                "No link nor read time here.",
+                None,
+            ],
+            "section": ["a", "b", "c"],
+        }
+    )
+    normalized = TextNormalizer().transform(df)
+    assert normalized["article"].tolist() == [
+        "GITHUB’S COPILOT CHAT IS NOW AVAILABLE GitHub has announced its new feature.",
+        "No link nor read time here.",
+        "",
+    ]
+    assert normalized["read_minutes"].tolist() == [1, 0, 0]
+    assert normalized["link_domain"].tolist() == ["theverge.com", "", ""]
+    assert normalized["section"].tolist() == ["a", "b", "c"]
+    # The input is not modified
+    assert df["article"][1] == "No link nor read time here."
+    assert "read_minutes" not in df
+
+
+def test_text_normalizer_invalid_key():
+    with pytest.raises(ValueError) as e:
+        TextNormalizer(key="c").transform(pd.DataFrame({"a": ["x"]}))
+    assert "Column `c` not found! Available columns: a" in str(e.value)
@@ -0,0 +1,13 @@
+import pickle
+
+import numpy as np
+
+from email_discriminator.core.profiling import measure_artifact
+
+
+def test_measure_artifact():
+    data = np.ones(2**17)
+    stats = measure_artifact(data)
+    assert stats.size_bytes == len(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+    assert stats.size_mb >= 1
+    assert 0 <= stats.load_seconds < 1
@@ -0,0 +1,44 @@
+import sys
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from email_discriminator.core.profiling import track_peak_memory
+from email_discriminator.core.profiling.memory import peak_rss_bytes
+
+
+def test_track_peak_memory():
+    with track_peak_memory() as usage:
+        data = np.ones(2**20)
+        del data
+    assert usage.peak_bytes >= 8 * 2**20
+    assert usage.retained_bytes < 2**20
+    assert usage.peak_mb >= 8
+    assert not tracemalloc.is_tracing()
+
+
+def test_track_peak_memory_already_tracing():
+    tracemalloc.start()
+    try:
+        with track_peak_memory() as usage:
+            data = np.ones(2**20)
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+    assert usage.retained_bytes >= 8 * 2**20
+
+
+@pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="The RSS peak is read from /proc"
+)
+def test_track_peak_memory_rss():
+    data = np.ones(2**25)
+    earlier_peak = peak_rss_bytes()
+    del data
+    with track_peak_memory() as usage:
+        small = np.ones(2**20)
+        del small
+    # The earlier 256 MB peak is not counted
+    assert usage.peak_rss_bytes < earlier_peak - 128 * 2**20
+    assert usage.peak_rss_mb == usage.peak_rss_bytes / 2**20
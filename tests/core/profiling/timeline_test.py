@@ -0,0 +1,53 @@
+import time
+
+from email_discriminator.core.profiling import StageTimeline
+
+
+def test_critical_path():
+    timeline = StageTimeline()
+    timeline.record("fetch", 0, 1)
+    timeline.record("load model", 0, 3)
+    timeline.record("upload", 1, 2, depends_on=["fetch"])
+    timeline.record("delete", 2, 5, depends_on=["upload"])
+    timeline.record("predict", 3, 4, depends_on=["load model", "upload"])
+    # The run ended with the deletion, which didn't wait for the model
+    assert timeline.critical_path() == ["fetch", "upload", "delete"]
+
+    timeline.record("delete", 2, 2.5, depends_on=["upload"])
+    assert timeline.critical_path() == ["load model", "predict"]
+
+
+def test_critical_path_ignores_unknown_stages():
+    timeline = StageTimeline()
+    assert timeline.critical_path() == []
+    timeline.record("predict", 1, 2, depends_on=["missing"])
+    assert timeline.critical_path() == ["predict"]
+
+
+def test_stage():
+    timeline = StageTimeline()
+    with timeline.stage("sleep"):
+        time.sleep(0.01)
+    with timeline.stage("after", depends_on=["sleep"]):
+        pass
+    assert timeline.stages["sleep"].duration >= 0.01
+    assert timeline.stages["after"].start >= timeline.stages["sleep"].end
+    assert timeline.critical_path() == ["sleep", "after"]
+
+
+def test_to_table():
+    timeline = StageTimeline()
+    timeline.record("predict", 12, 13.5, depends_on=["load model"])
+    timeline.record("load model", 10, 12)
+    timeline.record("fetch", 10.5, 11)
+    table = timeline.to_table()
+    assert [row["Stage"] for row in table] == ["load model", "fetch", "predict"]
+    assert table[2] == {
+        "Stage": "predict",
+        "Start (s)": 2,
+        "End (s)": 3.5,
+        "Duration (s)": 1.5,
+        "Depends on": "load model",
+        "Critical path": True,
+    }
+    assert not table[1]["Critical path"]
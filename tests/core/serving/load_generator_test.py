@@ -0,0 +1,41 @@
+import pytest
+
+from email_discriminator.core.serving import LoadReport, ScoringServer, generate_load
+
+
+class LengthModel:
+    def predict(self, rows):
+        return rows["article"].str.len().to_numpy()
+
+
+def test_generate_load():
+    server = ScoringServer(("127.0.0.1", 0), LengthModel(), max_latency_ms=2)
+    server.start()
+    try:
+        articles = [{"article": "a" * i, "section": "cat"} for i in range(1, 6)]
+        report = generate_load(
+            server.url, articles, n_requests=50, concurrency=4, articles_per_request=2
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert report.requests == 50
+    assert report.errors == 0
+    assert report.throughput > 0
+    assert 0 < report.p50_ms <= report.p99_ms
+    assert server.batcher.n_rows == 100
+
+
+def test_generate_load_unreachable():
+    articles = [{"article": "a", "section": "cat"}]
+    report = generate_load("http://127.0.0.1:9", articles, n_requests=3, concurrency=2)
+    assert report.requests == report.errors == 3
+    assert report.p50_ms is None
+
+
+def test_load_report():
+    report = LoadReport([1.0, 2.0, 3.0, 4.0], errors=1, elapsed_s=2.0)
+    assert report.requests == 5
+    assert report.throughput == 2
+    assert report.p50_ms == 2.5
+    assert report.p99_ms == pytest.approx(3.97)
@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from email_discriminator.core.serving import MicroBatcher
+
+
+class LengthModel:
+    """
+    Predicts the length of each article, and records the size of each batch.
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.batch_sizes = []
+
+    def predict(self, rows):
+        self.batch_sizes.append(len(rows))
+        time.sleep(self.delay)
+        return rows["article"].str.len().to_numpy()
+
+
+def articles(*texts):
+    return pd.DataFrame({"article": list(texts), "section": "cat"})
+
+
+def test_coalesces_concurrent_requests():
+    model = LengthModel(delay=0.01)
+    results = {}
+    with MicroBatcher(model.predict, max_latency_ms=50) as batcher:
+
+        def request(i):
+            results[i] = batcher.predict(articles("a" * i, "b" * (i + 1))).tolist()
+
+        threads = [threading.Thread(target=request, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert results == {i: [i, i + 1] for i in range(20)}
+    assert sum(model.batch_sizes) == 40
+    assert len(model.batch_sizes) < 20
+    assert batcher.stats() == {
+        "batches": len(model.batch_sizes),
+        "rows": 40,
+        "mean_batch_size": 40 / len(model.batch_sizes),
+    }
+
+
+def test_full_batch_is_scored_without_waiting():
+    model = LengthModel()
+    with MicroBatcher(
+        model.predict, max_batch_size=4, max_latency_ms=10_000
+    ) as batcher:
+        start = time.perf_counter()
+        futures = [batcher.submit(articles("a" * i)) for i in range(1, 5)]
+        assert [future.result(timeout=5).tolist() for future in futures] == [
+            [1],
+            [2],
+            [3],
+            [4],
+        ]
+        assert time.perf_counter() - start < 5
+    assert model.batch_sizes == [4]
+
+
+def test_close_scores_queued_requests():
+    model = LengthModel()
+    batcher = MicroBatcher(model.predict, max_latency_ms=10_000).start()
+    future = batcher.submit(articles("abc"))
+    batcher.close()
+    assert future.result(timeout=0).tolist() == [3]
+
+
+def test_errors_reach_every_request():
+    def predict(rows):
+        raise ValueError("broken model")
+
+    with MicroBatcher(predict, max_latency_ms=20) as batcher:
+        futures = [batcher.submit(articles("a")) for _ in range(3)]
+        for future in futures:
+            with pytest.raises(ValueError, match="broken model"):
+                future.result(timeout=5)
+        assert batcher.stats()["batches"] == 0
+
+
+def test_submit_not_started():
+    with pytest.raises(RuntimeError):
+        MicroBatcher(LengthModel().predict).submit(articles("a"))
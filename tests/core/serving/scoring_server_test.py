@@ -0,0 +1,99 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from email_discriminator.core.serving import ScoringServer
+
+
+class LengthModel:
+    def predict(self, rows):
+        return rows["article"].str.len().to_numpy()
+
+
+class BrokenModel:
+    def predict(self, rows):
+        raise ValueError("broken model")
+
+
+@pytest.fixture
+def server():
+    server = ScoringServer(("127.0.0.1", 0), LengthModel(), model_version="3")
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(url, body=None):
+    data = None if body is None else json.dumps(body).encode()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data)) as r:
+            return r.status, json.load(r)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def test_predict(server):
+    articles = [
+        {"article": "abc", "section": "cat"},
+        {"article": "de", "section": "dog"},
+    ]
+    status, body = request(f"{server.url}/predict", {"articles": articles})
+    assert status == 200
+    assert body == {"predictions": [3, 2]}
+    assert request(f"{server.url}/predict", {"articles": []}) == (
+        200,
+        {"predictions": []},
+    )
+
+    status, body = request(f"{server.url}/health")
+    assert status == 200
+    assert body == {
+        "status": "ok",
+        "model_version": "3",
+        "batches": 1,
+        "rows": 2,
+        "mean_batch_size": 2,
+    }
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"rows": []},
+        {"articles": [{"article": "abc"}]},
+        {"articles": "abc"},
+    ],
+)
+def test_predict_invalid_request(server, body):
+    status, response = request(f"{server.url}/predict", body)
+    assert status == 400
+    assert "error" in response
+
+
+def test_unknown_path(server):
+    assert request(f"{server.url}/score", {"articles": []})[0] == 404
+    assert request(f"{server.url}/metrics")[0] == 404
+
+
+def test_predict_scoring_error():
+    server = ScoringServer(("127.0.0.1", 0), BrokenModel())
+    server.start()
+    try:
+        articles = [{"article": "abc", "section": "cat"}]
+        status, body = request(f"{server.url}/predict", {"articles": articles})
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert status == 500
+    assert body == {"error": "Scoring failed: broken model"}
+
+
+def test_url():
+    server = ScoringServer(("127.0.0.1", 0), LengthModel())
+    try:
+        assert server.url == f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.server_close()